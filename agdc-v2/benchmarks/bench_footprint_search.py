@@ -0,0 +1,135 @@
+# coding=utf-8
+"""
+Compare lat/lon range searches against footprint searches of a large index.
+
+Indexes synthetic, slightly skewed one-degree scenes scattered over Australia into a product
+``bench_footprint``, then times finding the scenes that intersect a diamond-shaped query polygon:
+
+* by lat/lon range, checking every result's extent in Python (the old behaviour)
+* by footprint, letting the index rule out scenes that only overlap the polygon's bounding box
+
+Only run this against a scratch database: it writes directly to the dataset table::
+
+    datacube -C scratch.conf system init
+    python benchmarks/bench_footprint_search.py -C scratch.conf --datasets 1000000
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import timeit
+
+from datacube.config import LocalConfig
+from datacube.index import index_connect
+from datacube.model import GeoPolygon, CRS, Range
+from datacube.utils import check_intersect
+
+PRODUCT = {
+    'name': 'bench_footprint',
+    'description': 'Synthetic scenes for benchmarking spatial searches',
+    'metadata_type': 'eo',
+    'metadata': {
+        'product_type': 'bench_footprint',
+        'platform': {'code': 'BENCH'},
+    },
+}
+
+INSERT_SQL = """
+insert into agdc.dataset (id, metadata_type_ref, dataset_type_ref, metadata, footprint)
+select id, %(metadata_type)s, %(product)s, doc, agdc.extent_footprint(doc)
+from (
+    select md5(random()::text || i::text)::uuid as id,
+           jsonb_build_object(
+               'product_type', 'bench_footprint',
+               'platform', jsonb_build_object('code', 'BENCH'),
+               'extent', jsonb_build_object(
+                   'center_dt', to_char(timestamp '2000-01-01' + (i %% 5000) * interval '1 day', 'YYYY-MM-DD'),
+                   'coord', jsonb_build_object(
+                       'ul', jsonb_build_object('lon', lon, 'lat', lat),
+                       'ur', jsonb_build_object('lon', lon + 1, 'lat', lat + 0.1),
+                       'lr', jsonb_build_object('lon', lon + 1.1, 'lat', lat - 1),
+                       'll', jsonb_build_object('lon', lon + 0.1, 'lat', lat - 1.1)
+                   )
+               ),
+               'grid_spatial', jsonb_build_object('projection', jsonb_build_object(
+                   'spatial_reference', 'EPSG:4326',
+                   'geo_ref_points', jsonb_build_object(
+                       'ul', jsonb_build_object('x', lon, 'y', lat),
+                       'ur', jsonb_build_object('x', lon + 1, 'y', lat + 0.1),
+                       'lr', jsonb_build_object('x', lon + 1.1, 'y', lat - 1),
+                       'll', jsonb_build_object('x', lon + 0.1, 'y', lat - 1.1)
+                   )
+               ))
+           ) as doc
+    from (
+        select i, 112 + random() * 40 as lon, -10 - random() * 33 as lat
+        from generate_series(1, %(count)s) as i
+    ) scenes
+) datasets
+"""
+
+
+def diamond(lon, lat, radius):
+    return GeoPolygon([(lon, lat + radius), (lon + radius, lat),
+                       (lon, lat - radius), (lon - radius, lat)], CRS('EPSG:4326'))
+
+
+def search_by_range(index, polygon):
+    bb = polygon.boundingbox
+    datasets = index.datasets.search_eager(product=PRODUCT['name'],
+                                           lat=Range(bb.bottom, bb.top),
+                                           lon=Range(bb.left, bb.right))
+    return [dataset for dataset in datasets if check_intersect(polygon, dataset.extent.to_crs(polygon.crs))]
+
+
+def search_by_footprint(index, polygon):
+    bb = polygon.boundingbox
+    datasets = index.datasets.search_eager(product=PRODUCT['name'],
+                                           lat=Range(bb.bottom, bb.top),
+                                           lon=Range(bb.left, bb.right),
+                                           geopolygon=polygon)
+    return [dataset for dataset in datasets if check_intersect(polygon, dataset.extent.to_crs(polygon.crs))]
+
+
+def populate(index, count):
+    product = index.products.add_document(PRODUCT)
+    # pylint: disable=protected-access
+    engine = index._db._engine
+    existing = engine.execute('select count(*) from agdc.dataset where dataset_type_ref = %s', product.id).scalar()
+    if existing < count:
+        print('Indexing %d datasets...' % (count - existing))
+        start = timeit.default_timer()
+        engine.execute(INSERT_SQL, metadata_type=product.metadata_type.id, product=product.id,
+                       count=count - existing)
+        engine.execute('analyze agdc.dataset')
+        print('  %.1fs' % (timeit.default_timer() - start))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-C', '--config', action='append', help='datacube config file(s) of a scratch database')
+    parser.add_argument('--datasets', type=int, default=1000000, help='number of datasets to index')
+    parser.add_argument('--radius', type=float, nargs='+', default=[0.5, 2, 5],
+                        help='query diamond radius (degrees)')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    config = LocalConfig.find(args.config) if args.config else LocalConfig.find()
+    index = index_connect(config, application_name='bench-footprint')
+    populate(index, args.datasets)
+
+    for radius in args.radius:
+        polygon = diamond(133, -26, radius)
+        expected = sorted(dataset.id for dataset in search_by_range(index, polygon))
+        assert sorted(dataset.id for dataset in search_by_footprint(index, polygon)) == expected
+
+        bb = polygon.boundingbox
+        candidates = index.datasets.count(product=PRODUCT['name'],
+                                          lat=Range(bb.bottom, bb.top), lon=Range(bb.left, bb.right))
+        print('radius %.1f: %d intersecting of %d in the bounding box' % (radius, len(expected), candidates))
+        for name, search in (('lat/lon range', search_by_range), ('footprint', search_by_footprint)):
+            best = min(timeit.repeat(lambda: search(index, polygon), number=1, repeat=args.repeat))
+            print('  %-14s %8.3fs' % (name, best))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# coding=utf-8
+"""
+Compare serial and thread-pooled source reads in :func:`datacube.storage.storage.fuse_sources`.
+
+Writes a stack of overlapping synthetic GeoTIFFs to a temporary directory and times fusing
+them into a single destination array with different ``fuse_threads`` settings::
+
+    python benchmarks/bench_fuse_sources.py --sources 8 --size 4000 --threads 1 2 4 8
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import shutil
+import tempfile
+import timeit
+from contextlib import contextmanager
+
+import numpy
+import rasterio
+from affine import Affine
+
+import datacube
+from datacube.model import CRS
+from datacube.storage.storage import fuse_sources
+
+CRS_STR = 'EPSG:3577'
+NODATA = -999
+
+
+class GeoTiffSource(object):
+    def __init__(self, filename, transform, crs, nodata):
+        self.filename = filename
+        self.transform = transform
+        self.crs = crs
+        self.nodata = nodata
+
+    @contextmanager
+    def open(self):
+        with rasterio.open(self.filename) as src:
+            yield rasterio.band(src, 1)
+
+
+def write_stack(folder, count, size):
+    affine = Affine.translation(1500000, -3900000) * Affine.scale(25, -25)
+    rng = numpy.random.RandomState(42)
+    sources = []
+    for index in range(count):
+        data = rng.randint(0, 10000, size=(size, size)).astype('int16')
+        # Blank out a varying band of each scene so that the scenes only partially overlap
+        offset = index * size // (2 * count)
+        data[:offset, :] = NODATA
+        filename = '%s/scene_%02d.tif' % (folder, index)
+        with rasterio.open(filename, 'w', driver='GTiff', width=size, height=size, count=1,
+                           dtype=data.dtype.name, crs=CRS_STR, transform=affine, nodata=NODATA,
+                           tiled=True, compress='deflate') as dst:
+            dst.write(data, 1)
+        sources.append(GeoTiffSource(filename, affine, CRS(CRS_STR), NODATA))
+    return sources, affine
+
+
+def run(sources, affine, size, threads):
+    destination = numpy.empty((size, size), dtype='int16')
+    with datacube.set_options(fuse_threads=threads):
+        fuse_sources(sources, destination, affine, CRS(CRS_STR), NODATA)
+    return destination
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sources', type=int, default=8, help='number of overlapping scenes')
+    parser.add_argument('--size', type=int, default=4000, help='scene width/height in pixels')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix='bench_fuse_sources_')
+    try:
+        sources, affine = write_stack(folder, args.sources, args.size)
+        expected = run(sources, affine, args.size, 1)
+
+        print('%d sources of %dx%d int16' % (args.sources, args.size, args.size))
+        for threads in args.threads:
+            assert (run(sources, affine, args.size, threads) == expected).all()
+            best = min(timeit.repeat(lambda: run(sources, affine, args.size, threads),
+                                     number=1, repeat=args.repeat))
+            print('fuse_threads=%-3d %8.3fs' % (threads, best))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
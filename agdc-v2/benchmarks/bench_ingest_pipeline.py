@@ -0,0 +1,153 @@
+# coding=utf-8
+"""
+Time each stage of ingestion, with and without a background writer.
+
+Writes one synthetic GeoTIFF scene per tile to a temporary directory, then ingests the tiles with
+:func:`datacube.scripts.ingest.ingest_tiles` at different ``--write-queue`` sizes, reporting the wall-clock time
+and the time spent reading, preparing, compressing/writing and waiting for the writer::
+
+    python benchmarks/bench_ingest_pipeline.py --tiles 8 --size 2000 --bands 6 --queue 0 1 2
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import datetime
+import shutil
+import tempfile
+import timeit
+import uuid
+
+import numpy
+import rasterio
+from affine import Affine
+
+from datacube.api.core import Datacube
+from datacube.api.query import query_group_by
+from datacube.index._api import _DEFAULT_METADATA_TYPES_PATH
+from datacube.index.postgres._fields import parse_fields
+from datacube.index.postgres.tables import DATASET
+from datacube.model import Dataset, DatasetType, MetadataType, GeoBox
+from datacube.scripts.ingest import morph_dataset_type, ingest_tiles
+from datacube.utils import read_documents
+
+CRS_STR = 'EPSG:3577'
+RESOLUTION = 25
+NODATA = -999
+STAGES = ('read', 'prepare', 'write', 'wait')
+
+
+def make_source_type(bands):
+    definition = next(doc for _, doc in read_documents(_DEFAULT_METADATA_TYPES_PATH) if doc['name'] == 'eo')
+    metadata_type = MetadataType(definition['name'], definition['dataset'],
+                                 parse_fields(definition['dataset']['search_fields'], 1, DATASET.c.metadata))
+    return DatasetType(metadata_type, {
+        'name': 'bench_scenes',
+        'metadata_type': 'eo',
+        'metadata': {'product_type': 'bench'},
+        'measurements': [{'name': 'band_%d' % band, 'dtype': 'int16', 'nodata': NODATA, 'units': '1'}
+                         for band in range(bands)],
+    })
+
+
+def make_config(location, size, bands):
+    tile_size = size * RESOLUTION
+    return {
+        'source_type': 'bench_scenes',
+        'output_type': 'bench_tiles',
+        'description': 'Synthetic tiles for benchmarking ingestion',
+        'filename': 'bench_ingest_pipeline.yaml',
+        'location': location,
+        'file_path_template': 'bench_{tile_index[0]}_{tile_index[1]}_{start_time}.nc',
+        'global_attributes': {'title': 'Ingestion benchmark'},
+        'storage': {
+            'driver': 'NetCDF CF',
+            'crs': CRS_STR,
+            'tile_size': {'x': tile_size, 'y': tile_size},
+            'resolution': {'x': RESOLUTION, 'y': -RESOLUTION},
+            'chunking': {'x': 200, 'y': 200, 'time': 1},
+            'dimension_order': ['time', 'y', 'x'],
+        },
+        'measurements': [{'name': 'band_%d' % band, 'src_varname': 'band_%d' % band, 'dtype': 'int16',
+                          'nodata': NODATA, 'resampling_method': 'nearest', 'zlib': True}
+                         for band in range(bands)],
+    }
+
+
+def make_tasks(folder, source_type, output_type, count, size):
+    """
+    One scene per tile, exactly covering it.
+    """
+    rng = numpy.random.RandomState(0)
+    grid_spec = output_type.grid_spec
+    group_by = query_group_by('time')
+    time = datetime.datetime(2000, 1, 1).isoformat()
+    tasks = []
+    for x in range(count):
+        geobox = GeoBox.from_grid_spec(grid_spec, (x, -40))
+        left, top = geobox.affine.c, geobox.affine.f
+        bottom, right = top - size * RESOLUTION, left + size * RESOLUTION
+        scene = '%s/scene_%d' % (folder, x)
+        bands = {}
+        for measurement in source_type.measurements:
+            # Smooth-ish data, so that it compresses like real imagery
+            data = numpy.cumsum(rng.randint(-5, 6, size=(size, size)), axis=1).astype('int16')
+            with rasterio.open('%s_%s.tif' % (scene, measurement), 'w', driver='GTiff', width=size, height=size,
+                               count=1, dtype='int16', crs=CRS_STR, nodata=NODATA, tiled=True,
+                               transform=Affine(RESOLUTION, 0, left, 0, -RESOLUTION, top)) as dst:
+                dst.write(data, 1)
+            bands[measurement] = {'path': '%s_%s.tif' % (scene, measurement), 'layer': 1}
+        doc = {
+            'id': str(uuid.uuid4()),
+            'extent': {'from_dt': time, 'to_dt': time, 'center_dt': time},
+            'format': {'name': 'GeoTiff'},
+            'grid_spatial': {'projection': {
+                'spatial_reference': CRS_STR,
+                'geo_ref_points': {
+                    'ul': {'x': left, 'y': top},
+                    'ur': {'x': right, 'y': top},
+                    'lr': {'x': right, 'y': bottom},
+                    'll': {'x': left, 'y': bottom},
+                }
+            }},
+            'image': {'bands': bands},
+            'lineage': {'source_datasets': {}},
+        }
+        dataset = Dataset(source_type, doc, 'file://%s/agdc-metadata.yaml' % folder)
+        sources = Datacube.product_sources([dataset], group_by.group_by_func, group_by.dimension, group_by.units)
+        tasks.append({'index': (x, -40, sources.time.values[0]), 'sources': sources, 'geobox': geobox})
+    return tasks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tiles', type=int, default=8)
+    parser.add_argument('--size', type=int, default=2000, help='tile width/height in pixels')
+    parser.add_argument('--bands', type=int, default=6)
+    parser.add_argument('--queue', type=int, nargs='+', default=[0, 1, 2], help='write queue sizes to compare')
+    parser.add_argument('--memory', type=int, default=1024, help='write memory ceiling (MB)')
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix='bench_ingest_pipeline_')
+    try:
+        source_type = make_source_type(args.bands)
+        output_type = morph_dataset_type(source_type, make_config(folder, args.size, args.bands))
+        tasks = make_tasks(folder, source_type, output_type, args.tiles, args.size)
+
+        print('%d tiles of %d %dx%d int16 bands' % (args.tiles, args.bands, args.size, args.size))
+        print('%-7s %8s  %s' % ('queue', 'total', '  '.join('%8s' % stage for stage in STAGES)))
+        for queue_size in args.queue:
+            config = make_config('%s/out_%d' % (folder, queue_size), args.size, args.bands)
+            timings = {}
+            start = timeit.default_timer()
+            outcomes = ingest_tiles(config, source_type, output_type, tasks, queue_size=queue_size,
+                                    max_bytes=args.memory * 1024 * 1024, timings=timings)
+            total = timeit.default_timer() - start
+            assert all(error is None for _, _, error in outcomes)
+            print('%-7d %7.2fs  %s' % (queue_size, total,
+                                      '  '.join('%7.2fs' % timings.get(stage, 0) for stage in STAGES)))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
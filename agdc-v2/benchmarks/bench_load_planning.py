@@ -0,0 +1,102 @@
+# coding=utf-8
+"""
+Time the planning stage of a large ``Datacube.load``, with no I/O.
+
+Builds synthetic UTM scenes of an 'eo' product and runs the steps ``load`` takes before reading any
+pixels: finding the output bounds, grouping the datasets by solar day, and computing each dataset's
+bounding box in the output CRS. Run it before and after a change to compare::
+
+    python benchmarks/bench_load_planning.py --datasets 50000
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import datetime
+import timeit
+import uuid
+
+import numpy
+
+from datacube.api.core import Datacube, get_bounds, _dataset_bounds
+from datacube.api.query import query_group_by
+from datacube.index._api import _DEFAULT_METADATA_TYPES_PATH
+from datacube.index.postgres._fields import parse_fields
+from datacube.index.postgres.tables import DATASET
+from datacube.model import Dataset, DatasetType, MetadataType, GeoBox, CRS
+from datacube.utils import read_documents
+
+OUTPUT_CRS = CRS('EPSG:3577')
+SCENE_SIZE = 185000.
+
+
+def make_product():
+    definition = next(doc for _, doc in read_documents(_DEFAULT_METADATA_TYPES_PATH) if doc['name'] == 'eo')
+    metadata_type = MetadataType(definition['name'], definition['dataset'],
+                                 parse_fields(definition['dataset']['search_fields'], 1, DATASET.c.metadata))
+    return DatasetType(metadata_type, {
+        'name': 'bench_scenes',
+        'metadata_type': 'eo',
+        'metadata': {'product_type': 'bench'},
+        'measurements': [{'name': 'red', 'dtype': 'int16', 'nodata': -999, 'units': '1'}],
+    })
+
+
+def make_datasets(product, count):
+    rng = numpy.random.RandomState(0)
+    start = datetime.datetime(2000, 1, 1)
+    datasets = []
+    for x, y, day in zip(rng.uniform(200000, 800000, count),
+                         rng.uniform(5800000, 7900000, count),
+                         rng.randint(0, 5000, count)):
+        time = (start + datetime.timedelta(days=int(day), hours=23, minutes=50)).isoformat()
+        doc = {
+            'id': str(uuid.uuid4()),
+            'extent': {'from_dt': time, 'to_dt': time, 'center_dt': time},
+            'format': {'name': 'GeoTiff'},
+            'grid_spatial': {'projection': {
+                'spatial_reference': 'EPSG:28355',
+                'geo_ref_points': {
+                    'ul': {'x': x, 'y': y + SCENE_SIZE},
+                    'ur': {'x': x + SCENE_SIZE, 'y': y + SCENE_SIZE},
+                    'lr': {'x': x + SCENE_SIZE, 'y': y},
+                    'll': {'x': x, 'y': y},
+                }
+            }},
+            'image': {'bands': {'red': {'path': 'red.tif', 'layer': 1}}},
+            'lineage': {'source_datasets': {}},
+        }
+        datasets.append(Dataset(product, doc, 'file:///tmp/bench/agdc-metadata.yaml'))
+    return datasets
+
+
+def plan(datasets):
+    geopolygon = get_bounds(datasets, OUTPUT_CRS)
+    geobox = GeoBox.from_geopolygon(geopolygon, (-25, 25), OUTPUT_CRS)
+    group_by = query_group_by('solar_day')
+    sources = Datacube.product_sources(datasets, group_by.group_by_func, group_by.dimension, group_by.units)
+    _dataset_bounds(sources.values, geobox.crs)
+    return sources
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--datasets', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    product = make_product()
+    print('%d datasets' % args.datasets)
+    for attempt in range(args.repeat):
+        # Fresh datasets each time, so nothing is cached from a previous round
+        datasets = make_datasets(product, args.datasets)
+        first = timeit.default_timer()
+        sources = plan(datasets)
+        second = timeit.default_timer()
+        plan(datasets)
+        end = timeit.default_timer()
+        print('round %d: %d groups, plan %.2fs, re-plan %.2fs' % (attempt, sources.size,
+                                                                  second - first, end - second))
+
+
+if __name__ == '__main__':
+    main()
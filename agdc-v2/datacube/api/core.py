@@ -3,7 +3,6 @@ from __future__ import absolute_import, division, print_function
 import logging
 from itertools import groupby
 from collections import namedtuple, OrderedDict
-from math import ceil
 
 import pandas
 import numpy
@@ -18,7 +17,7 @@ from ..compat import string_types
 from ..index import index_connect
 from ..model import GeoPolygon, GeoBox
 from ..storage.storage import DatasetSource, fuse_sources
-from ..utils import check_intersect, data_resolution_and_offset
+from ..utils import check_intersect, data_resolution_and_offset, densify_points
 from .query import Query, query_group_by, query_geopolygon
 from .query import query_geopolygon_like, query_resolution_like, query_crs_like
 
@@ -203,6 +202,9 @@ class Datacube(object):
         :param dict dask_chunks: If the data should be loaded as needed using :py:class:`dask.array.Array`,
             specify the chunk size in each output direction.
 
+            Use ``'auto'`` to match the chunking of the product's storage units, so that each task reads
+            whole on-disk chunks.
+
             See the documentation on using `xarray with dask <http://xarray.pydata.org/en/stable/dask.html>`_
             for more information.
 
@@ -222,7 +224,8 @@ class Datacube(object):
         :return: Requested data.  As a ``DataArray`` if the ``stack`` variable is supplied.
         :rtype: :class:`xarray.Dataset` or :class:`xarray.DataArray`
         """
-        observations = self.product_observations(product=product, like=like, **query)
+        # Only fetch the parts of the dataset documents needed for loading
+        observations = self._find_datasets(self.index.datasets.search_for_load, product=product, like=like, **query)
         if not observations:
             return None if stack else xarray.Dataset()
 
@@ -279,15 +282,27 @@ class Datacube(object):
 
         .. seealso:: :meth:`product_sources` :meth:`product_data`
         """
+        return self._find_datasets(self.index.datasets.search, **kwargs)
+
+    def _find_datasets(self, search, **kwargs):
+        """
+        :param search: index search method, eg. :meth:`datacube.index._datasets.DatasetResource.search`
+        :param kwargs: see :py:class:`datacube.api.query.Query`
+        :rtype: list[:class:`datacube.model.Dataset`]
+        """
         query = Query(self.index, **kwargs)
 
-        datasets = self.index.datasets.search_eager(**query.search_terms)
+        search_terms = query.search_terms
+        if query.geopolygon:
+            # The index narrows the search down by footprint, we do the exact check in the query CRS
+            search_terms['geopolygon'] = query.geopolygon
+        datasets = search(**search_terms)
         if query.geopolygon:
             datasets = [dataset for dataset in datasets
                         if check_intersect(query.geopolygon, dataset.extent.to_crs(query.geopolygon.crs))]
             # Check against the bounding box of the original scene, can throw away some portions
 
-        return datasets
+        return list(datasets)
 
     @staticmethod
     def product_sources(datasets, group_func, dimension, units):
@@ -365,7 +380,7 @@ class Datacube(object):
         :param measurements: list of measurement dicts with keys: {'name', 'dtype', 'nodata', 'units'}
         :param fuse_func: function to merge successive arrays as an output
         :param dict dask_chunks: If the data should be loaded as needed using :py:class:`dask.array.Array`,
-            specify the chunk size in each output direction.
+            specify the chunk size in each output direction, or ``'auto'`` to use the storage chunking.
 
             See the documentation on using `xarray with dask <http://xarray.pydata.org/en/stable/dask.html>`_
             for more information.
@@ -376,12 +391,16 @@ class Datacube(object):
         if dask_chunks is None:
             def data_func(measurement):
                 data = numpy.full(sources.shape + geobox.shape, measurement['nodata'], dtype=measurement['dtype'])
-                for index, datasets in numpy.ndenumerate(sources.values):
-                    _fuse_measurement(data[index], datasets, geobox, measurement, fuse_func)
+                for index, datasets in numpy.ndenumerate(_prune_sources(sources.values, bounds, geobox)):
+                    if datasets:
+                        _fuse_measurement(data[index], datasets, geobox, measurement, fuse_func)
                 return data
         else:
             def data_func(measurement):
-                return _make_dask_array(sources, geobox, measurement, fuse_func, dask_chunks)
+                return _make_dask_array(sources, geobox, measurement, fuse_func, dask_chunks, bounds=bounds)
+
+        # Computed once, and shared by all measurements
+        bounds = _dataset_bounds(sources.values, geobox.crs)
 
         return Datacube.create_storage(sources.coords, geobox, measurements, data_func)
 
@@ -470,10 +489,11 @@ def get_resolution(datasets):
 
 
 def get_bounds(datasets, crs):
-    left = min([d.extent.to_crs(crs).boundingbox.left for d in datasets])
-    right = max([d.extent.to_crs(crs).boundingbox.right for d in datasets])
-    top = max([d.extent.to_crs(crs).boundingbox.top for d in datasets])
-    bottom = min([d.extent.to_crs(crs).boundingbox.bottom for d in datasets])
+    bounds = [d.extent.to_crs(crs).boundingbox for d in datasets]
+    left = min(b.left for b in bounds)
+    right = max(b.right for b in bounds)
+    top = max(b.top for b in bounds)
+    bottom = min(b.bottom for b in bounds)
     return GeoPolygon.from_boundingbox(BoundingBox(left, bottom, right, top), crs)
 
 
@@ -505,17 +525,98 @@ def datatset_type_to_row(dt):
     return row
 
 
-def _chunk_geobox(geobox, chunk_size):
-    num_grid_chunks = [int(ceil(s/float(c))) for s, c in zip(geobox.shape, chunk_size)]
+def _chunk_offsets(chunks):
+    """
+    >>> _chunk_offsets((3, 4, 3))
+    [(0, 3), (3, 7), (7, 10)]
+    """
+    offsets = []
+    start = 0
+    for chunk in chunks:
+        offsets.append((start, start + chunk))
+        start += chunk
+    return offsets
+
+
+def _chunk_geobox(geobox, chunks):
+    """
+    :param chunks: chunk sizes along each dimension of the geobox, as a tuple of tuples
+    :return: dict of chunk index -> GeoBox
+    """
+    offsets = [_chunk_offsets(dim_chunks) for dim_chunks in chunks]
     geobox_subsets = {}
-    for grid_index in numpy.ndindex(*num_grid_chunks):
-        slices = [slice(min(d*c, stop), min((d+1)*c, stop))
-                  for d, c, stop in zip(grid_index, chunk_size, geobox.shape)]
+    for grid_index in numpy.ndindex(*[len(dim_chunks) for dim_chunks in chunks]):
+        slices = [slice(*dim_offsets[i]) for dim_offsets, i in zip(offsets, grid_index)]
         geobox_subsets[grid_index] = geobox[slices]
     return geobox_subsets
 
 
+def _aligned_chunks(size, chunk, first=None):
+    """
+    Split a dimension of length `size` into chunks of `chunk`, the first of which is `first` long
+
+    >>> _aligned_chunks(10, 4)
+    (4, 4, 2)
+    >>> _aligned_chunks(10, 4, first=1)
+    (1, 4, 4, 1)
+    >>> _aligned_chunks(3, 4, first=2)
+    (2, 1)
+    >>> _aligned_chunks(3, 4)
+    (3,)
+    """
+    chunks = []
+    remaining = size
+    step = first or chunk
+    while remaining > 0:
+        chunks.append(min(step, remaining))
+        remaining -= step
+        step = chunk
+    return tuple(chunks)
+
+
+def _storage_chunking(sources):
+    """
+    The chunking of the storage units of the products in `sources`, if they all share the same one.
+
+    :rtype: (dict, datacube.model.GridSpec)
+    """
+    dataset_types = {dataset.type for datasets in sources.values.ravel() for dataset in datasets}
+    chunkings = {tuple(sorted(((dataset_type.definition.get('storage') or {}).get('chunking') or {}).items()))
+                 for dataset_type in dataset_types}
+    if len(chunkings) != 1:
+        return {}, None
+    # Only line chunks up with the storage grid of a single product
+    grid_spec = dataset_types.pop().grid_spec if len(dataset_types) == 1 else None
+    return dict(chunkings.pop()), grid_spec
+
+
+def _storage_chunk_start(geobox, grid_spec, dim, chunk):
+    """
+    Length of the first chunk along `dim` of `geobox`, so that following chunk boundaries line up with
+    the chunk boundaries of storage units in `grid_spec`. None if they can't be lined up.
+    """
+    if grid_spec is None or grid_spec.crs != geobox.crs or grid_spec.resolution is None:
+        return None
+    axis = list(geobox.dimensions).index(dim)
+    res = (geobox.affine.e, geobox.affine.a)[axis]
+    origin = (geobox.affine.f, geobox.affine.c)[axis]
+    if abs(res - grid_spec.resolution[axis]) > 1e-9 * abs(res):
+        return None
+    # Chunks only repeat across tiles if they divide the tile evenly
+    if grid_spec.tile_size is not None and grid_spec.tile_resolution[axis] % chunk:
+        return None
+    pixel = origin / res
+    if abs(pixel - round(pixel)) > 0.01:
+        return None
+    return (-int(round(pixel))) % chunk or chunk
+
+
 def _calculate_chunk_sizes(sources, geobox, dask_chunks):
+    grid_spec = None
+    if dask_chunks == 'auto':
+        dask_chunks, grid_spec = _storage_chunking(sources)
+        dask_chunks = {dim: size for dim, size in dask_chunks.items() if dim in sources.dims + geobox.dimensions}
+
     valid_keys = sources.dims + geobox.dimensions
     bad_keys = set(dask_chunks) - set(valid_keys)
     if bad_keys:
@@ -527,35 +628,97 @@ def _calculate_chunk_sizes(sources, geobox, dask_chunks):
 
     chunks.update(dask_chunks)
 
-    irr_chunks = tuple(chunks[dim] for dim in sources.dims)
-    grid_chunks = tuple(chunks[dim] for dim in geobox.dimensions)
+    irr_chunks = tuple(_aligned_chunks(size, chunks[dim]) for dim, size in zip(sources.dims, sources.shape))
+    grid_chunks = tuple(_aligned_chunks(size, chunks[dim], _storage_chunk_start(geobox, grid_spec, dim, chunks[dim]))
+                        for dim, size in zip(geobox.dimensions, geobox.shape))
 
     return irr_chunks, grid_chunks
 
 
-def _make_dask_array(sources, geobox, measurement, fuse_func=None, dask_chunks=None):
+def _fuse_lazy_block(datasets_block, geobox, measurement, fuse_func=None):
+    """
+    Load a block of several groups (eg. consecutive time slices) in one task.
+
+    :param numpy.ndarray datasets_block: object array holding a tuple of datasets in each cell
+    """
+    data = numpy.full(datasets_block.shape + geobox.shape, measurement['nodata'], dtype=measurement['dtype'])
+    for index, datasets in numpy.ndenumerate(datasets_block):
+        if datasets:
+            _fuse_measurement(data[index], datasets, geobox, measurement, fuse_func)
+    return data
+
+
+def _nodata_block(shape, measurement):
+    return numpy.full(shape, measurement['nodata'], dtype=measurement['dtype'])
+
+
+def _dataset_bounds(datasets_array, crs):
+    """
+    Bounding boxes of dataset footprints in `crs`
+
+    :param numpy.ndarray datasets_array: object array holding a tuple of datasets in each cell
+    :rtype: dict[uuid.UUID, rasterio.coords.BoundingBox]
+    """
+    bounds = {}
+    for datasets in datasets_array.ravel():
+        for dataset in datasets:
+            if dataset.id not in bounds:
+                extent = dataset.extent
+                if extent.crs != crs:
+                    extent = GeoPolygon(densify_points(extent.points), extent.crs).to_crs(crs)
+                bounds[dataset.id] = extent.boundingbox
+    return bounds
+
+
+def _bounds_overlap(a, b):
+    return a.left < b.right and b.left < a.right and a.bottom < b.top and b.bottom < a.top
+
+
+def _prune_sources(datasets_array, bounds, geobox):
+    """
+    Drop the datasets that don't overlap `geobox`
+
+    :param numpy.ndarray datasets_array: object array holding a tuple of datasets in each cell
+    :param dict bounds: dataset bounding boxes in the geobox CRS, from :func:`_dataset_bounds`
+    :return: object array of the same shape, holding tuples of overlapping datasets
+    """
+    box = geobox.extent.boundingbox
+    pruned = numpy.empty(datasets_array.shape, dtype=object)
+    for index, datasets in numpy.ndenumerate(datasets_array):
+        pruned[index] = tuple(dataset for dataset in datasets if _bounds_overlap(bounds[dataset.id], box))
+    return pruned
+
+
+def _make_dask_array(sources, geobox, measurement, fuse_func=None, dask_chunks=None, bounds=None):
     dsk_name = 'datacube_' + measurement['name']
 
     irr_chunks, grid_chunks = _calculate_chunk_sizes(sources, geobox, dask_chunks)
-    sliced_irr_chunks = (1,) * sources.ndim
+    if bounds is None:
+        bounds = _dataset_bounds(sources.values, geobox.crs)
 
     dsk = {}
     geobox_subsets = _chunk_geobox(geobox, grid_chunks)
+    irr_offsets = [_chunk_offsets(dim_chunks) for dim_chunks in irr_chunks]
 
-    for irr_index, datasets in numpy.ndenumerate(sources.values):
+    # Each task loads a whole block of groups, so that slices read from the same storage unit chunk
+    # are read together and no rechunking layer is needed
+    for irr_index in numpy.ndindex(*[len(dim_chunks) for dim_chunks in irr_chunks]):
+        slices = tuple(slice(*dim_offsets[i]) for dim_offsets, i in zip(irr_offsets, irr_index))
+        datasets_block = sources.values[slices]
         for grid_index, subset_geobox in geobox_subsets.items():
-            dsk[(dsk_name,) + irr_index + grid_index] = (fuse_lazy,
-                                                         datasets, subset_geobox, measurement, fuse_func, sources.ndim)
+            pruned_block = _prune_sources(datasets_block, bounds, subset_geobox)
+            if any(pruned_block.ravel()):
+                task = (_fuse_lazy_block, pruned_block, subset_geobox, measurement, fuse_func)
+            else:
+                # Nothing overlaps this chunk: no need to open anything
+                task = (_nodata_block, pruned_block.shape + subset_geobox.shape, measurement)
+            dsk[(dsk_name,) + irr_index + grid_index] = task
 
-    data = da.Array(dsk, dsk_name,
-                    chunks=(sliced_irr_chunks + grid_chunks),
+    return da.Array(dsk, dsk_name,
+                    chunks=(irr_chunks + grid_chunks),
                     dtype=measurement['dtype'],
                     shape=(sources.shape + geobox.shape))
 
-    if irr_chunks != sliced_irr_chunks:
-        data = data.rechunk(chunks=(irr_chunks + grid_chunks))
-    return data
-
 
 def _stack_vars(data_dict, var_dim_name, stack_name=None):
     if not data_dict:
@@ -58,19 +58,22 @@ class GridWorkflow(object):
         if not query.product:
             raise RuntimeError('must specify a product')
 
-        observations = self.index.datasets.search_eager(**query.search_terms)
-        if not observations:
-            return {}
+        search_terms = query.search_terms
+        if query.geopolygon:
+            search_terms['geopolygon'] = query.geopolygon
+        # Stream the datasets: only the ones that land in a tile are kept
+        observations = self.index.datasets.search(**search_terms)
 
         tiles = {}
         if cell_index:
             tile_geopolygon = geobox.extent
             datasets = [dataset for dataset in observations
                         if check_intersect(tile_geopolygon, dataset.extent.to_crs(self.grid_spec.crs))]
-            tiles[cell_index] = {
-                'datasets': datasets,
-                'geobox': geobox
-            }
+            if datasets:
+                tiles[cell_index] = {
+                    'datasets': datasets,
+                    'geobox': geobox
+                }
         else:
             for dataset in observations:
                 dataset_extent = dataset.extent.to_crs(self.grid_spec.crs)
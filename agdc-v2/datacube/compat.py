@@ -31,6 +31,7 @@ if not PY2:
         return config
 
     from urllib.parse import urlparse as parse_url
+    import queue
 else:
     text_type = unicode
     string_types = (str, unicode)
@@ -52,6 +53,7 @@ else:
         return config
 
     from urlparse import urlparse as parse_url
+    import Queue as queue
 
 
 def with_metaclass(meta, *bases):
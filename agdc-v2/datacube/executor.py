@@ -136,6 +136,50 @@ def _get_concurrent_executor(workers):
     return MultiprocessingExecutor(ProcessPoolExecutor(workers if workers > 0 else None))
 
 
+def as_completed_bounded(executor, submit, items, max_tasks=None, max_memory=None, estimate=None):
+    """
+    Submit a task for each item, yielding the futures as they complete, while limiting the tasks in flight.
+
+    Items are only taken from `items` (which may be a generator) as tasks are admitted, so they never all
+    have to be in memory. A task is admitted while there are fewer than `max_tasks` in flight, and their
+    estimated memory use, plus its own, is within `max_memory`. A task is always admitted when none are in
+    flight, however large.
+
+    Each executor worker takes the next admitted task as soon as it is idle.
+
+    :param executor: as from :func:`get_executor`
+    :param submit: function submitting the task of an item to the executor, returning its future
+    :param items: iterable of items
+    :param int max_tasks: maximum number of tasks in flight, or None for no limit
+    :param int max_memory: memory budget (bytes) of the tasks in flight, or None for no limit
+    :param estimate: function estimating the memory (bytes) needed by the task of an item
+    :return: iterator of completed futures, to pass to ``executor.result()``
+    """
+    in_flight = []
+    used = [0]
+
+    def next_completed():
+        future, _ = executor.next_completed([future for future, _ in in_flight], None)
+        position = next(i for i, (in_flight_future, _) in enumerate(in_flight) if in_flight_future is future)
+        used[0] -= in_flight.pop(position)[1]
+        return future
+
+    def full(cost):
+        if max_tasks is not None and len(in_flight) >= max_tasks:
+            return True
+        return max_memory is not None and used[0] + cost > max_memory
+
+    for item in items:
+        cost = estimate(item) if (estimate is not None and max_memory is not None) else 0
+        while in_flight and full(cost):
+            yield next_completed()
+        in_flight.append((submit(item), cost))
+        used[0] += cost
+
+    while in_flight:
+        yield next_completed()
+
+
 def get_executor(scheduler, workers):
     if not workers:
         return SerialExecutor()
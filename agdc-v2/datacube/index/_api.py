@@ -4,7 +4,10 @@ Access methods for indexing datasets & products.
 """
 from __future__ import absolute_import
 
+import datetime
 import logging
+
+import numpy
 from pathlib import Path
 
 import datacube.utils
@@ -50,6 +53,7 @@ class Index(object):
     :ivar datacube.index._datasets.MetadataTypeResource metadata_types: store and retrieve \
     :class:`datacube.model.MetadataType`
     :ivar UserResource users: user management
+    :ivar IngestionLedgerResource ingestion: record of the tiles written by the ingester
 
     :type users: UserResource
     :type datasets: datacube.index._datasets.DatasetResource
@@ -66,6 +70,7 @@ class Index(object):
         self.metadata_types = MetadataTypeResource(db)
         self.products = DatasetTypeResource(db, self.metadata_types)
         self.datasets = DatasetResource(db, self.products)
+        self.ingestion = IngestionLedgerResource(db)
 
     def init_db(self, with_default_types=True, with_permissions=True):
         is_new = self._db.init(with_permissions=with_permissions)
@@ -126,3 +131,79 @@ class UserResource(object):
         :rtype: list[(str, str, str)]
         """
         return self._db.list_users()
+
+
+class IngestionLedgerResource(object):
+    """
+    Which tiles of each ingested product have been written, and from which source datasets, so that
+    ingestion can be planned from only the source datasets added since the last run.
+
+    Tiles are identified by their tile index and time, as in the keys of
+    :meth:`datacube.api.GridWorkflow.list_tiles`.
+    """
+
+    def __init__(self, db):
+        """
+        :type db: datacube.index.postgres._api.PostgresDb
+        """
+        self._db = db
+
+    def record(self, product, tiles):
+        """
+        Record that tiles of a product were written.
+
+        :param datacube.model.DatasetType product: the ingested product
+        :param tiles: (tile key, source dataset ids) of each tile written
+        :type tiles: list[((int, int, numpy.datetime64), list[uuid.UUID])]
+        """
+        self._db.insert_ingested_tiles([(product.id, int(tile_x), int(tile_y), _to_datetime(time), source_id)
+                                        for (tile_x, tile_y, time), source_ids in tiles
+                                        for source_id in source_ids])
+
+    def get_tiles(self, product, min_time, max_time):
+        """
+        The keys of the tiles of a product written within a time range (inclusive).
+
+        :param datacube.model.DatasetType product: the ingested product
+        :type min_time: numpy.datetime64
+        :type max_time: numpy.datetime64
+        :rtype: set[(int, int, numpy.datetime64)]
+        """
+        return set((tile_x, tile_y, numpy.datetime64(time, 'ns'))
+                   for tile_x, tile_y, time in self._db.get_ingested_tiles(product.id, _to_datetime(min_time),
+                                                                          _to_datetime(max_time)))
+
+    def get_mark(self, product):
+        """
+        When the last complete ingestion into a product was planned: only source datasets indexed since need
+        to be considered.
+
+        :param datacube.model.DatasetType product: the ingested product
+        :rtype: datetime.datetime or None
+        """
+        return self._db.get_ingestion_mark(product.id)
+
+    def set_mark(self, product, mark):
+        """
+        :param datacube.model.DatasetType product: the ingested product
+        :param datetime.datetime mark: as returned by :meth:`now`, when planning started
+        """
+        self._db.set_ingestion_mark(product.id, mark)
+
+    def now(self):
+        """
+        The current time, according to the index.
+
+        :rtype: datetime.datetime
+        """
+        return self._db.get_db_time()
+
+
+def _to_datetime(time):
+    """
+    Convert a (UTC) numpy time to a naive datetime
+
+    >>> _to_datetime(numpy.datetime64('2016-01-02T03:04:05.123456789', 'ns'))
+    datetime.datetime(2016, 1, 2, 3, 4, 5, 123456)
+    """
+    return numpy.datetime64(time, 'us').astype(datetime.datetime)
@@ -5,17 +5,189 @@ API for dataset indexing, access and search.
 from __future__ import absolute_import
 
 import logging
+import threading
+import time
+import uuid
+from collections import namedtuple, OrderedDict, defaultdict
 
-from cachetools import lru_cache
+from cachetools import LRUCache
 
 from datacube import compat
 from datacube.model import Dataset, DatasetType, MetadataType
+from datacube.options import OPTIONS
 from datacube.utils import InvalidDocException, check_doc_unchanged, jsonify_document
 from . import fields
 from .exceptions import DuplicateRecordError
 
 _LOG = logging.getLogger(__name__)
 
+#: The outcome of indexing one dataset with :meth:`DatasetResource.add_many`: ``status`` is one of
+#: ``'added'``, ``'existing'`` or ``'failed'``, and ``error`` is the exception of a failed dataset.
+IndexResult = namedtuple('IndexResult', ['dataset', 'status', 'error'])
+
+
+class _Catalogue(object):
+    """
+    All metadata types or products of an index, loaded together and cached.
+
+    The cache is reloaded when it's older than the ``catalogue_cache_ttl`` option, when it's invalidated (after
+    adding to the index), and when looking up an id or name that isn't in it, so that records added by other
+    processes are found without waiting for the cache to expire.
+
+    :param load: function returning every record, with ``id`` and ``name`` attributes
+    """
+
+    def __init__(self, load):
+        self._load = load
+        self._lock = threading.Lock()
+        self._by_id = None
+        self._by_name = None
+        self._loaded_at = None
+        self._derived = None
+
+    def all(self):
+        """
+        :rtype: list
+        """
+        return list(self._records()[0].values())
+
+    def get(self, id_):
+        return self._lookup(0, id_)
+
+    def get_by_name(self, name):
+        return self._lookup(1, name)
+
+    def derived(self, build):
+        """
+        A value built from all the records with `build(records)`, and rebuilt when they're reloaded.
+        """
+        by_id = self._records()[0]
+        with self._lock:
+            if self._derived is None or self._derived[0] is not by_id:
+                self._derived = by_id, build(list(by_id.values()))
+            return self._derived[1]
+
+    def invalidate(self):
+        with self._lock:
+            self._by_id = self._by_name = None
+
+    def _lookup(self, which, key):
+        record = self._records()[which].get(key)
+        if record is None:
+            self.invalidate()
+            record = self._records()[which].get(key)
+        return record
+
+    def _records(self):
+        with self._lock:
+            ttl = OPTIONS.get('catalogue_cache_ttl')
+            if self._by_id is None or (ttl is not None and time.time() - self._loaded_at >= ttl):
+                records = list(self._load())
+                self._by_id = OrderedDict((record.id, record) for record in records)
+                self._by_name = {record.name: record for record in records}
+                self._loaded_at = time.time()
+            return self._by_id, self._by_name
+
+
+class _ProductMatcher(object):
+    """
+    Finds the products matching the product-level terms of a search.
+
+    Each search term (eg. ``platform='LANDSAT_8'``) is evaluated against every product the first time it's
+    seen, and the products it matches are remembered. A search then narrows the candidate products down
+    with set intersections, without evaluating anything per product.
+
+    :param list[datacube.model.DatasetType] types: all products
+    """
+
+    def __init__(self, types, max_terms=4096):
+        self._types = OrderedDict((type_.id, type_) for type_ in types)
+        self._by_name = defaultdict(set)
+        self._by_metadata_type = defaultdict(set)
+        for type_ in types:
+            self._by_name[type_.name].add(type_.id)
+            self._by_metadata_type[type_.metadata_type.name].add(type_.id)
+        self._lock = threading.Lock()
+        #: (field name, value) -> (ids of matching products, ids of products where it can't be evaluated)
+        self._terms = LRUCache(maxsize=max_terms)
+
+    def search(self, query):
+        """
+        :param dict query:
+        :return: each matching product, with the terms that couldn't be evaluated against it
+        :rtype: __generator[(DatasetType, dict)]
+        """
+        query = query.copy()
+        candidates = set(self._types)
+        for key, ids_by_value in (('product', self._by_name), ('metadata_type', self._by_metadata_type)):
+            if key in query:
+                value = query.pop(key)
+                candidates &= ids_by_value.get(value, set()) if _is_hashable(value) else set()
+
+        unresolved = {}
+        for key, value in query.items():
+            if not candidates:
+                break
+            matched, unresolved[key] = self._term(key, value)
+            candidates &= matched | unresolved[key]
+
+        for id_, type_ in self._types.items():
+            if id_ in candidates:
+                yield type_, {key: value for key, value in query.items() if id_ in unresolved[key]}
+
+    def _term(self, key, value):
+        hashable = _hashable(value)
+        if hashable is None:
+            return self._evaluate_term(key, value)
+        # Keyed on the type too: a Range and a list of two values mean different things.
+        cache_key = (key, type(value), hashable)
+        with self._lock:
+            result = self._terms.get(cache_key)
+        if result is None:
+            result = self._evaluate_term(key, value)
+            with self._lock:
+                self._terms[cache_key] = result
+        return result
+
+    def _evaluate_term(self, key, value):
+        matched, unresolved = set(), set()
+        for id_, type_ in self._types.items():
+            try:
+                exprs = fields.to_expressions(type_.metadata_type.dataset_fields.get, **{key: value})
+            except RuntimeError:
+                # Not a field of this product
+                continue
+
+            try:
+                if all(expr.evaluate(type_.metadata_doc) for expr in exprs):
+                    matched.add(id_)
+            except (AttributeError, KeyError, ValueError):
+                # Not a product-level field: leave it for the dataset search
+                unresolved.add(id_)
+        return frozenset(matched), frozenset(unresolved)
+
+
+def _is_hashable(value):
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+def _hashable(value):
+    """
+    A hashable version of a search value, or None if there isn't one.
+
+    >>> _hashable(['LANDSAT_5', 'LANDSAT_7'])
+    ('LANDSAT_5', 'LANDSAT_7')
+    >>> _hashable({'a': 1}) is None
+    True
+    """
+    if isinstance(value, list):
+        value = tuple(value)
+    return value if _is_hashable(value) else None
+
 
 class MetadataTypeResource(object):
     def __init__(self, db):
@@ -23,6 +195,7 @@ class MetadataTypeResource(object):
         :type db: datacube.index.postgres._api.PostgresDb
         """
         self._db = db
+        self._catalogue = _Catalogue(lambda: self._make_many(self._db.get_all_metadata_types()))
 
     def add(self, definition, allow_table_lock=False):
         """
@@ -54,24 +227,28 @@ class MetadataTypeResource(object):
                 definition=definition,
                 concurrently=not allow_table_lock
             )
+            self._catalogue.invalidate()
         return self.get_by_name(name)
 
-    @lru_cache()
     def get(self, id_):
         """
         :rtype datacube.model.MetadataType
         """
-        return self._make(self._db.get_metadata_type(id_))
+        return self._catalogue.get(id_)
 
-    @lru_cache()
     def get_by_name(self, name):
         """
         :rtype datacube.model.MetadataType
         """
-        record = self._db.get_metadata_type_by_name(name)
-        if not record:
-            return None
-        return self._make(record)
+        return self._catalogue.get_by_name(name)
+
+    def get_all(self):
+        """
+        Retrieve all Metadata Types
+
+        :rtype: list[datacube.model.MetadataType]
+        """
+        return self._catalogue.all()
 
     def check_field_indexes(self, allow_table_lock=False, rebuild_all=False):
         """
@@ -114,6 +291,7 @@ class DatasetTypeResource(object):
         """
         self._db = db
         self.metadata_type_resource = metadata_type_resource
+        self._catalogue = _Catalogue(lambda: self._make_many(self._db.get_all_dataset_types()))
 
     def from_doc(self, definition):
         """
@@ -165,6 +343,7 @@ class DatasetTypeResource(object):
                 metadata_type_id=type_.metadata_type.id,
                 definition=type_.definition
             )
+            self._catalogue.invalidate()
         return self.get_by_name(type_.name)
 
     def add_document(self, definition):
@@ -177,7 +356,6 @@ class DatasetTypeResource(object):
         type_ = self.from_doc(definition)
         return self.add(type_)
 
-    @lru_cache()
     def get(self, id_):
         """
         Retrieve Product by id
@@ -185,9 +363,8 @@ class DatasetTypeResource(object):
         :param int id_: id of the Product
         :rtype datacube.model.DatasetType
         """
-        return self._make(self._db.get_dataset_type(id_))
+        return self._catalogue.get(id_)
 
-    @lru_cache()
     def get_by_name(self, name):
         """
         Retrieve Product by name
@@ -195,10 +372,7 @@ class DatasetTypeResource(object):
         :param str name: name of the Product
         :rtype datacube.model.DatasetType
         """
-        result = self._db.get_dataset_type_by_name(name)
-        if not result:
-            return None
-        return self._make(result)
+        return self._catalogue.get_by_name(name)
 
     def get_with_fields(self, field_names):
         """
@@ -232,36 +406,21 @@ class DatasetTypeResource(object):
         :param dict query:
         :rtype: __generator[(DatasetType, dict)]
         """
-        for type_ in self.get_all():
-            q = query.copy()
-            if q.pop('product', type_.name) != type_.name:
-                continue
-            if q.pop('metadata_type', type_.metadata_type.name) != type_.metadata_type.name:
-                continue
-
-            for key, value in list(q.items()):
-                try:
-                    exprs = fields.to_expressions(type_.metadata_type.dataset_fields.get, **{key: value})
-                except RuntimeError:
-                    break
-
-                try:
-                    if all(expr.evaluate(type_.metadata_doc) for expr in exprs):
-                        q.pop(key)
-                    else:
-                        break
-                except (AttributeError, KeyError, ValueError) as e:
-                    continue
-            else:
-                yield type_, q
+        if isinstance(query.get('product'), compat.string_types):
+            # Make sure a product added since the catalogue was cached is found
+            self.get_by_name(query['product'])
+        return self._catalogue.derived(_ProductMatcher).search(query)
 
     def get_all(self):
         """
         Retrieve all Products
 
+        Products are cached for up to the ``catalogue_cache_ttl`` option (seconds), or until one is added
+        through this index.
+
         :rtype: iter[datacube.model.DatasetType]
         """
-        return (self._make(record) for record in self._db.get_all_dataset_types())
+        return iter(self._catalogue.all())
 
     def _make_many(self, query_rows):
         return (self._make(c) for c in query_rows)
@@ -302,18 +461,49 @@ class DatasetResource(object):
         if not include_sources:
             return self._make(self._db.get_dataset(id_), full_info=True)
 
-        datasets = {result['id']: (self._make(result, full_info=True), result)
-                    for result in self._db.get_dataset_sources(id_)}
+        return self._make_lineage(self._db.get_dataset_sources([id_]))[_normalise_id(id_)]
+
+    def get_many(self, ids, include_sources=False):
+        """
+        Get many datasets by id, with a single query.
+
+        With `include_sources`, the provenance graphs of all the datasets are fetched together, and ancestors
+        shared by several datasets are the same objects.
+
+        :param list[uuid] ids: ids of the datasets to retrieve
+        :param bool include_sources: get the full provenance graphs?
+        :return: the datasets that were found, in the order of `ids`
+        :rtype: list[datacube.model.Dataset]
+        """
+        ids = [_normalise_id(id_) for id_ in ids]
+        if not ids:
+            return []
+        if include_sources:
+            datasets = self._make_lineage(self._db.get_dataset_sources(ids))
+        else:
+            datasets = {_normalise_id(result['id']): self._make(result, full_info=True)
+                        for result in self._db.get_datasets(ids)}
+        return [datasets[id_] for id_ in ids if id_ in datasets]
+
+    def _make_lineage(self, results):
+        """
+        Link up the results of a provenance query.
+
+        :return: each dataset, by id
+        :rtype: dict[str, datacube.model.Dataset]
+        """
+        datasets = {_normalise_id(result['id']): (self._make(result, full_info=True), result)
+                    for result in results}
         for dataset, result in datasets.values():
             dataset.metadata_doc['lineage']['source_datasets'] = {
-                classifier: datasets[str(source)][0].metadata_doc
+                classifier: datasets[_normalise_id(source)][0].metadata_doc
                 for source, classifier in zip(result['sources'], result['classes']) if source
                 }
             dataset.sources = {
-                classifier: datasets[str(source)][0]
+                classifier: datasets[_normalise_id(source)][0]
                 for source, classifier in zip(result['sources'], result['classes']) if source
                 }
-        return datasets[id_][0]
+        return {id_: dataset for id_, (dataset, _) in datasets.items()}
 
     def get_derived(self, id_):
         """
@@ -384,6 +574,103 @@ class DatasetResource(object):
 
         return dataset
 
+    def add_many(self, datasets, batch_size=1000, skip_sources=False):
+        """
+        Ensure many datasets are in the index, adding those not present.
+
+        Each batch is written in one transaction, with a single multi-row insert each for the datasets,
+        their source links and their locations. Datasets that were already indexed are checked against
+        the stored document, as with :meth:`add`: one that doesn't match, or whose sources don't, fails
+        without being written or given a new location. A dataset that doesn't match an earlier one of the
+        same id in the batch is added on its own with :meth:`add`, as is every dataset of a batch that
+        can't be written, so that a bad dataset doesn't fail the rest of its batch.
+
+        This is a generator: `datasets` is consumed one batch at a time, and nothing is written until
+        the results are iterated over.
+
+        :param datasets: datasets to add
+        :type datasets: collections.Iterable[datacube.model.Dataset]
+        :param int batch_size: number of datasets to write per transaction
+        :param bool skip_sources: don't attempt to index sources (use when sources are already indexed)
+        :return: the outcome for each dataset, in order, as each batch is committed
+        :rtype: collections.Iterator[IndexResult]
+        """
+        batch = []
+        for dataset in datasets:
+            batch.append(dataset)
+            if len(batch) >= batch_size:
+                for result in self._add_batch(batch, skip_sources):
+                    yield result
+                batch = []
+        if batch:
+            for result in self._add_batch(batch, skip_sources):
+                yield result
+
+    def _add_batch(self, datasets, skip_sources):
+        # The datasets and sources to write, and the ids in the tree of each dataset of the batch. A dataset
+        # that disagrees with an earlier one in the batch about a shared id is left out, and added on its own
+        # afterwards, so that it fails (or not) just as it would have with add().
+        to_insert = OrderedDict()
+        docs = {}
+        trees = {}
+        for position, dataset in enumerate(datasets):
+            tree = OrderedDict()
+            for item in ([dataset] if skip_sources else _with_sources(dataset)):
+                tree.setdefault(_normalise_id(item.id), item)
+            if any(_differs(to_insert[id_], docs[id_], item) for id_, item in tree.items() if id_ in to_insert):
+                continue
+            for id_, item in tree.items():
+                if id_ not in to_insert:
+                    to_insert[id_] = item
+                    docs[id_] = _doc_without_sources(item)
+            trees[position] = list(tree)
+
+        _LOG.info('Indexing %d datasets', len(to_insert))
+        try:
+            with self._db.begin() as transaction:
+                # Check documents that are already indexed first: like add(), a dataset that doesn't match
+                # (or has a source that doesn't) is not written, and gets no new location.
+                stored = _stored_docs(transaction, to_insert)
+                errors = _doc_errors(stored, docs)
+                wanted = _ids_of_valid_trees(trees, errors)
+
+                inserted = transaction.insert_datasets([(id_, to_insert[id_].type.id, docs[id_])
+                                                        for id_ in wanted if id_ not in stored])
+
+                # Datasets that were neither stored nor inserted were indexed concurrently, or are of a
+                # product that isn't in the index: roll back, and let add() sort them out.
+                missing = [id_ for id_ in wanted if id_ not in stored and id_ not in inserted]
+                if missing:
+                    raise ValueError('Datasets were not inserted: {}'.format(', '.join(missing)))
+
+                transaction.insert_dataset_sources([(classifier, id_, source.id)
+                                                    for id_ in wanted if id_ in inserted
+                                                    for classifier, source in to_insert[id_].sources.items()])
+                transaction.ensure_dataset_locations([(id_, to_insert[id_].local_uri)
+                                                      for id_ in wanted if to_insert[id_].local_uri])
+        except Exception:  # pylint: disable=broad-except
+            _LOG.exception('Failed to index a batch of %d datasets, retrying individually', len(to_insert))
+            inserted = None
+
+        for position, dataset in enumerate(datasets):
+            if inserted is None or position not in trees:
+                yield self._add_one(dataset, skip_sources)
+                continue
+            error = next((errors[id_] for id_ in trees[position] if id_ in errors), None)
+            if error is not None:
+                yield IndexResult(dataset, 'failed', error)
+            else:
+                yield IndexResult(dataset, 'added' if _normalise_id(dataset.id) in inserted else 'existing', None)
+
+    def _add_one(self, dataset, skip_sources):
+        try:
+            existed = self.has(dataset)
+            self.add(dataset, skip_sources=skip_sources)
+        except Exception as e:  # pylint: disable=broad-except
+            _LOG.error('Failed to index dataset %s: %s', dataset.id, e)
+            return IndexResult(dataset, 'failed', e)
+        return IndexResult(dataset, 'existing' if existed else 'added', None)
+
     def archive(self, ids):
         """
         Mark datasets as archived
@@ -460,6 +747,12 @@ class DatasetResource(object):
         """
         Perform a search, returning results as Dataset objects.
 
+        A ``geopolygon`` (:class:`datacube.model.GeoPolygon`) in the query limits the results to datasets
+        whose footprint intersects or comes near it.
+
+        Results are streamed from the database as they are consumed (see the ``search_fetch_size`` option
+        of :class:`datacube.set_options`), so large searches don't need to fit in memory.
+
         :param dict[str,str|float|datacube.model.Range] query:
         :rtype: __generator[datacube.model.Dataset]
         """
@@ -467,10 +760,33 @@ class DatasetResource(object):
             for dataset in self._make_many(datasets):
                 yield dataset
 
+    def search_for_load(self, **query):
+        """
+        Perform a search, returning lightweight Dataset objects with just enough of their documents to load them.
+
+        Only the id, measurements, grid spatial, format and time fields of each document are fetched from
+        the database (not eg. the lineage, which is often most of the document). The returned datasets
+        have no sources, and their ``metadata_doc`` only contains those fields: use :meth:`get` to fetch
+        the full dataset when lineage or other metadata is needed.
+
+        :param dict[str,str|float|datacube.model.Range] query:
+        :rtype: __generator[datacube.model.Dataset]
+        """
+        for query_exprs, dataset_type in self._get_product_queries(query):
+            offsets = _load_offsets(dataset_type.metadata_type)
+            sources_offset = dataset_type.metadata_type.dataset_offsets.get('sources')
+            for result in self._db.search_dataset_parts(query_exprs, offsets):
+                doc = _doc_from_parts(offsets, tuple(result)[3:])
+                if sources_offset:
+                    _set_doc_value(sources_offset, doc, {})
+                yield Dataset(dataset_type, doc, result['local_uri'])
+
     def search_by_product(self, **query):
         """
         Perform a search, returning datasets grouped by product type.
 
+        Each product's datasets are streamed from the database as they are consumed, like :meth:`search`.
+
         :param dict[str,str|float|datacube.model.Range] query:
         :rtype: __generator[(datacube.model.DatasetType,  __generator[datacube.model.Dataset])]]
         """
@@ -540,14 +856,19 @@ class DatasetResource(object):
         return types
 
     def _get_product_queries(self, query):
+        query = dict(query)
+        geopolygon = query.pop('geopolygon', None)
         for dataset_type, q in self.types.search_robust(**query):
             q['dataset_type_id'] = dataset_type.id
-            yield q, dataset_type
+            dataset_fields = dataset_type.metadata_type.dataset_fields
+            query_exprs = tuple(fields.to_expressions(dataset_fields.get, **q))
+            if geopolygon is not None:
+                query_exprs += (self._db.footprint_intersects(geopolygon),)
+            yield query_exprs, dataset_type
 
     def _do_search_by_product(self, query, return_fields=False, with_source_ids=False):
-        for q, dataset_type in self._get_product_queries(query):
+        for query_exprs, dataset_type in self._get_product_queries(query):
             dataset_fields = dataset_type.metadata_type.dataset_fields
-            query_exprs = tuple(fields.to_expressions(dataset_fields.get, **q))
             select_fields = None
             if return_fields:
                 select_fields = tuple(dataset_fields.values())
@@ -559,9 +880,7 @@ class DatasetResource(object):
                    ))
 
     def _do_count_by_product(self, query):
-        for q, dataset_type in self._get_product_queries(query):
-            dataset_fields = dataset_type.metadata_type.dataset_fields
-            query_exprs = tuple(fields.to_expressions(dataset_fields.get, **q))
+        for query_exprs, dataset_type in self._get_product_queries(query):
             count = self._db.count_datasets(query_exprs)
             if count > 0:
                 yield dataset_type, count
@@ -581,11 +900,10 @@ class DatasetResource(object):
                 raise ValueError('No products match search terms: %r' % query)
             if len(product_quries) > 1:
                 raise ValueError('Multiple products match single query search: %r' %
-                                 ([dt.name for q, dt in product_quries],))
+                                 ([dt.name for exprs, dt in product_quries],))
 
-        for q, dataset_type in product_quries:
+        for query_exprs, dataset_type in product_quries:
             dataset_fields = dataset_type.metadata_type.dataset_fields
-            query_exprs = tuple(fields.to_expressions(dataset_fields.get, **q))
             yield dataset_type, list(self._db.count_datasets_through_time(
                 start,
                 end,
@@ -613,3 +931,159 @@ class DatasetResource(object):
         :rtype: list[datacube.model.Dataset]
         """
         return list(self.search(**query))
+
+
+#: Dataset document offsets (of the metadata type) needed to load a dataset
+_LOAD_OFFSETS = ('id', 'measurements', 'grid_spatial', 'format')
+#: Search fields needed to load a dataset
+_LOAD_FIELDS = ('time',)
+
+
+def _load_offsets(metadata_type):
+    """
+    The document offsets needed to load datasets of a metadata type.
+
+    :type metadata_type: datacube.model.MetadataType
+    :rtype: list[list[str]]
+    """
+    offsets = [metadata_type.dataset_offsets[name] for name in _LOAD_OFFSETS
+               if name in metadata_type.dataset_offsets]
+    for name in _LOAD_FIELDS:
+        field = metadata_type.dataset_fields.get(name)
+        if field is None:
+            continue
+        for attr in ('offset', 'min_offset', 'max_offset'):
+            offset = getattr(field, attr, None)
+            if offset is None:
+                continue
+            offsets.extend(offset if isinstance(offset[0], list) else [offset])
+
+    unique = []
+    for offset in offsets:
+        if list(offset) not in unique:
+            unique.append(list(offset))
+    # Parents before their children, so that nested offsets land inside their parent's value.
+    return sorted(unique, key=len)
+
+
+def _set_doc_value(offset, document, value):
+    """
+    Set the value at an offset, creating any missing parent dicts.
+
+    >>> doc = {'a': {'b': 1}}
+    >>> _set_doc_value(['a', 'c', 'd'], doc, 2)
+    >>> doc == {'a': {'b': 1, 'c': {'d': 2}}}
+    True
+    """
+    for key in offset[:-1]:
+        document = document.setdefault(key, {})
+    document[offset[-1]] = value
+
+
+def _doc_from_parts(offsets, values):
+    """
+    Build a (partial) document from the values at each offset. Missing (None) values are left out.
+
+    >>> _doc_from_parts([['id'], ['extent', 'from_dt']], ['a-b-c', None])
+    {'id': 'a-b-c'}
+    >>> doc = _doc_from_parts([['grid'], ['grid', 'crs'], ['time']], [{'crs': 'EPSG:3577'}, 'EPSG:3577', 'x'])
+    >>> doc == {'grid': {'crs': 'EPSG:3577'}, 'time': 'x'}
+    True
+    """
+    doc = {}
+    for offset, value in zip(offsets, values):
+        if value is not None:
+            _set_doc_value(offset, doc, value)
+    return doc
+
+
+def _normalise_id(id_):
+    """
+    >>> _normalise_id('F7018D80-8807-11E5-AEAA-1040F381A756')
+    'f7018d80-8807-11e5-aeaa-1040f381a756'
+    """
+    return str(uuid.UUID(str(id_)))
+
+
+def _with_sources(dataset):
+    """
+    The dataset's sources (recursively), followed by the dataset itself.
+
+    :type dataset: datacube.model.Dataset
+    :rtype: collections.Iterator[datacube.model.Dataset]
+    """
+    for source in dataset.sources.values():
+        for item in _with_sources(source):
+            yield item
+    yield dataset
+
+
+def _stored_docs(db, ids):
+    """
+    The stored documents of those datasets that are already indexed.
+
+    :type db: datacube.index.postgres._api.PostgresDb
+    :rtype: dict[str, dict]
+    """
+    if not ids:
+        return {}
+    return {_normalise_id(record['id']): record['metadata'] for record in db.get_datasets(list(ids))}
+
+
+def _differs(dataset, doc, other):
+    """
+    Whether `other` has a different document to `dataset` (with document `doc`), which has the same id.
+    """
+    return other is not dataset and jsonify_document(_doc_without_sources(other)) != jsonify_document(doc)
+
+
+def _doc_errors(stored, docs):
+    """
+    The error for each stored document that doesn't match the one being added.
+
+    :type stored: dict[str, dict]
+    :type docs: dict[str, dict]
+    :rtype: dict[str, ValueError]
+    """
+    errors = {}
+    for id_, stored_doc in stored.items():
+        try:
+            check_doc_unchanged(stored_doc, jsonify_document(docs[id_]), 'Dataset {}'.format(id_))
+        except ValueError as e:
+            errors[id_] = e
+    return errors
+
+
+def _ids_of_valid_trees(trees, errors):
+    """
+    The ids in the trees (a dataset and its sources) that have no errors, in order.
+
+    >>> list(_ids_of_valid_trees({0: ['a', 'b'], 1: ['a', 'c'], 2: ['d']}, {'c': ValueError()}))
+    ['a', 'b', 'd']
+    """
+    ids = OrderedDict()
+    for position in sorted(trees):
+        if not any(id_ in errors for id_ in trees[position]):
+            ids.update((id_, None) for id_ in trees[position])
+    return list(ids)
+
+
+def _doc_without_sources(dataset):
+    """
+    The dataset's document with the embedded source documents left out, as they're indexed separately.
+
+    Only the dicts containing the sources are copied: the rest is shared with the original document.
+
+    :type dataset: datacube.model.Dataset
+    :rtype: dict
+    """
+    offset = dataset.metadata_type.dataset_offsets.get('sources')
+    if not offset:
+        return dataset.metadata_doc
+    doc = dict(dataset.metadata_doc)
+    parent = doc
+    for key in offset[:-1]:
+        parent[key] = dict(parent.get(key) or {})
+        parent = parent[key]
+    parent[offset[-1]] = {}
+    return doc
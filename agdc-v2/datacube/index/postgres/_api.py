@@ -27,28 +27,41 @@ from datacube.config import LocalConfig
 from datacube.index.exceptions import DuplicateRecordError
 from datacube.index.fields import OrExpression
 from datacube.model import Range
+from datacube.options import OPTIONS
 from datacube.utils import jsonify_document
 from datacube.compat import string_types
 from . import tables
-from ._fields import parse_fields, NativeField
+from ._fields import parse_fields, NativeField, FootprintField
 from .tables import DATASET, DATASET_SOURCE, METADATA_TYPE, DATASET_LOCATION, DATASET_TYPE
+from .tables import INGESTED_TILE, INGESTION_MARK
 
 _LIB_ID = 'agdc-' + str(datacube.__version__)
 
 DATASET_URI_FIELD = DATASET_LOCATION.c.uri_scheme + ':' + DATASET_LOCATION.c.uri_body
-_DATASET_SELECT_FIELDS = (
-    DATASET,
-    # The most recent file uri. We may want more advanced path selection in the future...
-    select([
-        DATASET_URI_FIELD,
-    ]).where(
-        and_(
-            DATASET_LOCATION.c.dataset_ref == DATASET.c.id,
-            DATASET_LOCATION.c.uri_scheme == 'file'
-        )
-    ).order_by(
-        DATASET_LOCATION.c.added.desc()
-    ).limit(1).label('local_uri')
+# The most recent file uri. We may want more advanced path selection in the future...
+_DATASET_LOCAL_URI = select([
+    DATASET_URI_FIELD,
+]).where(
+    and_(
+        DATASET_LOCATION.c.dataset_ref == DATASET.c.id,
+        DATASET_LOCATION.c.uri_scheme == 'file'
+    )
+).order_by(
+    DATASET_LOCATION.c.added.desc()
+).limit(1).label('local_uri')
+
+_DATASET_SELECT_FIELDS = tuple(
+    # The footprint is only used for searching
+    column for column in DATASET.columns if column is not DATASET.c.footprint
+) + (
+    _DATASET_LOCAL_URI,
+)
+
+_FOOTPRINT_FIELD = FootprintField(
+    'footprint',
+    'Lat/lon outline of the dataset',
+    None,
+    DATASET.c.footprint
 )
 
 PGCODE_UNIQUE_CONSTRAINT = '23505'
@@ -56,6 +69,79 @@ PGCODE_UNIQUE_CONSTRAINT = '23505'
 _LOG = logging.getLogger(__name__)
 
 
+# Multi-row inserts used for bulk indexing. They avoid "on conflict", which needs Postgres 9.5, and skip
+# rows that already exist with "not exists" instead. That doesn't guard against another writer inserting
+# the same rows concurrently: this still raises a unique constraint error.
+_INSERT_DATASETS_SQL = """
+insert into agdc.dataset (id, dataset_type_ref, metadata_type_ref, metadata, footprint)
+select batch.id, batch.dataset_type_ref, dataset_type.metadata_type_ref, batch.metadata,
+       agdc.extent_footprint(batch.metadata)
+from (values {rows}) as batch (id, dataset_type_ref, metadata)
+join agdc.dataset_type on dataset_type.id = batch.dataset_type_ref
+where not exists (select 1 from agdc.dataset where dataset.id = batch.id)
+returning id
+"""
+
+_INSERT_DATASET_SOURCES_SQL = """
+insert into agdc.dataset_source (dataset_ref, classifier, source_dataset_ref)
+select distinct batch.dataset_ref, batch.classifier, batch.source_dataset_ref
+from (values {rows}) as batch (dataset_ref, classifier, source_dataset_ref)
+where not exists (
+    select 1 from agdc.dataset_source existing
+    where existing.dataset_ref = batch.dataset_ref and existing.classifier = batch.classifier
+)
+"""
+
+_INSERT_DATASET_LOCATIONS_SQL = """
+insert into agdc.dataset_location (dataset_ref, uri_scheme, uri_body)
+select distinct batch.dataset_ref, batch.uri_scheme, batch.uri_body
+from (values {rows}) as batch (dataset_ref, uri_scheme, uri_body)
+where not exists (
+    select 1 from agdc.dataset_location existing
+    where existing.dataset_ref = batch.dataset_ref
+      and existing.uri_scheme = batch.uri_scheme
+      and existing.uri_body = batch.uri_body
+)
+"""
+
+_INSERT_INGESTED_TILES_SQL = """
+insert into agdc.ingested_tile (dataset_type_ref, tile_x, tile_y, time, source_dataset_ref)
+select distinct batch.dataset_type_ref, batch.tile_x, batch.tile_y, batch.time, batch.source_dataset_ref
+from (values {rows}) as batch (dataset_type_ref, tile_x, tile_y, time, source_dataset_ref)
+where not exists (
+    select 1 from agdc.ingested_tile existing
+    where existing.dataset_type_ref = batch.dataset_type_ref
+      and existing.time = batch.time
+      and existing.tile_x = batch.tile_x
+      and existing.tile_y = batch.tile_y
+      and existing.source_dataset_ref = batch.source_dataset_ref
+)
+"""
+
+_SET_INGESTION_MARK_SQL = """
+with updated as (
+    update agdc.ingestion_mark set mark = :mark, updated = now()
+    where dataset_type_ref = :dataset_type_ref
+    returning dataset_type_ref
+)
+insert into agdc.ingestion_mark (dataset_type_ref, mark)
+select :dataset_type_ref, :mark
+where not exists (select 1 from updated)
+"""
+
+
+def _values_sql(count, *columns):
+    """
+    Rows of a multi-row ``values`` list, with the bind parameters of each row numbered.
+
+    >>> print(_values_sql(2, ':a_{0}', 'CAST(:b_{0} AS uuid)'))
+    (:a_0, CAST(:b_0 AS uuid)),
+    (:a_1, CAST(:b_1 AS uuid))
+    """
+    row = '(' + ', '.join(columns) + ')'
+    return ',\n'.join(row.format(i) for i in range(count))
+
+
 def _split_uri(uri):
     """
     Split the scheme and the remainder of the URI.
@@ -198,11 +284,7 @@ class PostgresDb(object):
 
         :return: If it was newly created.
         """
-        is_new = tables.ensure_db(self._engine, with_permissions=with_permissions)
-        if not is_new:
-            tables.update_schema(self._engine)
-
-        return is_new
+        return tables.ensure_db(self._engine, with_permissions=with_permissions)
 
     def begin(self):
         """
@@ -230,9 +312,10 @@ class PostgresDb(object):
         """
         try:
             dataset_type_ref = bindparam('dataset_type_ref')
+            metadata = bindparam('metadata', type_=JSONB)
             ret = self._connection.execute(
                 DATASET.insert().from_select(
-                    ['id', 'dataset_type_ref', 'metadata_type_ref', 'metadata'],
+                    ['id', 'dataset_type_ref', 'metadata_type_ref', 'metadata', 'footprint'],
                     select([
                         bindparam('id'), dataset_type_ref,
                         select([
@@ -240,7 +323,8 @@ class PostgresDb(object):
                         ]).where(
                             DATASET_TYPE.c.id == dataset_type_ref
                         ).label('metadata_type_ref'),
-                        bindparam('metadata', type_=JSONB)
+                        metadata,
+                        func.agdc.extent_footprint(metadata)
                     ])
                 ),
                 id=dataset_id,
@@ -273,6 +357,53 @@ class PostgresDb(object):
                 raise DuplicateRecordError('Location already exists: %s' % uri)
             raise
 
+    def insert_ingested_tiles(self, tiles):
+        """
+        Record ingested tiles, skipping any already recorded.
+
+        :param tiles: (dataset_type_id, tile_x, tile_y, time, source_dataset_id) of each tile and source
+        :type tiles: list[(int, int, int, datetime.datetime, str or uuid.UUID)]
+        """
+        if not tiles:
+            return
+        params = {}
+        for i, (dataset_type_id, tile_x, tile_y, time, source_dataset_id) in enumerate(tiles):
+            params['type_%d' % i] = dataset_type_id
+            params['x_%d' % i] = tile_x
+            params['y_%d' % i] = tile_y
+            params['time_%d' % i] = time
+            params['source_%d' % i] = str(source_dataset_id)
+        rows = _values_sql(len(tiles), 'CAST(:type_{0} AS smallint)', ':x_{0}', ':y_{0}',
+                           'CAST(:time_{0} AS timestamp)', 'CAST(:source_{0} AS uuid)')
+        self._connection.execute(text(_INSERT_INGESTED_TILES_SQL.format(rows=rows)), **params)
+
+    def get_ingested_tiles(self, dataset_type_id, min_time, max_time):
+        """
+        The distinct (tile_x, tile_y, time) of the ingested tiles of a product within a time range (inclusive).
+        """
+        return self._connection.execute(
+            select([
+                INGESTED_TILE.c.tile_x, INGESTED_TILE.c.tile_y, INGESTED_TILE.c.time
+            ]).where(
+                and_(
+                    INGESTED_TILE.c.dataset_type_ref == dataset_type_id,
+                    INGESTED_TILE.c.time >= min_time,
+                    INGESTED_TILE.c.time <= max_time
+                )
+            ).distinct()
+        ).fetchall()
+
+    def get_ingestion_mark(self, dataset_type_id):
+        return self._connection.execute(
+            select([INGESTION_MARK.c.mark]).where(INGESTION_MARK.c.dataset_type_ref == dataset_type_id)
+        ).scalar()
+
+    def set_ingestion_mark(self, dataset_type_id, mark):
+        self._connection.execute(text(_SET_INGESTION_MARK_SQL), dataset_type_ref=dataset_type_id, mark=mark)
+
+    def get_db_time(self):
+        return self._connection.execute(select([func.now()])).scalar()
+
     def contains_dataset(self, dataset_id):
         return bool(self._connection.execute(select([DATASET.c.id]).where(DATASET.c.id == dataset_id)).fetchone())
 
@@ -289,6 +420,60 @@ class PostgresDb(object):
                 raise DuplicateRecordError('Source already exists')
             raise
 
+    def insert_datasets(self, datasets):
+        """
+        Insert many datasets with a single statement, skipping any that are already indexed.
+
+        :param datasets: (dataset_id, dataset_type_id, metadata_doc) of each dataset
+        :type datasets: list[(str or uuid.UUID, int, dict)]
+        :return: ids of the datasets that were inserted
+        :rtype: set[str]
+        """
+        if not datasets:
+            return set()
+        params = {}
+        for i, (dataset_id, dataset_type_id, metadata_doc) in enumerate(datasets):
+            params['id_%d' % i] = str(dataset_id)
+            params['type_%d' % i] = dataset_type_id
+            params['metadata_%d' % i] = _to_json(metadata_doc)
+        rows = _values_sql(len(datasets), 'CAST(:id_{0} AS uuid)', 'CAST(:type_{0} AS smallint)',
+                           'CAST(:metadata_{0} AS jsonb)')
+        result = self._connection.execute(text(_INSERT_DATASETS_SQL.format(rows=rows)), **params)
+        return set(str(row[0]) for row in result)
+
+    def insert_dataset_sources(self, sources):
+        """
+        Insert many source links with a single statement, skipping any that already exist.
+
+        :param sources: (classifier, dataset_id, source_dataset_id) of each link
+        :type sources: list[(str, str or uuid.UUID, str or uuid.UUID)]
+        """
+        if not sources:
+            return
+        params = {}
+        for i, (classifier, dataset_id, source_dataset_id) in enumerate(sources):
+            params['dataset_%d' % i] = str(dataset_id)
+            params['classifier_%d' % i] = classifier
+            params['source_%d' % i] = str(source_dataset_id)
+        rows = _values_sql(len(sources), 'CAST(:dataset_{0} AS uuid)', ':classifier_{0}', 'CAST(:source_{0} AS uuid)')
+        self._connection.execute(text(_INSERT_DATASET_SOURCES_SQL.format(rows=rows)), **params)
+
+    def ensure_dataset_locations(self, locations):
+        """
+        Add many locations with a single statement, skipping any that are already recorded.
+
+        :param locations: (dataset_id, uri) of each location
+        :type locations: list[(str or uuid.UUID, str)]
+        """
+        if not locations:
+            return
+        params = {}
+        for i, (dataset_id, uri) in enumerate(locations):
+            params['dataset_%d' % i] = str(dataset_id)
+            params['scheme_%d' % i], params['body_%d' % i] = _split_uri(uri)
+        rows = _values_sql(len(locations), 'CAST(:dataset_{0} AS uuid)', ':scheme_{0}', ':body_{0}')
+        self._connection.execute(text(_INSERT_DATASET_LOCATIONS_SQL.format(rows=rows)), **params)
+
     def archive_dataset(self, dataset_id):
         self._connection.execute(
             DATASET.update().where(
@@ -314,6 +499,16 @@ class PostgresDb(object):
             select(_DATASET_SELECT_FIELDS).where(DATASET.c.id == dataset_id)
         ).first()
 
+    def get_datasets(self, dataset_ids):
+        """
+        :type dataset_ids: list[str or uuid.UUID]
+        """
+        if not dataset_ids:
+            return []
+        return self._connection.execute(
+            select(_DATASET_SELECT_FIELDS).where(DATASET.c.id.in_([str(id_) for id_ in dataset_ids]))
+        ).fetchall()
+
     def get_derived_datasets(self, dataset_id):
         return self._connection.execute(
             select(
@@ -325,8 +520,15 @@ class PostgresDb(object):
             )
         ).fetchall()
 
-    def get_dataset_sources(self, dataset_id):
-        # recursively build the list of (dataset_ref, source_dataset_ref) pairs starting from dataset_id
+    def get_dataset_sources(self, dataset_ids):
+        """
+        The datasets and all their (recursive) sources, each with the ids and classifiers of its direct sources.
+
+        Ancestors shared by several of the datasets are only returned once.
+
+        :type dataset_ids: list[str or uuid.UUID]
+        """
+        # recursively build the list of (dataset_ref, source_dataset_ref) pairs starting from dataset_ids
         # include (dataset_ref, NULL) [hence the left join]
         sources = select(
             [DATASET.c.id.label('dataset_ref'),
@@ -337,10 +539,11 @@ class PostgresDb(object):
                          DATASET.c.id == DATASET_SOURCE.c.dataset_ref,
                          isouter=True)
         ).where(
-            DATASET.c.id == dataset_id
+            DATASET.c.id.in_([str(id_) for id_ in dataset_ids])
         ).cte(name="sources", recursive=True)
 
-        sources = sources.union_all(
+        # "union" rather than "union all", so that shared ancestors are only visited once
+        sources = sources.union(
             select(
                 [sources.c.source_dataset_ref.label('dataset_ref'),
                  DATASET_SOURCE.c.source_dataset_ref,
@@ -399,6 +602,12 @@ class PostgresDb(object):
                 None,
                 DATASET.c.metadata_type_ref
             ),
+            'added': NativeField(
+                'added',
+                'When the dataset was indexed',
+                None,
+                DATASET.c.added
+            ),
         }
         dataset_search_fields = metadata_type_result['definition']['dataset']['search_fields']
 
@@ -412,6 +621,21 @@ class PostgresDb(object):
         )
         return fields
 
+    @staticmethod
+    def footprint_intersects(geopolygon):
+        """
+        A search expression for datasets whose footprint intersects the given polygon.
+
+        The footprints are straight-edged lat/lon polygons, so the search polygon is densified and grown by
+        a margin before comparing them: it may include datasets that are near, or only touch, the polygon,
+        but never misses one that intersects it. Callers that need an exact answer should still check the
+        intersection in their own CRS.
+
+        :type geopolygon: datacube.model.GeoPolygon
+        :rtype: datacube.index.postgres._fields.PgExpression
+        """
+        return _FOOTPRINT_FIELD.intersects(geopolygon)
+
     def search_datasets_by_metadata(self, metadata):
         """
         Find any datasets that have the given metadata.
@@ -479,9 +703,60 @@ class PostgresDb(object):
         :rtype: dict
         """
         select_query = self.search_datasets_query(expressions, select_fields, with_source_ids)
-        results = self._connection.execute(select_query)
-        for result in results:
-            yield result
+        return self._stream(select_query)
+
+    def search_dataset_parts(self, expressions, offsets):
+        """
+        Search datasets, returning only the given parts of their metadata documents.
+
+        Each result has the dataset's ``id``, ``dataset_type_ref`` and ``local_uri``, followed by
+        the document value at each offset (None if it's missing).
+
+        :type expressions: tuple[datacube.index.postgres._fields.PgExpression]
+        :param list[list[str]] offsets: offsets within the metadata document, eg. ``[['image', 'bands']]``
+        :rtype: __generator[tuple]
+        """
+        select_columns = (DATASET.c.id, DATASET.c.dataset_type_ref, _DATASET_LOCAL_URI) + tuple(
+            DATASET.c.metadata[tuple(offset)].label('part_%d' % i) for i, offset in enumerate(offsets)
+        )
+        select_query = select(
+            select_columns
+        ).select_from(
+            self._from_expression(DATASET, expressions)
+        ).where(
+            and_(DATASET.c.archived == None, *self._alchemify_expressions(expressions))
+        )
+        return self._stream(select_query)
+
+    def _stream(self, query):
+        """
+        Iterate over the results of a query.
+
+        If the ``search_fetch_size`` option is set, rows are fetched from a server-side cursor that many
+        at a time, rather than loading the whole result set into memory first. The cursor's connection
+        (and a read-only transaction) is held until the results are exhausted or the generator is closed.
+        """
+        fetch_size = OPTIONS.get('search_fetch_size', 0)
+        if not fetch_size:
+            for result in self._connection.execute(query):
+                yield result
+            return
+
+        connection = self._engine.connect()
+        try:
+            # Server-side cursors only exist within a transaction.
+            connection.execute(text('BEGIN READ ONLY'))
+            try:
+                results = connection.execution_options(
+                    stream_results=True,
+                    max_row_buffer=fetch_size
+                ).execute(query)
+                for result in results:
+                    yield result
+            finally:
+                connection.execute(text('ROLLBACK'))
+        finally:
+            connection.close()
 
     def count_datasets(self, expressions):
         """
@@ -954,6 +1229,15 @@ class _PostgresDbInTransaction(PostgresDb):
         # Override parent so that we use the same connection in transaction
         return self.__connection
 
+    def _stream(self, query):
+        # Stay on the transaction's connection, so that uncommitted changes are visible.
+        connection = self._connection
+        fetch_size = OPTIONS.get('search_fetch_size', 0)
+        if fetch_size:
+            connection = connection.execution_options(stream_results=True, max_row_buffer=fetch_size)
+        for result in connection.execute(query):
+            yield result
+
     def begin(self):
         self._connection.execute(text('BEGIN'))
 
@@ -10,16 +10,20 @@ from functools import partial
 from dateutil import tz
 from psycopg2.extras import NumericRange, DateTimeTZRange
 from sqlalchemy import cast
-from sqlalchemy import func
+from sqlalchemy import func, and_, or_
 from sqlalchemy.dialects import postgresql as postgres
 from sqlalchemy.dialects.postgresql import INT4RANGE
 from sqlalchemy.dialects.postgresql import NUMRANGE, TSTZRANGE
 from sqlalchemy.dialects.postgresql.base import DOUBLE_PRECISION
 
 from datacube.index.fields import Expression, Field
-from datacube.index.postgres.tables import FLOAT8RANGE
-from datacube.model import Range
-from datacube.utils import get_doc_offset
+from datacube.index.postgres.tables import FLOAT8RANGE, POLYGON
+from datacube.model import Range, CRS, GeoPolygon
+from datacube.utils import get_doc_offset, densify_points, buffer_points
+
+#: Degrees added around a search polygon before comparing it to footprints. Footprints have straight
+#: lat/lon edges between the dataset corners, which the real, reprojected edges can bulge past.
+FOOTPRINT_SEARCH_MARGIN = 0.05
 
 
 class PgField(Field):
@@ -82,6 +86,28 @@ class NativeField(PgField):
         # Don't add extra indexes for native fields.
         return None
 
+    def between(self, low, high):
+        """
+        :rtype: Expression
+        """
+        return BetweenExpression(self, low, high)
+
+
+class FootprintField(NativeField):
+    """
+    The lat/lon outline of a dataset, searched by polygon intersection.
+    """
+
+    def intersects(self, geopolygon):
+        """
+        :type geopolygon: datacube.model.GeoPolygon
+        :rtype: Expression
+        """
+        # Densify before reprojecting, so curved edges in lat/lon aren't cut short, then grow the result
+        # so that the search can only ever select too many datasets: check_intersect() removes the extras.
+        lonlat = GeoPolygon(densify_points(geopolygon.points), geopolygon.crs).to_crs(CRS('EPSG:4326'))
+        return FootprintIntersectsExpression(self, buffer_points(lonlat.points, FOOTPRINT_SEARCH_MARGIN))
+
 
 class SimpleDocField(PgField):
     """
@@ -316,6 +342,27 @@ class RangeBetweenExpression(PgExpression):
         )
 
 
+class BetweenExpression(PgExpression):
+    """
+    A single value at least `low` and less than `high`. Either may be None, for an open-ended range.
+    """
+
+    def __init__(self, field, low_value, high_value):
+        super(BetweenExpression, self).__init__(field)
+        self.low_value = low_value
+        self.high_value = high_value
+
+    @property
+    def alchemy_expression(self):
+        expression = self.field.alchemy_expression
+        conditions = []
+        if self.low_value is not None:
+            conditions.append(expression >= self.low_value)
+        if self.high_value is not None:
+            conditions.append(expression < self.high_value)
+        return and_(*conditions)
+
+
 class EqualsExpression(PgExpression):
     def __init__(self, field, value):
         super(EqualsExpression, self).__init__(field)
@@ -329,6 +376,32 @@ class EqualsExpression(PgExpression):
         return self.field.evaluate(ctx) == self.value
 
 
+class FootprintIntersectsExpression(PgExpression):
+    """
+    Datasets whose footprint overlaps a lon/lat polygon.
+
+    Datasets without a footprint can't be ruled out, so they always match.
+    """
+
+    def __init__(self, field, points):
+        super(FootprintIntersectsExpression, self).__init__(field)
+        self.points = points
+
+    @property
+    def alchemy_expression(self):
+        column = self.field.alchemy_column
+        polygon = cast(_to_pg_polygon(self.points), POLYGON)
+        return or_(column.op('&&')(polygon), column.is_(None))
+
+
+def _to_pg_polygon(points):
+    """
+    >>> _to_pg_polygon([(1, 2), (3.5, 4), (5, -6)])
+    '((1.0,2.0),(3.5,4.0),(5.0,-6.0))'
+    """
+    return '(%s)' % ','.join('(%r,%r)' % (float(x), float(y)) for x, y in points)
+
+
 def parse_fields(doc, metadata_type_id, table_column):
     """
     Parse a field spec document into objects.
@@ -9,7 +9,7 @@ import logging
 from sqlalchemy import MetaData
 from sqlalchemy.schema import CreateSchema
 
-from ._sql import TYPES_INIT_SQL
+from ._sql import TYPES_INIT_SQL, FOOTPRINT_INIT_SQL
 
 USER_ROLES = ('agdc_user', 'agdc_ingest', 'agdc_manage', 'agdc_admin')
 
@@ -41,7 +41,7 @@ def _get_connection_info(connection):
 
 def ensure_db(engine, with_permissions=True):
     """
-    Initialise the db if needed.
+    Initialise the db if needed, or update the schema of an existing one.
     """
     is_new = False
     c = engine.connect()
@@ -70,6 +70,7 @@ def ensure_db(engine, with_permissions=True):
             c.execute(CreateSchema(SCHEMA_NAME))
             _LOG.info('Creating tables.')
             c.execute(TYPES_INIT_SQL)
+            c.execute(FOOTPRINT_INIT_SQL)
             METADATA.create_all(c)
             c.execute('commit')
         except:
@@ -80,6 +81,9 @@ def ensure_db(engine, with_permissions=True):
                 # psycopg doesn't have an equivalent to server-side quote_ident(). ?
                 quoted_user = db_user.replace('"', '""')
                 c.execute('set role "{}"'.format(quoted_user))
+    else:
+        # Before granting permissions, which may refer to newer tables and functions.
+        update_schema(engine)
 
     if with_permissions:
         _LOG.info('Adding role grants.')
@@ -87,10 +91,13 @@ def ensure_db(engine, with_permissions=True):
         grant usage on schema {schema} to agdc_user;
         grant select on all tables in schema {schema} to agdc_user;
         grant execute on function {schema}.common_timestamp(text) to agdc_user;
+        grant execute on function {schema}.extent_footprint(jsonb) to agdc_user;
 
         grant insert on {schema}.dataset,
                         {schema}.dataset_location,
-                        {schema}.dataset_source to agdc_ingest;
+                        {schema}.dataset_source,
+                        {schema}.ingested_tile to agdc_ingest;
+        grant insert, update on {schema}.ingestion_mark to agdc_ingest;
         grant usage, select on all sequences in schema {schema} to agdc_ingest;
 
         -- (We're only granting deletion of types that have nothing written yet: they can't delete the data itself)
@@ -113,6 +120,17 @@ def _pg_exists(conn, name):
     return conn.execute("SELECT to_regclass(%s)", name).scalar() is not None
 
 
+def _has_column(conn, table, column):
+    """
+    Does a table in our schema have the given column?
+    :rtype bool
+    """
+    return conn.execute(
+        "SELECT 1 FROM information_schema.columns WHERE table_schema = %s AND table_name = %s AND column_name = %s",
+        SCHEMA_NAME, table, column
+    ).scalar() is not None
+
+
 def database_exists(engine):
     """
     Have they init'd this database?
@@ -126,10 +144,12 @@ def schema_is_latest(engine):
     """
     is_unification = _pg_exists(engine, schema_qualified('dataset_type'))
     is_updated = not _pg_exists(engine, schema_qualified('uq_dataset_source_dataset_ref'))
+    has_footprints = _pg_exists(engine, schema_qualified('ix_dataset_footprint'))
+    has_ingestion_ledger = _pg_exists(engine, schema_qualified('ingestion_mark'))
 
     # We may have versioned schema in the future.
     # For now, we know updates ahve been applied if the dataset_type table exists,
-    return is_unification and is_updated
+    return is_unification and is_updated and has_footprints and has_ingestion_ledger
 
 
 def update_schema(engine):
@@ -153,6 +173,41 @@ def update_schema(engine):
     if not engine.execute("SELECT 1 FROM pg_type WHERE typname = 'float8range'").scalar():
         engine.execute(TYPES_INIT_SQL)
 
+    # Spatial index of dataset footprints.
+    if not _pg_exists(engine, schema_qualified('ix_dataset_footprint')):
+        _LOG.info('Applying dataset footprint update')
+        engine.execute(FOOTPRINT_INIT_SQL)
+        if not _has_column(engine, 'dataset', 'footprint'):
+            engine.execute("""
+            begin;
+              alter table agdc.dataset add column footprint polygon;
+              update agdc.dataset set footprint = agdc.extent_footprint(metadata);
+            commit;
+            """)
+        _LOG.info('Creating footprint indexes (may take a while)')
+        if not _pg_exists(engine, schema_qualified('ix_dataset_no_footprint')):
+            engine.execute("""
+            create index ix_dataset_no_footprint on agdc.dataset (dataset_type_ref)
+              where archived is null and footprint is null;
+            """)
+        engine.execute("""
+        create index ix_dataset_footprint on agdc.dataset using gist (footprint)
+          where archived is null;
+        """)
+        _LOG.info('Completed dataset footprint update')
+
+    # Record of ingested tiles, for incremental ingestion.
+    if not _pg_exists(engine, schema_qualified('ingestion_mark')):
+        _LOG.info('Applying ingestion ledger update')
+        from ._schema import INGESTED_TILE, INGESTION_MARK
+        METADATA.create_all(engine, tables=[INGESTED_TILE, INGESTION_MARK])
+        if not _pg_exists(engine, schema_qualified('ix_dataset_type_added')):
+            engine.execute("""
+            create index ix_dataset_type_added on agdc.dataset (dataset_type_ref, added)
+              where archived is null;
+            """)
+        _LOG.info('Completed ingestion ledger update')
+
 
 def _ensure_role(engine, name, inherits_from=None, add_user=False, create_db=False):
     if has_role(engine, name):
@@ -7,7 +7,7 @@ from __future__ import absolute_import
 import logging
 
 from sqlalchemy import ForeignKey, UniqueConstraint, PrimaryKeyConstraint, CheckConstraint, SmallInteger
-from sqlalchemy import Table, Column, Integer, String, DateTime, Boolean
+from sqlalchemy import Table, Column, Integer, String, DateTime, Boolean, Index
 from sqlalchemy.dialects import postgresql as postgres
 from sqlalchemy.sql import func
 
@@ -64,6 +64,10 @@ DATASET = Table(
 
     Column('metadata', postgres.JSONB, index=False, nullable=False),
 
+    # Lat/lon outline of the dataset, for spatial searches. (see _sql.FOOTPRINT_INIT_SQL)
+    # Null if the metadata has no corner coordinates.
+    Column('footprint', _sql.POLYGON, nullable=True),
+
     # Date it was archived. Null for active datasets.
     Column('archived', DateTime(timezone=True), default=None, nullable=True),
 
@@ -72,6 +76,16 @@ DATASET = Table(
     Column('added_by', _sql.PGNAME, server_default=func.current_user(), nullable=False),
 )
 
+# Spatial index of active datasets. Datasets without a footprint get their own (small) index, so that
+# "intersects or has no footprint" searches can still be answered from indexes.
+Index('ix_dataset_footprint', DATASET.c.footprint,
+      postgresql_using='gist', postgresql_where=DATASET.c.archived.is_(None))
+Index('ix_dataset_no_footprint', DATASET.c.dataset_type_ref,
+      postgresql_where=DATASET.c.archived.is_(None) & DATASET.c.footprint.is_(None))
+# Find the datasets of a product added since a given time (for incremental ingestion).
+Index('ix_dataset_type_added', DATASET.c.dataset_type_ref, DATASET.c.added,
+      postgresql_where=DATASET.c.archived.is_(None))
+
 DATASET_LOCATION = Table(
     'dataset_location', _core.METADATA,
     Column('id', Integer, primary_key=True, autoincrement=True),
@@ -108,3 +122,30 @@ DATASET_SOURCE = Table(
     PrimaryKeyConstraint('dataset_ref', 'classifier'),
     UniqueConstraint('source_dataset_ref', 'dataset_ref'),
 )
+
+# The tiles written by the ingester, and the source datasets each was made from.
+INGESTED_TILE = Table(
+    'ingested_tile', _core.METADATA,
+    # The output product
+    Column('dataset_type_ref', None, ForeignKey(DATASET_TYPE.c.id), nullable=False),
+    Column('tile_x', Integer, nullable=False),
+    Column('tile_y', Integer, nullable=False),
+    # (UTC)
+    Column('time', DateTime(timezone=False), nullable=False),
+    Column('source_dataset_ref', None, ForeignKey(DATASET.c.id), nullable=False),
+
+    Column('added', DateTime(timezone=True), server_default=func.now(), nullable=False),
+
+    PrimaryKeyConstraint('dataset_type_ref', 'time', 'tile_x', 'tile_y', 'source_dataset_ref'),
+)
+
+# How far ingestion into each product has been planned: source datasets added before the mark
+# have all been considered.
+INGESTION_MARK = Table(
+    'ingestion_mark', _core.METADATA,
+    # The output product
+    Column('dataset_type_ref', None, ForeignKey(DATASET_TYPE.c.id), primary_key=True, autoincrement=False),
+    Column('mark', DateTime(timezone=True), nullable=False),
+
+    Column('updated', DateTime(timezone=True), server_default=func.now(), nullable=False),
+)
@@ -40,6 +40,21 @@ create type {schema}.float8range as range (
 );
 """.format(schema=SCHEMA_NAME)
 
+# The lat/lon footprint of a dataset, from the corner coordinates of an 'eo'-style extent.
+# Null if any corner is missing.
+FOOTPRINT_INIT_SQL = """
+create or replace function {schema}.extent_footprint(jsonb)
+returns polygon as $$
+select (
+    '((' || ($1 #>> '{{extent,coord,ul,lon}}') || ',' || ($1 #>> '{{extent,coord,ul,lat}}') ||
+    '),(' || ($1 #>> '{{extent,coord,ur,lon}}') || ',' || ($1 #>> '{{extent,coord,ur,lat}}') ||
+    '),(' || ($1 #>> '{{extent,coord,lr,lon}}') || ',' || ($1 #>> '{{extent,coord,lr,lat}}') ||
+    '),(' || ($1 #>> '{{extent,coord,ll,lon}}') || ',' || ($1 #>> '{{extent,coord,ll,lat}}') ||
+    '))'
+)::polygon;
+$$ language sql immutable returns null on null input;
+""".format(schema=SCHEMA_NAME)
+
 
 # pylint: disable=abstract-method
 class FLOAT8RANGE(RangeOperators, sqltypes.TypeEngine):
@@ -51,6 +66,16 @@ def visit_float8range(element, compiler, **kw):
     return "FLOAT8RANGE"
 
 
+class POLYGON(sqltypes.TypeEngine):
+    """Postgres geometric 'POLYGON' type."""
+    __visit_name__ = 'POLYGON'
+
+
+@compiles(POLYGON)
+def visit_polygon(element, compiler, **kw):
+    return "POLYGON"
+
+
 # Register the function with SQLAlchemhy.
 # pylint: disable=too-many-ancestors
 class CommonTimestamp(GenericFunction):
@@ -70,6 +95,15 @@ class Float8Range(GenericFunction):
     name = '%s.float8range' % SCHEMA_NAME
 
 
+# pylint: disable=too-many-ancestors
+class ExtentFootprint(GenericFunction):
+    type = POLYGON
+    package = 'agdc'
+    identifier = 'extent_footprint'
+
+    name = '%s.extent_footprint' % SCHEMA_NAME
+
+
 class PGNAME(sqltypes.Text):
     """Postgres 'NAME' type."""
     __visit_name__ = 'NAME'
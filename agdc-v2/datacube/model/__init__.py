@@ -18,7 +18,7 @@ from rasterio.coords import BoundingBox
 
 from datacube import compat
 from datacube.compat import parse_url
-from datacube.utils import get_doc_offset, parse_time, read_documents, validate_document, cached_property
+from datacube.utils import get_doc_offset, parse_time, read_documents, validate_document
 
 _LOG = logging.getLogger(__name__)
 
@@ -70,10 +70,16 @@ class Dataset(object):
     """
     A Dataset stored on disk
 
+    The spatial and temporal properties derived from the document (:attr:`crs`, :attr:`extent`,
+    :attr:`time`...) are computed once and cached: replace :attr:`metadata_doc` rather than
+    modifying it in place if they need to change.
+
     :type type_: DatasetType
     :param dict metadata_doc: the document (typically a parsed json/yaml)
     :param str local_uri: A URI to access this dataset locally.
     """
+    __slots__ = ('type', '_metadata_doc', 'local_uri', 'sources', 'indexed_by', 'indexed_time',
+                 '_metadata', '_crs', '_extent', '_time', '_center_time')
 
     def __init__(self, type_, metadata_doc, local_uri, sources=None, indexed_by=None, indexed_time=None):
         #: :type: DatasetType
@@ -95,6 +101,34 @@ class Dataset(object):
         self.indexed_by = indexed_by
         self.indexed_time = indexed_time
 
+    @property
+    def metadata_doc(self):
+        """
+        :rtype: dict
+        """
+        return self._metadata_doc
+
+    @metadata_doc.setter
+    def metadata_doc(self, doc):
+        self._metadata_doc = doc
+        self._metadata = None
+        self._crs = None
+        self._extent = None
+        self._time = None
+        self._center_time = None
+
+    def __getstate__(self):
+        return (self.type, self.metadata_doc, self.local_uri, self.sources, self.indexed_by, self.indexed_time)
+
+    def __setstate__(self, state):
+        type_, metadata_doc, local_uri, sources, indexed_by, indexed_time = state
+        self.type = type_
+        self.metadata_doc = metadata_doc
+        self.local_uri = local_uri
+        self.sources = sources
+        self.indexed_by = indexed_by
+        self.indexed_time = indexed_time
+
     @property
     def metadata_type(self):
         return self.type.metadata_type if self.type else None
@@ -128,18 +162,22 @@ class Dataset(object):
             return {}
         return self.metadata.measurements
 
-    @cached_property
+    @property
     def center_time(self):
         """
         :rtype: datetime.datetime
         """
-        time = self.time
-        return time.begin + (time.end - time.begin) // 2
+        if self._center_time is None:
+            time = self.time
+            self._center_time = time.begin + (time.end - time.begin) // 2
+        return self._center_time
 
     @property
     def time(self):
-        time = self.metadata.time
-        return Range(parse_time(time.begin), parse_time(time.end))
+        if self._time is None:
+            time = self.metadata.time
+            self._time = Range(parse_time(time.begin), parse_time(time.end))
+        return self._time
 
     @property
     def bounds(self):
@@ -150,6 +188,11 @@ class Dataset(object):
         """
         :rtype: datacube.model.CRS
         """
+        if self._crs is None:
+            self._crs = self._read_crs()
+        return self._crs
+
+    def _read_crs(self):
         projection = self.metadata.grid_spatial
 
         crs = projection.get('spatial_reference', None)
@@ -170,6 +213,14 @@ class Dataset(object):
 
     @property
     def extent(self):
+        """
+        :rtype: GeoPolygon
+        """
+        if self._extent is None:
+            self._extent = self._read_extent()
+        return self._extent
+
+    def _read_extent(self):
         def xytuple(obj):
             return obj['x'], obj['y']
 
@@ -192,7 +243,9 @@ class Dataset(object):
 
     @property
     def metadata(self):
-        return self.metadata_type.dataset_reader(self.metadata_doc)
+        if self._metadata is None:
+            self._metadata = self.metadata_type.dataset_reader(self.metadata_doc)
+        return self._metadata
 
 
 def schema_validated(schema):
@@ -347,14 +400,34 @@ class GeoPolygon(object):
     """
     Polygon with a :py:class:`CRS`
 
+    Treated as immutable: its bounding box and reprojections are computed once and cached.
+
     :param points: list of (x,y) points
     :param CRS crs: coordinate system for the polygon
     """
+    __slots__ = ('_points', 'crs', '_boundingbox', '_reprojected')
 
     def __init__(self, points, crs=None):
         self.points = points
         self.crs = crs
 
+    def __getstate__(self):
+        return self.points, self.crs
+
+    def __setstate__(self, state):
+        self.points, self.crs = state
+
+    @property
+    def points(self):
+        return self._points
+
+    @points.setter
+    def points(self, points):
+        self._points = points
+        self._boundingbox = None
+        #: :type: dict[str, GeoPolygon]
+        self._reprojected = {}
+
     @classmethod
     def from_boundingbox(cls, boundingbox, crs=None):
         points = [
@@ -367,24 +440,38 @@ class GeoPolygon(object):
 
     @property
     def boundingbox(self):
-        return BoundingBox(left=min(x for x, y in self.points),
-                           bottom=min(y for x, y in self.points),
-                           right=max(x for x, y in self.points),
-                           top=max(y for x, y in self.points))
+        if self._boundingbox is None:
+            xs = [x for x, y in self.points]
+            ys = [y for x, y in self.points]
+            self._boundingbox = BoundingBox(left=min(xs), bottom=min(ys), right=max(xs), top=max(ys))
+        return self._boundingbox
 
     def to_crs(self, crs):
         """
         Duplicates polygon while transforming to a new CRS
 
+        The result is remembered, so transforming to the same CRS again is free.
+
         :param CRS crs: Target CRS
         :return: new GeoPolygon with CRS specified by crs
         :rtype: GeoPolygon
         """
-        if self.crs == crs:
+        if isinstance(crs, compat.string_types):
+            crs = CRS(crs)
+        if self.crs.crs_str == crs.crs_str:
             return self
 
-        transform = osr.CoordinateTransformation(self.crs._crs, crs._crs)  # pylint: disable=protected-access
-        return GeoPolygon([p[:2] for p in transform.TransformPoints(self.points)], crs)
+        reprojected = self._reprojected.get(crs.crs_str)
+        if reprojected is not None:
+            return reprojected
+
+        if self.crs == crs:
+            reprojected = self
+        else:
+            transform = osr.CoordinateTransformation(self.crs._crs, crs._crs)  # pylint: disable=protected-access
+            reprojected = GeoPolygon([p[:2] for p in transform.TransformPoints(self.points)], crs)
+        self._reprojected[crs.crs_str] = reprojected
+        return reprojected
 
     def __str__(self):
         return "GeoPolygon(points=%s, crs=%s)" % (self.points, self.crs)
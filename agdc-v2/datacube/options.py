@@ -1,12 +1,24 @@
-OPTIONS = {'reproject_threads': 4}
+OPTIONS = {'reproject_threads': 4, 'fuse_threads': 1, 'file_cache_size': 64,
+           'native_netcdf': True, 'search_fetch_size': 1000, 'catalogue_cache_ttl': 60,
+           'write_block_size': 64 * 1024 * 1024}
 
 
 #: pylint: disable=invalid-name
 class set_options(object):
     """Set global state within a controlled context
 
-    Currently, the only supported options are:
+    Currently, the supported options are:
     * reproject_threads: The number of threads to use when reprojecting
+    * fuse_threads: The number of threads used to read/reproject the sources of a single group
+      before fusing them. The default of 1 reads the sources serially.
+    * file_cache_size: The maximum number of idle source files kept open between reads. 0 disables the cache.
+    * native_netcdf: Read ingested (datacube-managed) NetCDF storage units directly with netCDF4, rather than GDAL
+    * search_fetch_size: Stream dataset search results from the database this many rows at a time.
+      0 loads the whole result set before returning the first dataset.
+    * catalogue_cache_ttl: Reload the cached products and metadata types of an index after this many seconds,
+      to see those added by other processes. None never reloads them; 0 disables the cache.
+    * write_block_size: The (approximate) maximum number of bytes of a variable computed and written at a time
+      when writing NetCDF storage units. Blocks are aligned to the variable's chunks.
 
     You can use ``set_options`` either as a context manager::
 
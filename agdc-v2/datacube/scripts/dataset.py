@@ -1,18 +1,22 @@
-from __future__ import absolute_import
+from __future__ import absolute_import, division
 
 import sys
 import logging
+import multiprocessing
+import threading
+import time
 import click
 import yaml
 
 from pathlib import Path
 
+from datacube import compat
 from datacube.compat import string_types
 from datacube.ui import click as ui
 from datacube.utils import read_documents
 from datacube.ui.common import get_metadata_path
 from datacube.ui.click import cli
-from datacube.model import Dataset
+from datacube.model import Dataset, DatasetType, MetadataType
 
 _LOG = logging.getLogger('datacube-dataset')
 
@@ -122,10 +126,14 @@ def load_rules_from_types(index, type_names=None):
 @click.option('--auto-match', '-a', help="Automatically associate datasets with products by matching metadata",
               is_flag=True, default=False)
 @click.option('--dry-run', help='Check if everything is ok', is_flag=True, default=False)
+@click.option('--workers', help='Number of processes reading and matching dataset documents (0 to read them '
+                                'in this process)', type=int, default=0)
+@click.option('--writers', help='Number of concurrent index writers (with --workers)', type=int, default=1)
+@click.option('--batch-size', help='Number of datasets indexed per transaction', type=int, default=1000)
 @click.argument('datasets',
                 type=click.Path(exists=True, readable=True, writable=False), nargs=-1)
 @ui.pass_index()
-def index_cmd(index, match_rules, dtype, auto_match, dry_run, datasets):
+def index_cmd(index, match_rules, dtype, auto_match, dry_run, workers, writers, batch_size, datasets):
     if not (match_rules or dtype or auto_match):
         _LOG.error('Must specify one of [--match-rules, --type, --auto-match]')
         return
@@ -139,29 +147,236 @@ def index_cmd(index, match_rules, dtype, auto_match, dry_run, datasets):
     if rules is None:
         return
 
-    for dataset_path in datasets:
-        metadata_path = get_metadata_path(Path(dataset_path))
-        if not metadata_path or not metadata_path.exists():
-            raise ValueError('No supported metadata docs found for dataset {}'.format(dataset_path))
-
-        for metadata_path, metadata_doc in read_documents(metadata_path):
-            uri = metadata_path.absolute().as_uri()
-
-            try:
-                dataset = match_dataset(metadata_doc, uri, rules)
-            except RuntimeError as e:
-                _LOG.exception("Error creating dataset")
-                _LOG.error('Unable to create Dataset for %s: %s', uri, e)
-                continue
-
-            is_consistent, reason = check_dataset_consistent(dataset)
-            if not is_consistent:
-                _LOG.error("Dataset %s inconsistency: %s", dataset.id, reason)
-                continue
-
-            _LOG.info('Matched %s', dataset)
-            if not dry_run:
-                index.datasets.add(dataset)
+    progress = IndexProgress()
+    if workers > 0:
+        index_in_parallel(index, rules, datasets, progress, workers=workers, writers=writers,
+                          batch_size=batch_size, dry_run=dry_run)
+    else:
+        _index_datasets(index, _match_datasets(datasets, rules, progress), progress, batch_size, dry_run)
+    click.echo(progress.summary())
+
+
+class IndexProgress(object):
+    """
+    Thread-safe counts of indexed datasets, logging progress and throughput every `interval` seconds.
+    """
+
+    def __init__(self, interval=10):
+        self.interval = interval
+        self.counts = {'added': 0, 'existing': 0, 'failed': 0, 'matched': 0}
+        self._lock = threading.Lock()
+        self._start = self._last_report = time.time()
+
+    def update(self, status):
+        with self._lock:
+            self.counts[status] += 1
+            now = time.time()
+            if now - self._last_report < self.interval:
+                return
+            self._last_report = now
+            message = self.summary()
+        _LOG.info(message)
+
+    def summary(self):
+        total = sum(self.counts.values())
+        elapsed = time.time() - self._start
+        return '%d datasets in %.0fs (%.1f datasets/s): %s' % (
+            total, elapsed, total / elapsed if elapsed else 0,
+            ', '.join('%d %s' % (count, status) for status, count in sorted(self.counts.items()) if count)
+        )
+
+
+def _index_datasets(index, datasets, progress, batch_size, dry_run):
+    if dry_run:
+        for _ in datasets:
+            progress.update('matched')
+        return
+
+    for outcome in index.datasets.add_many(datasets, batch_size=batch_size):
+        if outcome.status == 'failed':
+            _LOG.error('Failed to index dataset %s: %s', outcome.dataset.id, outcome.error)
+        progress.update(outcome.status)
+
+
+def index_in_parallel(index, rules, dataset_paths, progress, workers, writers=1, batch_size=1000,
+                      dry_run=False, queue_size=None):
+    """
+    Index datasets, reading and matching their documents in a pool of `workers` processes.
+
+    Matched datasets are passed over a bounded queue to `writers` threads, each indexing them in batches
+    with :meth:`datacube.index._datasets.DatasetResource.add_many`. Reading stops whenever the queue is
+    full, so memory use doesn't depend on the number of datasets.
+
+    :param list[dict] rules: matching rules, as from :func:`load_rules_from_types`
+    :param list[str] dataset_paths: dataset paths, as given to ``datacube dataset add``
+    :param IndexProgress progress:
+    :param int queue_size: maximum number of matched datasets waiting to be indexed
+                           (default: two batches per writer)
+    """
+    queue_size = queue_size or 2 * batch_size * writers
+    matched = compat.queue.Queue(maxsize=queue_size)
+    types_by_name = {rule['type'].name: rule['type'] for rule in rules}
+    # Bound the number of paths in flight too, as one path can hold many datasets.
+    pending = threading.BoundedSemaphore(4 * workers)
+
+    def on_matched(result):
+        # Called on the pool's result thread: blocking here holds back the workers.
+        # (an exception escaping from here would stop the pool from handling any more results)
+        try:
+            dataset_path, trees, error = result
+            if error:
+                _LOG.error('Unable to read datasets in %s: %s', dataset_path, error)
+                progress.update('failed')
+            for tree in trees:
+                matched.put(_dataset_from_tree(tree, types_by_name))
+        except Exception:  # pylint: disable=broad-except
+            _LOG.exception('Unable to queue datasets for indexing')
+        finally:
+            pending.release()
+
+    threads = [threading.Thread(target=_write_from_queue,
+                                args=(index, matched, progress, batch_size, dry_run))
+               for _ in range(writers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    pool = multiprocessing.Pool(workers, initializer=_init_match_worker, initargs=(_worker_rules(rules),))
+    try:
+        for dataset_path in dataset_paths:
+            pending.acquire()
+            pool.apply_async(_match_path, (dataset_path,), callback=on_matched)
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
+        for _ in threads:
+            matched.put(None)
+        for thread in threads:
+            thread.join()
+
+
+def _write_from_queue(index, queue_, progress, batch_size, dry_run):
+    datasets = _iter_queue(queue_)
+    try:
+        _index_datasets(index, datasets, progress, batch_size, dry_run)
+    except Exception:  # pylint: disable=broad-except
+        _LOG.exception('Index writer failed')
+        # Keep draining the queue, so that the readers aren't blocked forever.
+        for _ in datasets:
+            progress.update('failed')
+
+
+def _iter_queue(queue_):
+    """
+    Items from a queue until a None is received.
+    """
+    while True:
+        item = queue_.get()
+        if item is None:
+            return
+        yield item
+
+
+#: Rules of a match worker process
+_WORKER_RULES = []
+
+
+def _worker_rules(rules):
+    """
+    What worker processes need of the rules to match datasets: the products without their search fields,
+    which are tied to the index.
+    """
+    return [(rule['type'].definition, rule['type'].metadata_type.name, rule['type'].metadata_type.dataset_offsets,
+             rule['metadata'])
+            for rule in rules]
+
+
+def _init_match_worker(worker_rules):
+    global _WORKER_RULES  # pylint: disable=global-statement
+    _WORKER_RULES = [{'type': DatasetType(MetadataType(metadata_type_name, dataset_offsets, {}), definition),
+                      'metadata': metadata}
+                     for definition, metadata_type_name, dataset_offsets, metadata in worker_rules]
+
+
+def _match_path(dataset_path):
+    """
+    Read and match the datasets at a path, in a worker process.
+
+    :return: the path, each dataset as returned by :func:`_dataset_to_tree`, and the error if reading failed
+    """
+    trees = []
+    try:
+        for dataset in _match_path_datasets(dataset_path, _WORKER_RULES):
+            trees.append(_dataset_to_tree(dataset))
+    except Exception as e:  # pylint: disable=broad-except
+        return dataset_path, trees, str(e)
+    return dataset_path, trees, None
+
+
+def _dataset_to_tree(dataset):
+    """
+    A plain-data version of a dataset that's cheap to send between processes.
+
+    :rtype: (str, dict, str, dict)
+    """
+    return (dataset.type.name, dataset.metadata_doc, dataset.local_uri,
+            {classifier: _dataset_to_tree(source) for classifier, source in dataset.sources.items()})
+
+
+def _dataset_from_tree(tree, types_by_name):
+    type_name, metadata_doc, local_uri, sources = tree
+    return Dataset(types_by_name[type_name], metadata_doc, local_uri,
+                   sources={classifier: _dataset_from_tree(source, types_by_name)
+                            for classifier, source in sources.items()})
+
+
+def _match_datasets(dataset_paths, rules, progress):
+    """
+    Read and match the datasets at each path, skipping (and logging) any that can't be indexed.
+
+    A path that can't be read is logged and counted as failed, as in :func:`index_in_parallel`.
+
+    :param IndexProgress progress:
+    :rtype: collections.Iterator[datacube.model.Dataset]
+    """
+    for dataset_path in dataset_paths:
+        try:
+            for dataset in _match_path_datasets(dataset_path, rules):
+                yield dataset
+        except Exception as e:  # pylint: disable=broad-except
+            _LOG.error('Unable to read datasets in %s: %s', dataset_path, e)
+            progress.update('failed')
+
+
+def _match_path_datasets(dataset_path, rules):
+    """
+    Read and match the datasets at a path, skipping (and logging) any that can't be indexed.
+
+    :raises ValueError: if the path has no metadata document
+    :rtype: collections.Iterator[datacube.model.Dataset]
+    """
+    metadata_path = get_metadata_path(Path(dataset_path))
+    if not metadata_path or not metadata_path.exists():
+        raise ValueError('No supported metadata docs found for dataset {}'.format(dataset_path))
+
+    for metadata_path, metadata_doc in read_documents(metadata_path):
+        uri = metadata_path.absolute().as_uri()
+
+        try:
+            dataset = match_dataset(metadata_doc, uri, rules)
+        except RuntimeError as e:
+            _LOG.exception("Error creating dataset")
+            _LOG.error('Unable to create Dataset for %s: %s', uri, e)
+            continue
+
+        is_consistent, reason = check_dataset_consistent(dataset)
+        if not is_consistent:
+            _LOG.error("Dataset %s inconsistency: %s", dataset.id, reason)
+            continue
+
+        _LOG.info('Matched %s', dataset)
+        yield dataset
 
 
 def build_dataset_info(index, dataset, show_derived=False):
@@ -1,8 +1,19 @@
 from __future__ import absolute_import
 
+import itertools
+import json
 import logging
+import os
+import threading
+import time
+import timeit
+import uuid
+from contextlib import contextmanager
+from functools import partial
+
 import click
 import cachetools
+import numpy
 try:
     import cPickle as pickle
 except ImportError:
@@ -10,13 +21,16 @@ except ImportError:
 from copy import deepcopy
 from pathlib import Path
 from pandas import to_datetime
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import datacube
+from datacube import compat
 from datacube.api.core import Datacube
+from datacube.executor import as_completed_bounded
 from datacube.model import DatasetType, GeoPolygon, Range
 from datacube.model.utils import make_dataset, xr_apply, datasets_to_doc
-from datacube.storage.storage import write_dataset_to_netcdf
+from datacube.options import OPTIONS
+from datacube.storage.storage import write_dataset_to_netcdf, write_block_shape
 from datacube.ui import click as ui
 from datacube.utils import read_documents, intersect_points, union_points
 
@@ -26,13 +40,34 @@ _LOG = logging.getLogger('agdc-ingest')
 
 FUSER_KEY = 'fuse_data'
 
+#: How far before the start of planning the next incremental run looks for new source datasets, to allow for
+#: datasets being indexed in transactions that were still open when planning started.
+MARK_MARGIN = timedelta(hours=1)
+
+
+def find_diff(input_type, output_type, index, ingestion_bounds=None, since=None, record_existing=False, **query):
+    """
+    Find the tiles of the output type that still need to be ingested.
 
-def find_diff(input_type, output_type, index, ingestion_bounds=None, **query):
+    :param datetime since: only consider source datasets indexed after this time, and the ingestion ledger
+                           instead of the output product's datasets. If None, compare every dataset of both.
+    :param bool record_existing: when comparing every dataset, record the output tiles that already exist in
+                                 the ingestion ledger, so that tiles written before it existed are known to it
+    """
     from datacube.api.grid_workflow import GridWorkflow
     workflow = GridWorkflow(index, output_type.grid_spec)
 
-    tiles_in = workflow.list_tiles(product=input_type.name, **query)
-    tiles_out = workflow.list_tiles(product=output_type.name, **query)
+    if since is None:
+        tiles_in = workflow.list_tiles(product=input_type.name, **query)
+        tiles_out = workflow.list_tiles(product=output_type.name, **query)
+        if record_existing:
+            record_tiles(index, output_type, [(key, tile) for key, tile in tiles_in.items() if key in tiles_out])
+    else:
+        tiles_in = workflow.list_tiles(product=input_type.name, added=Range(since, None), **query)
+        tiles_out = set()
+        if tiles_in:
+            times = [key[2] for key in tiles_in]
+            tiles_out = index.ingestion.get_tiles(output_type, min(times), max(times))
 
     def update_dict(d, **kwargs):
         result = d.copy()
@@ -57,6 +92,18 @@ def find_diff(input_type, output_type, index, ingestion_bounds=None, **query):
     return tasks
 
 
+def record_tiles(index, output_type, tiles, batch_size=1000):
+    """
+    Record written tiles in the ingestion ledger, a batch at a time.
+
+    :param tiles: (tile index, tile) of each tile, where the tile holds its ``sources``
+    """
+    for start in range(0, len(tiles), batch_size):
+        index.ingestion.record(output_type, [(key, [dataset.id for sources in tile['sources'].values
+                                                    for dataset in sources])
+                                             for key, tile in tiles[start:start + batch_size]])
+
+
 def morph_dataset_type(source_type, config):
     output_type = DatasetType(source_type.metadata_type, deepcopy(source_type.definition))
     output_type.definition['name'] = config['output_type']
@@ -166,11 +213,6 @@ def load_tasks_from_file(taskfile):
     return config, stream
 
 
-@cachetools.cached(cache={}, key=lambda index, id_: id_)
-def get_full_lineage(index, id_):
-    return index.datasets.get(id_, include_sources=True)
-
-
 def load_config_from_file(index, config):
     config_name = Path(config).name
     _, config = next(read_documents(Path(config)))
@@ -179,7 +221,7 @@ def load_config_from_file(index, config):
     return config
 
 
-def create_task_list(index, output_type, year, source_type, config):
+def create_task_list(index, output_type, year, source_type, config, since=None, record_existing=False):
     query = {}
     if year:
         query['time'] = Range(datetime(year=year, month=1, day=1), datetime(year=year+1, month=1, day=1))
@@ -187,31 +229,76 @@ def create_task_list(index, output_type, year, source_type, config):
     if config['ingestion_bounds']:
         bounds = config['ingestion_bounds']
 
-    tasks = find_diff(source_type, output_type, index, ingestion_bounds=bounds, **query)
+    tasks = find_diff(source_type, output_type, index, ingestion_bounds=bounds, since=since,
+                      record_existing=record_existing, **query)
     _LOG.info('%s tasks discovered', len(tasks))
 
-    def update_sources(sources):
-        return tuple(get_full_lineage(index, dataset.id) for dataset in sources)
-
-    def update_task(task):
-        for i in range(task['sources'].size):
-            task['sources'].values[i] = update_sources(task['sources'].values[i])
-        return task
-
-    tasks = (update_task(task) for task in tasks)
-    return tasks
-
-
-def ingest_work(config, source_type, output_type, index, sources, geobox):
-    namemap = get_namemap(config)
+    return add_full_lineage(index, tasks)
+
+
+def add_full_lineage(index, tasks, batch_size=100, cache_size=10000):
+    """
+    Replace the source datasets of each task with their full lineage.
+
+    The lineage of `batch_size` tasks' sources is fetched at a time, and the most recently used
+    `cache_size` datasets are kept for later tasks that share sources.
+    """
+    cache = cachetools.LRUCache(maxsize=cache_size)
+    tasks = iter(tasks)
+    while True:
+        batch = list(itertools.islice(tasks, batch_size))
+        if not batch:
+            return
+
+        ids = set(dataset.id for task in batch for sources in task['sources'].values for dataset in sources)
+        lineage = {id_: cache[id_] for id_ in ids if id_ in cache}
+        for dataset in index.datasets.get_many([id_ for id_ in ids if id_ not in lineage], include_sources=True):
+            lineage[dataset.id] = cache[dataset.id] = dataset
+
+        for task in batch:
+            for i in range(task['sources'].size):
+                task['sources'].values[i] = tuple(lineage[dataset.id] for dataset in task['sources'].values[i])
+            yield task
+
+
+def get_dask_chunks(config, measurements, sources, geobox):
+    """
+    Chunks to load a tile lazily in: the blocks it will be written in (see
+    :func:`datacube.storage.storage.write_block_shape`), so that each is read just before it is written.
+
+    Measurements with smaller dtypes are written in larger blocks, made of several of these chunks.
+    """
+    dims = sources.dims + geobox.dimensions
+    shape = sources.shape + geobox.shape
+    storage_chunks = config['storage']['chunking']
+    itemsize = max(numpy.dtype(measurement['dtype']).itemsize for measurement in measurements)
+    block = write_block_shape(shape, [storage_chunks.get(dim, size) for dim, size in zip(dims, shape)], itemsize)
+    return dict(zip(dims, block))
+
+
+def load_tile(config, source_type, sources, geobox, lazy=False):
+    """
+    Read the source data of a tile, with the output names of its measurements.
+
+    :param bool lazy: return dask arrays that read the data a block at a time as it is written, so that
+                      the whole tile is never in memory. Write it with ``reproject_threads=1``, as they are
+                      read then.
+    :rtype: xarray.Dataset
+    """
     measurements = get_measurements(source_type, config)
-    variable_params = get_variable_params(config)
-    global_attributes = config['global_attributes']
-
+    dask_chunks = get_dask_chunks(config, measurements, sources, geobox) if lazy else None
     with datacube.set_options(reproject_threads=1):
         fuse_func = {'copy': None}[config.get(FUSER_KEY, 'copy')]
-        data = Datacube.product_data(sources, geobox, measurements, fuse_func=fuse_func)
-    nudata = data.rename(namemap)
+        data = Datacube.product_data(sources, geobox, measurements, fuse_func=fuse_func, dask_chunks=dask_chunks)
+    return data.rename(get_namemap(config))
+
+
+def make_tile_datasets(config, output_type, index, sources, geobox, data):
+    """
+    Make the output datasets of a tile, and add their documents to its `data`.
+
+    :return: the datasets (by time), and the file they will be written to
+    """
     file_path = get_filename(config, index, sources)
 
     def _make_dataset(labels, sources):
@@ -226,14 +313,325 @@ def ingest_work(config, source_type, output_type, index, sources, geobox):
                                valid_data=GeoPolygon(valid_data, geobox.crs))
         return dataset
     datasets = xr_apply(sources, _make_dataset, dtype='O')  # Store in Dataarray to associate Time -> Dataset
-    nudata['dataset'] = datasets_to_doc(datasets)
+    data['dataset'] = datasets_to_doc(datasets)
+    return datasets, file_path
+
 
-    write_dataset_to_netcdf(nudata, global_attributes, variable_params, file_path)
+def write_tile(config, data, file_path):
+    write_dataset_to_netcdf(data, config['global_attributes'], get_variable_params(config), file_path)
 
+
+def ingest_work(config, source_type, output_type, index, sources, geobox):
+    data = load_tile(config, source_type, sources, geobox, lazy=True)
+    datasets, file_path = make_tile_datasets(config, output_type, index, sources, geobox, data)
+    with datacube.set_options(reproject_threads=1):
+        write_tile(config, data, file_path)
     return datasets
 
 
-def process_tasks(index, config, source_type, output_type, tasks, executor):
+@contextmanager
+def _timed(timings, stage):
+    start = timeit.default_timer()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0) + timeit.default_timer() - start
+
+
+class _TileWriter(object):
+    """
+    Write loaded tiles in a background thread.
+
+    :meth:`put` blocks while `queue_size` tiles are waiting to be written, or while the tiles not yet written
+    would take more than `max_bytes` of memory. (A single tile is always let through, however large.)
+    """
+
+    def __init__(self, write, queue_size, max_bytes=None, timings=None):
+        self._write = write
+        self._max_bytes = max_bytes
+        self._timings = timings
+        self._queue = compat.queue.Queue(maxsize=queue_size)
+        self._pending_bytes = 0
+        self._memory = threading.Condition()
+        #: Tile index -> exception, of tiles that failed to write
+        self.errors = {}
+        self._thread = threading.Thread(target=self._run, name='tile-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, key, data, *args):
+        nbytes = data.nbytes
+        with self._memory:
+            while self._max_bytes is not None and self._pending_bytes and \
+                    self._pending_bytes + nbytes > self._max_bytes:
+                self._memory.wait()
+            self._pending_bytes += nbytes
+        self._queue.put((key, nbytes, (data,) + args))
+
+    def close(self):
+        """
+        Wait for all queued tiles to be written.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            key, nbytes, args = item
+            del item
+            try:
+                with _timed(self._timings, 'write'):
+                    self._write(*args)
+            except Exception as e:  # pylint: disable=broad-except
+                _LOG.exception('Failed to write tile %s', key)
+                self.errors[key] = e
+            finally:
+                del args
+                with self._memory:
+                    self._pending_bytes -= nbytes
+                    self._memory.notify_all()
+
+
+def estimate_tile_bytes(config, source_type, task):
+    """
+    Estimated memory needed to ingest a tile: the size of its loaded data.
+
+    :rtype: int
+    """
+    itemsize = sum(numpy.dtype(measurement['dtype']).itemsize
+                   for measurement in get_measurements(source_type, config))
+    return int(numpy.prod(task['geobox'].shape)) * task['sources'].size * itemsize
+
+
+def ingest_tiles(config, source_type, output_type, tasks, queue_size=0, max_bytes=None, timings=None):
+    """
+    Ingest several tiles.
+
+    Without a `queue_size`, each tile is loaded lazily, and read a block at a time as it is written, so that memory
+    use doesn't grow with the depth of its time stack. With a `queue_size`, each tile is loaded in full, then
+    compressed and written in a background thread while the next is loaded.
+
+    :param tasks: the index, sources and geobox of each tile, as from :func:`find_diff`
+    :param int queue_size: how many loaded tiles may wait to be written. 0 writes each tile before loading the next
+    :param int max_bytes: memory ceiling for the loaded tiles waiting to be written
+    :param dict timings: if given, the seconds spent in each stage are added to it: ``read``, ``prepare``,
+                         ``write`` and ``wait`` (for the writer to catch up). Without a `queue_size`, ``write``
+                         includes reading the data
+    :return: (tile index, datasets, error) of each tile, where `error` is None if the tile was written
+    """
+    if queue_size > 0:
+        writer = _TileWriter(partial(write_tile, config), queue_size, max_bytes, timings)
+    else:
+        writer = None
+
+    outcomes = []
+    try:
+        for task in tasks:
+            try:
+                with _timed(timings, 'read'):
+                    data = load_tile(config, source_type, task['sources'], task['geobox'], lazy=writer is None)
+                with _timed(timings, 'prepare'):
+                    datasets, file_path = make_tile_datasets(config, output_type, task['index'],
+                                                             task['sources'], task['geobox'], data)
+                if writer is None:
+                    with _timed(timings, 'write'), datacube.set_options(reproject_threads=1):
+                        write_tile(config, data, file_path)
+                else:
+                    with _timed(timings, 'wait'):
+                        writer.put(task['index'], data, file_path)
+                del data
+            except Exception as e:  # pylint: disable=broad-except
+                _LOG.exception('Failed to ingest tile %s', task['index'])
+                outcomes.append((task['index'], None, e))
+                continue
+            outcomes.append((task['index'], datasets, None))
+    finally:
+        if writer is not None:
+            with _timed(timings, 'wait'):
+                writer.close()
+
+    if writer is not None:
+        outcomes = [(key, None, writer.errors[key]) if key in writer.errors else (key, datasets, error)
+                    for key, datasets, error in outcomes]
+    return outcomes
+
+
+class TaskJournal(object):
+    """
+    Append-only record of the progress of each tile of a task file, so that an interrupted run can be resumed.
+
+    Each line is a JSON object with the ``tile`` (index), its ``status`` (``started``, ``indexing``, ``indexed``,
+    ``done`` or ``failed``), the ``path`` of its storage unit and, once it is being indexed, the ids of its
+    ``datasets``. The last line for a tile wins.
+
+    :param path: file to write the journal to, or None to only keep it in memory (for retries within a run)
+    :param bool resume: continue the existing journal at `path`, rather than starting a new one
+    :param bool overwrite: start a new journal even if there is one at `path`. Otherwise a journal with entries
+                           is only replaced when resuming it, as they protect the output of tiles already indexed
+    :raises ValueError: if there is a journal at `path`, and neither `resume` nor `overwrite` is set
+    """
+
+    def __init__(self, path, resume=False, overwrite=False):
+        self.path = path and Path(path)
+        self._records = {}
+        self._stream = None
+        if path is None:
+            return
+        if not (resume or overwrite) and self.path.exists() and self.path.stat().st_size > 0:
+            raise ValueError('%s holds the progress of an earlier run: use --resume to continue it, '
+                             'or --restart to discard it' % self.path)
+        line = '\n'
+        if resume and self.path.exists():
+            with open(str(self.path), 'r') as stream:
+                for line in stream:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # The last line may have been cut short when the previous run died
+                        _LOG.warning('Ignoring incomplete journal entry: %r', line)
+                        continue
+                    self._records[tuple(record['tile'])] = record
+        self._stream = open(str(self.path), 'a' if resume else 'w')
+        if not line.endswith('\n'):
+            self._stream.write('\n')
+
+    @staticmethod
+    def _key(tile_index):
+        return tuple(int(i) for i in tile_index[:-1]) + (str(tile_index[-1]),)
+
+    def status(self, tile_index):
+        """
+        :return: the last recorded status of the tile, or None
+        """
+        record = self._records.get(self._key(tile_index))
+        return record and record['status']
+
+    def datasets(self, tile_index):
+        """
+        :return: the ids of the datasets that were being indexed for the tile, if it got that far
+        :rtype: list[str]
+        """
+        return self._records.get(self._key(tile_index), {}).get('datasets') or []
+
+    def started(self, tile_index, path):
+        self._write(tile_index, 'started', path=str(path), datasets=None)
+
+    def indexing(self, tile_index, dataset_ids):
+        self._write(tile_index, 'indexing', datasets=[str(id_) for id_ in dataset_ids])
+
+    def indexed(self, tile_index):
+        self._write(tile_index, 'indexed')
+
+    def done(self, tile_index):
+        self._write(tile_index, 'done')
+
+    def failed(self, tile_index, error):
+        self._write(tile_index, 'failed', error=str(error))
+
+    def _write(self, tile_index, status, **fields):
+        key = self._key(tile_index)
+        previous = self._records.get(key, {})
+        record = dict(tile=list(key), status=status, path=previous.get('path'), datasets=previous.get('datasets'))
+        record.update(fields)
+        self._records[key] = record
+        if self._stream is not None:
+            self._stream.write(json.dumps(record) + '\n')
+            self._stream.flush()
+            os.fsync(self._stream.fileno())
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, value, traceback):
+        self.close()
+
+
+def _start_task(index, config, output_type, journal, task):
+    """
+    Check the journal before (re-)ingesting a tile, removing the partial output of an earlier attempt.
+
+    A tile whose datasets were all indexed is only recorded as done: its output is kept. Datasets of a tile
+    that was only partly indexed are archived before its output is removed.
+
+    :return: False if the tile should not be ingested
+    """
+    status = journal.status(task['index'])
+    if status == 'done':
+        return False
+
+    dataset_ids = journal.datasets(task['index'])
+    if status != 'indexed' and dataset_ids:
+        found = set(str(uuid.UUID(str(dataset.id))) for dataset in index.datasets.get_many(dataset_ids))
+        indexed = [id_ for id_ in dataset_ids if str(uuid.UUID(id_)) in found]
+    else:
+        indexed = dataset_ids
+    if dataset_ids and len(indexed) == len(dataset_ids):
+        record_tiles(index, output_type, [(task['index'], task)])
+        journal.done(task['index'])
+        return False
+    if indexed:
+        _LOG.info('Archiving the datasets of partly indexed tile %s: %s', task['index'], indexed)
+        index.datasets.archive(indexed)
+
+    file_path = get_filename(config, task['index'], task['sources'])
+    if file_path.exists() and status is not None:
+        _LOG.info('Removing partial output of tile %s: %s', task['index'], file_path)
+        file_path.unlink()
+    journal.started(task['index'], file_path)
+    return True
+
+
+def process_tasks(index, config, source_type, output_type, tasks, executor,
+                  queue_size=0, max_bytes=None, tiles_per_task=1, journal=None, retries=0, retry_delay=30,
+                  max_tasks=None, max_memory=None):
+    """
+    Ingest tasks with the executor, and index the datasets written.
+
+    :param int queue_size: see :func:`ingest_tiles`, per executor task
+    :param int max_bytes: see :func:`ingest_tiles`, per executor task
+    :param int tiles_per_task: how many tiles each executor task ingests
+    :param TaskJournal journal: if given, tiles it records as done are skipped, and the progress of the others
+                                is recorded in it. Otherwise progress is only kept in memory, for retries
+    :param int retries: how many times to retry failed tiles
+    :param retry_delay: seconds to wait before the first retry, doubling for each one after
+    :param int max_tasks: maximum number of executor tasks in flight at once
+    :param int max_memory: only start executor tasks while their estimated memory use
+                           (see :func:`estimate_tile_bytes`) totals less than this many bytes
+    :return: number of tiles (successful, failed, invalid), where invalid tiles were not attempted because
+             they need fusing, and no fuser is configured
+    """
+    if journal is None:
+        journal = TaskJournal(None)
+    successful, failed, invalid = _process_tasks(index, config, source_type, output_type, tasks, executor,
+                                                 queue_size, max_bytes, tiles_per_task, journal,
+                                                 max_tasks, max_memory)
+    for attempt in range(retries):
+        if not failed:
+            break
+        delay = retry_delay * 2 ** attempt
+        _LOG.info('Retrying %d failed tiles in %s seconds', len(failed), delay)
+        time.sleep(delay)
+        retried, failed, _ = _process_tasks(index, config, source_type, output_type, failed, executor,
+                                            queue_size, max_bytes, tiles_per_task, journal,
+                                            max_tasks, max_memory)
+        successful += retried
+
+    return successful, len(failed), invalid
+
+
+def _process_tasks(index, config, source_type, output_type, tasks, executor,
+                   queue_size, max_bytes, tiles_per_task, journal, max_tasks, max_memory):
+    """
+    :return: the number of successful tiles, the tasks of the failed ones, and the number not attempted
+    """
     def check_valid(task):
         if FUSER_KEY in config:
             return True
@@ -244,30 +642,86 @@ def process_tasks(index, config, source_type, output_type, tasks, executor):
 
         return not require_fusing
 
-    results = []
-    successful = failed = 0
-    for task in tasks:
-        if check_valid(task):
-            results.append(executor.submit(ingest_work,
-                                           config=config,
-                                           source_type=source_type,
-                                           output_type=output_type,
-                                           **task))
-        else:
-            failed += 1
-
-    for result in executor.as_completed(results):
+    pending = {}
+    counts = {'invalid': 0, 'skipped': 0}
+    successful = 0
+    failed = []
+
+    def batches():
+        batch = []
+        for task in itertools.chain(tasks, [None]):
+            if task is not None:
+                if not check_valid(task):
+                    counts['invalid'] += 1
+                    continue
+                try:
+                    if not _start_task(index, config, output_type, journal, task):
+                        counts['skipped'] += 1
+                        continue
+                except Exception as e:  # pylint: disable=broad-except
+                    _LOG.exception('Tile %s failed', task['index'])
+                    journal.failed(task['index'], e)
+                    failed.append(task)
+                    continue
+                pending[task['index']] = task
+                batch.append(task)
+            if batch and (task is None or len(batch) >= tiles_per_task):
+                yield batch
+                batch = []
+
+    def submit(batch):
+        return executor.submit(ingest_tiles,
+                               config=config,
+                               source_type=source_type,
+                               output_type=output_type,
+                               tasks=batch,
+                               queue_size=queue_size,
+                               max_bytes=max_bytes)
+
+    def estimate(batch):
+        tile_bytes = max(estimate_tile_bytes(config, source_type, task) for task in batch)
+        if not queue_size:
+            # Tiles are read a block at a time as they are written
+            return min(tile_bytes, OPTIONS['write_block_size'])
+        # Tiles are loaded one at a time, but up to `queue_size` may be waiting to be written
+        return tile_bytes * (1 + min(queue_size, len(batch) - 1))
+
+    for result in as_completed_bounded(executor, submit, batches(), max_tasks=max_tasks,
+                                       max_memory=max_memory, estimate=estimate):
         try:
-            datasets = executor.result(result)
-            for dataset in datasets.values:
-                index.datasets.add(dataset, skip_sources=True)
-            successful += 1
+            outcomes = executor.result(result)
         except Exception:  # pylint: disable=broad-except
+            # Its tiles are still pending, and counted as failed below
             _LOG.exception('Task failed')
-            failed += 1
             continue
 
-    return successful, failed
+        for tile_index, datasets, error in outcomes:
+            task = pending.pop(tile_index)
+            try:
+                if error is not None:
+                    raise error
+                # Once datasets may be in the index, the tile's output must not be removed without them
+                journal.indexing(tile_index, [dataset.id for dataset in datasets.values])
+                errors = [outcome.error for outcome in index.datasets.add_many(datasets.values, skip_sources=True)
+                          if outcome.status == 'failed']
+                if errors:
+                    raise errors[0]
+                journal.indexed(tile_index)
+                record_tiles(index, output_type, [(tile_index, task)])
+            except Exception as e:  # pylint: disable=broad-except
+                _LOG.exception('Tile %s failed', tile_index)
+                journal.failed(tile_index, e)
+                failed.append(task)
+                continue
+            journal.done(tile_index)
+            successful += 1
+
+    if counts['skipped']:
+        _LOG.info('Skipped %d tiles already done', counts['skipped'])
+    for tile_index, task in pending.items():
+        journal.failed(tile_index, 'task failed')
+        failed.append(task)
+    return successful, failed, counts['invalid']
 
 
 @cli.command('ingest', help="Ingest datasets")
@@ -275,18 +729,58 @@ def process_tasks(index, config, source_type, output_type, tasks, executor):
               type=click.Path(exists=True, readable=True, writable=False, dir_okay=False),
               help='Ingest configuration file')
 @click.option('--year', type=click.IntRange(1960, 2060))
+@click.option('--full', is_flag=True, default=False,
+              help='Compare every source dataset with the output product, '
+                   'rather than only those indexed since the last complete run')
 @click.option('--save-tasks', help='Save tasks to the specified file',
               type=click.Path(exists=False))
 @click.option('--load-tasks', help='Load tasks from the specified file',
               type=click.Path(exists=True, readable=True, writable=False, dir_okay=False))
+@click.option('--resume', is_flag=True, default=False,
+              help='Continue an interrupted run of --load-tasks, skipping the tiles it finished')
+@click.option('--restart', is_flag=True, default=False,
+              help='Run --load-tasks again from the start, discarding the journal of an earlier run')
+@click.option('--retries', type=click.IntRange(0), default=0, help='Number of times to retry failed tiles')
+@click.option('--retry-delay', type=click.IntRange(0), default=30,
+              help='Seconds before the first retry, doubling for each retry after')
 @click.option('--dry-run', '-d', is_flag=True, default=False, help='Check if everything is ok')
+@click.option('--write-queue', type=click.IntRange(0), default=0,
+              help='Number of loaded tiles each task may queue to be compressed and written in the background, '
+                   'while it loads the next. 0 writes each tile before loading the next. Only reads of '
+                   'GeoTIFF/rasterio sources overlap the writes: NetCDF sources wait for compression to finish. '
+                   'NetCDF sources read through GDAL need a thread-safe HDF5 build')
+@click.option('--write-memory', type=click.IntRange(1), default=1024,
+              help='Memory ceiling (MB) of the tiles each task has queued to be written')
+@click.option('--tiles-per-task', type=click.IntRange(1),
+              help='Number of tiles ingested by each executor task (default 1, or 8 with --write-queue)')
+@click.option('--max-tasks', type=click.IntRange(1),
+              help='Maximum number of executor tasks in flight at once (default: unlimited)')
+@click.option('--memory-budget', type=click.IntRange(1),
+              help='Only start executor tasks while their estimated memory use totals less than this many MB, '
+                   'across all workers (default: unlimited)')
 @ui.executor_cli_options
 @ui.pass_index(app_name='agdc-ingest')
-def ingest_cmd(index, config_file, year, save_tasks, load_tasks, dry_run, executor):
+def ingest_cmd(index, config_file, year, full, save_tasks, load_tasks, resume, restart, retries, retry_delay,
+               dry_run, write_queue, write_memory, tiles_per_task, max_tasks, memory_budget, executor):
+    if resume and not load_tasks:
+        click.echo('--resume requires --load-tasks')
+        click.get_current_context().exit(1)
+    if resume and restart:
+        click.echo('Only one of --resume and --restart can be given')
+        click.get_current_context().exit(1)
+
+    mark = None
     if config_file:
         config = load_config_from_file(index, config_file)
         source_type, output_type = make_output_type(index, config)
-        tasks = create_task_list(index, output_type, year, source_type, config)
+        since = None if (full or year) else index.ingestion.get_mark(output_type)
+        if not year:
+            # Planning covers everything indexed up to now: later runs can start from here
+            mark = index.ingestion.now() - MARK_MARGIN
+        if since is not None:
+            _LOG.info('Planning from source datasets indexed since %s', since)
+        tasks = create_task_list(index, output_type, year, source_type, config, since=since,
+                                 record_existing=not dry_run)
     elif load_tasks:
         config, tasks = load_tasks_from_file(load_tasks)
         source_type, output_type = make_output_type(index, config)
@@ -303,5 +797,28 @@ def ingest_cmd(index, config_file, year, save_tasks, load_tasks, dry_run, execut
         save_tasks_to_file(config, tasks, save_tasks)
         return
 
-    successful, failed = process_tasks(index, config, source_type, output_type, tasks, executor)
+    if tiles_per_task is None:
+        tiles_per_task = 8 if write_queue else 1
+    # Runs from a task file record their progress next to it, so that they can be resumed
+    try:
+        journal = TaskJournal(load_tasks + '.journal', resume=resume, overwrite=restart) if load_tasks else None
+    except ValueError as e:
+        click.echo(str(e))
+        click.get_current_context().exit(1)
+    try:
+        successful, failed, invalid = process_tasks(index, config, source_type, output_type, tasks, executor,
+                                                    queue_size=write_queue, max_bytes=write_memory * 1024 * 1024,
+                                                    tiles_per_task=tiles_per_task, journal=journal,
+                                                    retries=retries, retry_delay=retry_delay, max_tasks=max_tasks,
+                                                    max_memory=memory_budget and memory_budget * 1024 * 1024)
+    finally:
+        if journal is not None:
+            journal.close()
     click.echo('%d successful, %d failed' % (successful, failed))
+    if invalid:
+        # These don't hold back the mark: they won't succeed until the configuration changes
+        click.echo('%d skipped, as they need a "%s" in the configuration. '
+                   'Run with --full to ingest them once it is set' % (invalid, FUSER_KEY))
+
+    if mark is not None and not failed:
+        index.ingestion.set_mark(output_type, mark)
@@ -0,0 +1,167 @@
+# coding=utf-8
+"""
+Process-local cache of open rasterio datasets
+"""
+from __future__ import absolute_import
+
+import logging
+import os
+import threading
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+
+import rasterio
+
+from datacube.options import OPTIONS
+
+_LOG = logging.getLogger(__name__)
+
+CacheInfo = namedtuple('CacheInfo', ('hits', 'misses', 'maxsize', 'currsize'))
+
+
+def file_token(path):
+    """
+    Returns a value that changes when the file at `path` is modified, or None if it can't be determined.
+
+    Used to avoid handing out handles (or anything derived from them) to files that were rewritten.
+    """
+    try:
+        stat = os.stat(str(path))
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+
+class FileHandleCache(object):
+    """
+    LRU cache of open rasterio datasets (or other file handles), keyed by filename.
+
+    Handles are checked out exclusively for the duration of :meth:`open`, so they are never shared
+    between threads. A second concurrent ``open`` of the same file gets a fresh handle, which is
+    returned to the cache afterwards.
+
+    The cache is dropped (without closing the inherited handles) the first time it is used in a forked
+    child process.
+
+    :param maxsize: maximum number of idle handles to keep open. If None, the ``file_cache_size``
+                    option is used. 0 disables caching.
+    """
+
+    def __init__(self, maxsize=None):
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        #: :type: OrderedDict[(str, object), list]
+        self._idle = OrderedDict()
+        self._currsize = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def maxsize(self):
+        if self._maxsize is not None:
+            return self._maxsize
+        return OPTIONS.get('file_cache_size', 0)
+
+    @contextmanager
+    def open(self, filename, token=None, opener=rasterio.open):
+        """
+        Open `filename` (with rasterio by default), reusing an idle handle if available.
+
+        :param filename: anything that can be passed to `opener`. Must be hashable.
+        :param token: a value that changes when the underlying file changes, eg. from :func:`file_token`.
+                      Handles opened with a different token are never reused.
+        :param opener: function opening `filename`, returning a handle with a ``close()`` method.
+                       May return None if the file can't be opened this way, which is yielded as is.
+        """
+        if self.maxsize <= 0:
+            src = opener(filename)
+            try:
+                yield src
+            finally:
+                if src is not None:
+                    src.close()
+            return
+
+        key = (filename, token, opener)
+        src = self._checkout(key)
+        if src is None:
+            src = opener(filename)
+            if src is None:
+                yield None
+                return
+
+        try:
+            yield src
+        except Exception:
+            # The handle may be in a bad state; don't hand it out again
+            src.close()
+            raise
+        self._checkin(key, src)
+
+    def info(self):
+        """
+        :rtype: CacheInfo
+        """
+        with self._lock:
+            self._check_pid()
+            return CacheInfo(self.hits, self.misses, self.maxsize, self._currsize)
+
+    def clear(self):
+        """
+        Close all idle handles and reset the hit/miss counters.
+        """
+        with self._lock:
+            self._check_pid()
+            idle, self._idle = self._idle, OrderedDict()
+            self._currsize = 0
+            self.hits = self.misses = 0
+        for handles in idle.values():
+            for src in handles:
+                src.close()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # Forked: the handles belong to the parent's GDAL state, so forget them rather than close them
+            self._pid = os.getpid()
+            self._idle = OrderedDict()
+            self._currsize = 0
+            self.hits = self.misses = 0
+
+    def _checkout(self, key):
+        with self._lock:
+            self._check_pid()
+            handles = self._idle.get(key)
+            if not handles:
+                self.misses += 1
+                return None
+            self.hits += 1
+            src = handles.pop()
+            self._currsize -= 1
+            if not handles:
+                del self._idle[key]
+            return src
+
+    def _checkin(self, key, src):
+        evicted = []
+        with self._lock:
+            self._check_pid()
+            # Re-insert to mark the key as most recently used
+            handles = self._idle.pop(key, [])
+            handles.append(src)
+            self._idle[key] = handles
+            self._currsize += 1
+            while self._currsize > max(self.maxsize, 0):
+                oldest_key = next(iter(self._idle))
+                handles = self._idle[oldest_key]
+                evicted.append(handles.pop(0))
+                self._currsize -= 1
+                if not handles:
+                    del self._idle[oldest_key]
+        for old in evicted:
+            _LOG.debug("closing cached file handle %s", old.name)
+            old.close()
+
+
+#: The process-wide cache used by :class:`datacube.storage.storage.DatasetSource`
+HANDLE_CACHE = FileHandleCache()
@@ -0,0 +1,149 @@
+# coding=utf-8
+"""
+Read datacube-written NetCDF storage units directly with netCDF4, without going through GDAL
+"""
+from __future__ import absolute_import, division
+
+import logging
+import threading
+from collections import namedtuple
+
+import netCDF4
+import numpy
+from affine import Affine
+
+from datacube.utils import data_resolution_and_offset
+
+_LOG = logging.getLogger(__name__)
+
+#: netCDF4/HDF5 are not thread-safe, so all access through this module, and all writes by
+#: :func:`datacube.storage.storage.write_dataset_to_netcdf`, are serialised
+NETCDF_LOCK = threading.RLock()
+
+#: Stand-in for ``rasterio.Band``, as used by :func:`datacube.storage.storage.fuse_sources`
+NetCDFBand = namedtuple('NetCDFBand', ['ds', 'bidx', 'dtype', 'shape'])
+
+_UNIX_TIME_UNITS = 'seconds since 1970-01-01'
+
+
+class NetCDFVariableReader(object):
+    """
+    Windowed reads of a single (optionally time-stacked) variable of a storage unit written by
+    :func:`datacube.storage.storage.write_dataset_to_netcdf`.
+
+    The variable must have its spatial dimensions last, a ``grid_mapping`` with a ``spatial_ref``, and
+    (if stacked) a time coordinate in seconds since 1970. Otherwise a :class:`ValueError` is raised, and the
+    caller should read the file through GDAL instead.
+
+    :param str filename: path to the NetCDF file
+    :param str varname: name of the variable to read
+    """
+
+    def __init__(self, filename, varname):
+        self.name = filename
+        with NETCDF_LOCK:
+            self._nco = netCDF4.Dataset(filename)
+            try:
+                self._init_variable(varname)
+            except (KeyError, AttributeError, IndexError, ValueError) as e:
+                self._nco.close()
+                raise ValueError('Not a datacube storage unit variable: %s:%s (%s)' % (filename, varname, e))
+
+    def _init_variable(self, varname):
+        nco = self._nco
+        var = nco.variables[varname]
+        var.set_auto_maskandscale(False)
+        self._var = var
+
+        dims = var.dimensions
+        if len(dims) == 3:
+            if dims[0] != 'time':
+                raise ValueError('unexpected dimensions %s' % (dims,))
+            time = nco.variables['time']
+            if not time.units.startswith(_UNIX_TIME_UNITS):
+                raise ValueError('unexpected time units %r' % time.units)
+            self._stacked = True
+        elif len(dims) == 2:
+            self._stacked = False
+        else:
+            raise ValueError('unexpected dimensions %s' % (dims,))
+
+        ydim, xdim = dims[-2:]
+        yres, yoff = data_resolution_and_offset(nco.variables[ydim][:])
+        xres, xoff = data_resolution_and_offset(nco.variables[xdim][:])
+        self.transform = Affine.translation(xoff, yoff) * Affine.scale(xres, yres)
+        self.crs_wkt = str(nco.variables[var.grid_mapping].spatial_ref)
+
+        self.shape = var.shape[-2:]
+        self.count = var.shape[0] if self._stacked else 1
+        self.dtype = numpy.dtype(var.dtype)
+        self.nodata = getattr(var, '_FillValue', None)
+
+        chunking = var.chunking()
+        if chunking == 'contiguous':
+            self._chunks = None
+        else:
+            self._chunks = tuple(chunking[-2:])
+            self._chunk_bytes = int(numpy.prod(chunking)) * self.dtype.itemsize
+
+    def read_times(self):
+        """
+        Time of each band (seconds since 1970)
+
+        :rtype: numpy.ndarray
+        """
+        if not self._stacked:
+            return numpy.zeros(1, dtype='float64')
+        with NETCDF_LOCK:
+            return numpy.asarray(self._nco.variables['time'][:], dtype='float64')
+
+    def band(self, bidx):
+        """
+        :param int bidx: 1-based index of the time slice, as with rasterio
+        :rtype: NetCDFBand
+        """
+        return NetCDFBand(self, bidx, self.dtype, self.shape)
+
+    def read(self, indexes, window=None):
+        """
+        Read a 2D window of a time slice, mirroring ``rasterio``'s ``read(indexes, window)``.
+
+        :param int indexes: 1-based band (time slice) number
+        :param window: ((row_start, row_stop), (col_start, col_stop)), or None for the whole slice
+        :rtype: numpy.ndarray
+        """
+        if window is None:
+            window = ((0, self.shape[0]), (0, self.shape[1]))
+        (row_start, row_stop), (col_start, col_stop) = window
+        rows, cols = slice(row_start, row_stop), slice(col_start, col_stop)
+
+        with NETCDF_LOCK:
+            self._fit_chunk_cache(window)
+            if self._stacked:
+                return self._var[indexes - 1, rows, cols]
+            return self._var[rows, cols]
+
+    def _fit_chunk_cache(self, window):
+        """
+        Make sure HDF5's chunk cache can hold every chunk touched by the window, so that each
+        compressed chunk is only decompressed once per read.
+        """
+        if self._chunks is None:
+            return
+        nchunks = 1
+        for (start, stop), chunk in zip(window, self._chunks):
+            nchunks *= (stop - 1) // chunk - start // chunk + 1 if stop > start else 0
+        needed = nchunks * self._chunk_bytes
+        size, nelems, preemption = self._var.get_var_chunk_cache()
+        if needed > size:
+            self._var.set_var_chunk_cache(size=needed, nelems=max(nelems, 2 * nchunks + 1), preemption=preemption)
+
+    def close(self):
+        with NETCDF_LOCK:
+            self._nco.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, value, traceback):
+        self.close()
@@ -4,12 +4,18 @@ Create/store dataset data into storage units based on the provided storage mappi
 """
 from __future__ import absolute_import, division, print_function
 
+import itertools
 import logging
+import threading
 from contextlib import contextmanager
 from pathlib import Path
 
+import cachetools
+
 from datacube.model import CRS
 from datacube.storage import netcdf_writer
+from datacube.storage.file_cache import HANDLE_CACHE, file_token
+from datacube.storage.netcdf_reader import NetCDFVariableReader, NetCDFBand, NETCDF_LOCK
 from datacube.options import OPTIONS
 
 try:
@@ -100,6 +106,9 @@ def fuse_sources(sources, destination, dst_transform, dst_projection, dst_nodata
                     numpy.copyto(dest[write[0]:write[0] + shape[0], write[1]:write[1] + shape[1]],
                                  tmp, where=(tmp != source.nodata))
             else:
+                if isinstance(src, NetCDFBand):
+                    # Natively read bands are handed to GDAL as arrays, only when warping is needed
+                    src = src.ds.read(src.bidx)
                 rasterio.warp.reproject(src,
                                         dest,
                                         src_transform=source.transform,
@@ -124,6 +133,22 @@ def fuse_sources(sources, destination, dst_transform, dst_projection, dst_nodata
     if len(sources) == 0:
         return destination
 
+    threads = min(OPTIONS.get('fuse_threads', 1) or 1, len(sources))
+    if threads > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        def read_source(source):
+            buffer_ = numpy.empty(destination.shape, dtype=destination.dtype)
+            buffer_.fill(dst_nodata)
+            reproject(source, buffer_)
+            return buffer_
+
+        # Executor.map yields results in submission order, so fusing stays deterministic
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for buffer_ in pool.map(read_source, sources):
+                fuse_func(destination, buffer_)
+        return destination
+
     buffer_ = numpy.empty(destination.shape, dtype=destination.dtype)
     buffer_.fill(dst_nodata)
     for source in sources:
@@ -149,16 +174,27 @@ class DatasetSource(object):
         self.format = dataset.format
         self.time = dataset.center_time
         self.local_path = dataset.local_path
+        self.managed = dataset.managed
 
-    @contextmanager
-    def open(self):
+    def _filename(self):
         if self._descriptor['path']:
             if Path(self._descriptor['path']).is_absolute():
-                filename = self._descriptor['path']
-            else:
-                filename = str(self.local_path.parent.joinpath(self._descriptor['path']))
-        else:
-            filename = str(self.local_path)
+                return self._descriptor['path']
+            return str(self.local_path.parent.joinpath(self._descriptor['path']))
+        return str(self.local_path)
+
+    @contextmanager
+    def open(self):
+        filename = self._filename()
+        token = file_token(filename)
+
+        if self._native_netcdf():
+            # Cached handles keep HDF5's chunk cache warm between reads of consecutive time slices
+            with HANDLE_CACHE.open((filename, self._descriptor['layer']), token,
+                                   opener=_open_netcdf_variable) as reader:
+                if reader is not None:
+                    yield self._native_band(reader, token)
+                    return
 
         for nasty_format in ('netcdf', 'hdf'):
             if nasty_format in self.format.lower():
@@ -170,11 +206,11 @@ class DatasetSource(object):
 
         try:
             _LOG.debug("openening %s, band %s", filename, bandnumber)
-            with rasterio.open(filename) as src:
+            with HANDLE_CACHE.open(filename, token) as src:
 
                 if bandnumber is None:
                     if 'netcdf' in self.format.lower():
-                        bandnumber = self.wheres_my_band(src, self.time)
+                        bandnumber = self.wheres_my_band(src, self.time, token)
                     else:
                         bandnumber = 1
 
@@ -192,17 +228,129 @@ class DatasetSource(object):
             _LOG.error("Error opening source dataset: %s", filename)
             raise e
 
-    def wheres_my_band(self, src, time):
+    def _native_netcdf(self):
+        """
+        Should this source be read directly with netCDF4 rather than through GDAL?
+        """
+        return self.managed and 'netcdf' in self.format.lower() and OPTIONS.get('native_netcdf', True)
+
+    def _native_band(self, reader, token):
+        time_index = _band_time_index(reader.name, token, reader.read_times)
+        bandnumber = time_index.nearest_band(datetime_to_seconds_since_1970(self.time))
+
+        self.transform = reader.transform
+        try:
+            self.crs = CRS(reader.crs_wkt)
+        except ValueError:
+            pass
+        self.dtype = reader.dtype
+        self.nodata = self.dtype.type(reader.nodata if reader.nodata is not None else
+                                      self._bandinfo.get('nodata'))
+        return reader.band(bandnumber)
+
+    @staticmethod
+    def wheres_my_band(src, time, token=None):
         sec_since_1970 = datetime_to_seconds_since_1970(time)
+        return _band_time_index(src.name, token, lambda: _read_band_times(src)).nearest_band(sec_since_1970)
+
 
-        idx = 0
-        dist = float('+inf')
-        for i in range(1, src.count+1):
-            v = float(src.tags(i)[GDAL_NETCDF_TIME])
-            if abs(sec_since_1970 - v) < dist:
-                idx = i
-                dist = abs(sec_since_1970 - v)
-        return idx
+class BandTimeIndex(object):
+    """
+    Nearest-time lookup of the bands of a stacked NetCDF file
+
+    >>> index = BandTimeIndex([300., 100., 200., 100.])
+    >>> index.nearest_band(100.)
+    2
+    >>> index.nearest_band(240.)
+    3
+    >>> index.nearest_band(250.)
+    1
+    >>> index.nearest_band(1000.)
+    1
+
+    :param times: time of each band, in band order
+    """
+
+    def __init__(self, times):
+        times = numpy.asarray(times, dtype='float64')
+        # A stable sort keeps the lowest band number first amongst duplicate times
+        self._bands = numpy.argsort(times, kind='mergesort') + 1
+        self._times = times[self._bands - 1]
+
+    def __len__(self):
+        return len(self._times)
+
+    def nearest_band(self, time):
+        """
+        Band number (1-based) with the time nearest to `time`. Ties go to the lowest band number.
+        """
+        times = self._times
+        right = numpy.searchsorted(times, time, side='left')
+        if right < len(times) and times[right] == time:
+            return int(self._bands[right])
+
+        candidates = []
+        if right > 0:
+            left = numpy.searchsorted(times, times[right - 1], side='left')
+            candidates.append((time - times[left], int(self._bands[left])))
+        if right < len(times):
+            candidates.append((times[right] - time, int(self._bands[right])))
+        return min(candidates)[1] if candidates else 0
+
+
+def _open_netcdf_variable(filename_varname):
+    """
+    Open a datacube-written NetCDF storage unit variable directly with netCDF4, or return None to use GDAL.
+
+    :rtype: datacube.storage.netcdf_reader.NetCDFVariableReader
+    """
+    filename, varname = filename_varname
+    try:
+        return NetCDFVariableReader(filename, varname)
+    except (IOError, RuntimeError, ValueError) as e:
+        _LOG.debug("reading %s through GDAL: %s", filename, e)
+        return None
+
+
+_BAND_TIMES = cachetools.LRUCache(maxsize=4096)
+_BAND_TIMES_LOCK = threading.Lock()
+
+
+def _read_band_times(src):
+    """
+    Read the time (seconds since 1970) of each band of a stacked NetCDF file opened with GDAL.
+
+    Uses the time coordinate GDAL exposes in the dataset metadata, falling back to
+    reading the tags of each band for files without it.
+    """
+    values = src.tags().get(GDAL_NETCDF_TIME + '_VALUES')
+    if values:
+        times = numpy.array(values.strip('{}').split(','), dtype='float64')
+        if len(times) == src.count:
+            return times
+    return numpy.array([src.tags(i)[GDAL_NETCDF_TIME] for i in range(1, src.count + 1)], dtype='float64')
+
+
+def _band_time_index(name, token, read_times):
+    """
+    :param str name: name of the opened file/variable
+    :param token: identifies the version of the file. Only cached if not None.
+    :param read_times: function returning the time of each band
+    :rtype: BandTimeIndex
+    """
+    key = (name, token)
+    if token is not None:
+        with _BAND_TIMES_LOCK:
+            index = _BAND_TIMES.get(key)
+        if index is not None:
+            return index
+
+    index = BandTimeIndex(read_times())
+
+    if token is not None:
+        with _BAND_TIMES_LOCK:
+            _BAND_TIMES[key] = index
+    return index
 
 
 def create_netcdf_storage_unit(filename,
@@ -238,15 +386,81 @@ def create_netcdf_storage_unit(filename,
 
 
 def write_dataset_to_netcdf(access_unit, global_attributes, variable_params, filename, netcdfparams=None):
-    nco = create_netcdf_storage_unit(filename,
-                                     access_unit.crs,
-                                     access_unit.coords,
-                                     access_unit.data_vars,
-                                     variable_params,
-                                     global_attributes,
-                                     netcdfparams)
-
-    for name, variable in access_unit.data_vars.items():
-        nco[name][:] = netcdf_writer.netcdfy_data(variable.values)
-
-    nco.close()
+    """
+    Write an xarray Dataset to a new NetCDF storage unit.
+
+    The calls into netCDF4 hold the lock of :mod:`datacube.storage.netcdf_reader`, so this may run in a thread
+    alongside reads of other storage units. (Reads of NetCDF files through GDAL are not covered: they need
+    HDF5 to be built thread-safe.)
+    """
+    with NETCDF_LOCK:
+        nco = create_netcdf_storage_unit(filename,
+                                         access_unit.crs,
+                                         access_unit.coords,
+                                         access_unit.data_vars,
+                                         variable_params,
+                                         global_attributes,
+                                         netcdfparams)
+
+    try:
+        for name, variable in access_unit.data_vars.items():
+            write_variable(nco[name], variable.data)
+    finally:
+        with NETCDF_LOCK:
+            nco.close()
+
+
+def write_variable(nco_var, data, block_size=None):
+    """
+    Write an array to a NetCDF variable a block at a time, so that a dask array is never computed in full.
+
+    Blocks are aligned to the chunks of the variable, so each chunk is compressed once.
+
+    :param netCDF4.Variable nco_var: variable created by :func:`create_netcdf_storage_unit`
+    :param data: numpy or dask array, of the variable's shape
+    :param int block_size: maximum bytes per block, if not the ``write_block_size`` option
+    """
+    if not data.shape:
+        with NETCDF_LOCK:
+            nco_var[:] = netcdf_writer.netcdfy_data(numpy.asarray(data))
+        return
+
+    with NETCDF_LOCK:
+        chunking = nco_var.chunking()
+    chunks = (1,) * data.ndim if chunking == 'contiguous' else tuple(chunking[:data.ndim])
+    block_shape = write_block_shape(data.shape, chunks, data.dtype.itemsize, block_size)
+
+    for block in itertools.product(*[[slice(start, min(start + step, size)) for start in range(0, size, step)]
+                                     for size, step in zip(data.shape, block_shape)]):
+        # Compute the block before taking the lock: a dask array may need to read other files
+        values = netcdf_writer.netcdfy_data(numpy.asarray(data[block]))
+        # HDF5 compresses the block inside this call, so NetCDF reads in other threads wait for it
+        with NETCDF_LOCK:
+            nco_var[block] = values
+
+
+def write_block_shape(shape, chunks, itemsize, block_size=None):
+    """
+    The largest block made of whole chunks, grown from the last dimension first, that fits in `block_size` bytes.
+    (But never smaller than one chunk.) These are the blocks :func:`write_variable` writes.
+
+    :param int block_size: maximum bytes per block, if not the ``write_block_size`` option
+
+    >>> write_block_shape((10, 4000, 4000), (1, 200, 200), 2, 64 * 1024 * 1024)
+    (2, 4000, 4000)
+    >>> write_block_shape((10, 4000, 4000), (1, 200, 200), 2, 8 * 1024 * 1024)
+    (1, 1000, 4000)
+    >>> write_block_shape((10, 4000, 4000), (5, 200, 200), 2, 1024)
+    (5, 200, 200)
+    >>> write_block_shape((10, 100, 100), (1, 200, 200), 2, 64 * 1024 * 1024)
+    (10, 100, 100)
+    """
+    block_size = block_size or OPTIONS.get('write_block_size', 64 * 1024 * 1024)
+    block = [min(chunk, size) for chunk, size in zip(chunks, shape)]
+    for dim in reversed(range(len(shape))):
+        other_bytes = itemsize * int(numpy.prod(block)) // block[dim]
+        count = max(1, block_size // (other_bytes * block[dim]))
+        block[dim] = min(shape[dim], block[dim] * count)
+        if block[dim] < shape[dim]:
+            break
+    return tuple(block)
@@ -17,7 +17,7 @@ from ..utils import read_documents
 _LOG = logging.getLogger('task-app')
 
 
-@cachetools.cached(cache={}, key=lambda index, id_: id_)
+@cachetools.cached(cache=cachetools.LRUCache(maxsize=10000), key=lambda index, id_: id_)
 def get_full_lineage(index, id_):
     return index.datasets.get(id_, include_sources=True)
 
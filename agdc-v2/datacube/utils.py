@@ -158,6 +158,26 @@ def union_points(a, *other):
     return _ogr_to_points(_a)
 
 
+def densify_points(points, segments=8):
+    """
+    Add points along the edges of a polygon, so that its shape survives reprojection
+
+    >>> densify_points([(0, 0), (0, 2), (2, 2)], segments=2)
+    [(0.0, 0.0), (0.0, 1.0), (0.0, 2.0), (1.0, 2.0), (2.0, 2.0), (1.0, 1.0)]
+    """
+    dense = []
+    for (x0, y0), (x1, y1) in zip(points, points[1:] + points[:1]):
+        dense.extend((x0 + (x1 - x0) * i / segments, y0 + (y1 - y0) * i / segments) for i in range(segments))
+    return dense
+
+
+def buffer_points(points, distance):
+    """
+    Grow a polygon outwards by `distance` on every side
+    """
+    return _ogr_to_points(_points_to_ogr(points).Buffer(distance, 2))
+
+
 def data_resolution_and_offset(data):
     """
     >>> data_resolution_and_offset(numpy.array([1.5, 2.5, 3.5]))
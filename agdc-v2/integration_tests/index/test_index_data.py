@@ -8,11 +8,12 @@ from __future__ import absolute_import
 
 import datetime
 
+import numpy
 import pytest
 from pathlib import Path
 
 from datacube.index.exceptions import DuplicateRecordError
-from datacube.model import Dataset
+from datacube.model import Dataset, Range
 
 _telemetry_uuid = '4ec8fe97-e8b9-11e4-87ff-1040f381a756'
 _telemetry_dataset = {
@@ -191,3 +192,97 @@ def test_index_dataset_with_location(index, default_metadata_type):
     assert locations == [second_file.as_uri(), first_file.as_uri()]
     # And the second one is newer, so it should be returned as the default local path:
     assert stored.local_path == Path(second_file)
+
+
+def test_index_many_datasets(index, default_metadata_type):
+    """
+    :type index: datacube.index._api.Index
+    """
+    type_ = index.datasets.types.add_document(_pseudo_telemetry_dataset_type)
+    second_uuid = '4ec8fe97-e8b9-11e4-87ff-1040f381a757'
+    first = Dataset(type_, _telemetry_dataset, Path('/tmp/first/something.yaml').absolute().as_uri())
+    second = Dataset(type_, dict(_telemetry_dataset, id=second_uuid),
+                     Path('/tmp/second/something.yaml').absolute().as_uri(), sources={'raw': first})
+
+    results = list(index.datasets.add_many([first, second], batch_size=1))
+    assert [(result.dataset.id, result.status) for result in results] == [(_telemetry_uuid, 'added'),
+                                                                         (second_uuid, 'added')]
+    stored = index.datasets.get(second_uuid, include_sources=True)
+    assert stored.sources['raw'].id == _telemetry_uuid
+    assert stored.local_uri == second.local_uri
+
+    # Adding them again only adds the new location.
+    second.local_uri = Path('/tmp/third/something.yaml').absolute().as_uri()
+    results = list(index.datasets.add_many([first, second]))
+    assert [result.status for result in results] == ['existing', 'existing']
+    assert len(index.datasets.get_locations(second)) == 2
+
+    # A changed document is reported, without failing the rest of the batch.
+    changed = Dataset(type_, dict(_telemetry_dataset, ga_level='P01'), None)
+    third = Dataset(type_, dict(_telemetry_dataset, id='4ec8fe97-e8b9-11e4-87ff-1040f381a758'), None)
+    results = list(index.datasets.add_many([changed, third], skip_sources=True))
+    assert [result.status for result in results] == ['failed', 'added']
+    assert isinstance(results[0].error, ValueError)
+    assert index.datasets.get(_telemetry_uuid).metadata_doc['ga_level'] == 'P00'
+
+    # ... nor is a new location recorded for it.
+    changed.local_uri = Path('/tmp/changed/something.yaml').absolute().as_uri()
+    results = list(index.datasets.add_many([changed], skip_sources=True))
+    assert [result.status for result in results] == ['failed']
+    assert changed.local_uri not in index.datasets.get_locations(changed)
+
+    # A dataset that disagrees with an earlier one of the same id in the batch fails on its own.
+    fourth_uuid = '4ec8fe97-e8b9-11e4-87ff-1040f381a759'
+    fourth = Dataset(type_, dict(_telemetry_dataset, id=fourth_uuid), None)
+    fourth_changed = Dataset(type_, dict(_telemetry_dataset, id=fourth_uuid, ga_level='P01'), None)
+    results = list(index.datasets.add_many([fourth, fourth_changed], skip_sources=True))
+    assert [result.status for result in results] == ['added', 'failed']
+    assert index.datasets.get(fourth_uuid).metadata_doc['ga_level'] == 'P00'
+
+
+def test_get_many_datasets(index, default_metadata_type):
+    """
+    :type index: datacube.index._api.Index
+    """
+    type_ = index.datasets.types.add_document(_pseudo_telemetry_dataset_type)
+    raw = Dataset(type_, _telemetry_dataset, None)
+    derived = [Dataset(type_, dict(_telemetry_dataset, id=id_), None, sources={'raw': raw})
+               for id_ in ('4ec8fe97-e8b9-11e4-87ff-1040f381a757', '4ec8fe97-e8b9-11e4-87ff-1040f381a758')]
+    for dataset in derived:
+        index.datasets.add(dataset)
+    missing = '4ec8fe97-e8b9-11e4-87ff-1040f381a759'
+
+    found = index.datasets.get_many([derived[1].id, missing, derived[0].id.upper()])
+    assert [dataset.id for dataset in found] == [derived[1].id, derived[0].id]
+    assert not found[0].sources
+
+    found = index.datasets.get_many([derived[1].id, missing, derived[0].id, raw.id], include_sources=True)
+    assert [dataset.id for dataset in found] == [derived[1].id, derived[0].id, raw.id]
+    # The shared source is fetched once
+    assert found[0].sources['raw'] is found[1].sources['raw'] is found[2]
+    assert found[0].metadata_doc['lineage']['source_datasets']['raw']['id'] == raw.id
+
+
+def test_ingestion_ledger(index, default_metadata_type):
+    """
+    :type index: datacube.index._api.Index
+    """
+    type_ = index.datasets.types.add_document(_pseudo_telemetry_dataset_type)
+    before = index.ingestion.now()
+    index.datasets.add(Dataset(type_, _telemetry_dataset, None))
+
+    assert index.datasets.count(product=type_.name, added=Range(before, None)) == 1
+    assert index.datasets.count(product=type_.name, added=Range(None, before)) == 0
+
+    assert index.ingestion.get_mark(type_) is None
+    index.ingestion.set_mark(type_, before)
+    assert index.ingestion.get_mark(type_) == before
+
+    time = numpy.datetime64('2014-07-26T23:49:00.343853', 'ns')
+    index.ingestion.record(type_, [((15, -40, time), [_telemetry_uuid])])
+    # Recording a tile again is harmless
+    index.ingestion.record(type_, [((15, -40, time), [_telemetry_uuid])])
+
+    assert index.ingestion.get_tiles(type_, time, time) == {(15, -40, time)}
+    later = time + numpy.timedelta64(1, 's')
+    assert index.ingestion.get_tiles(type_, later, later) == set()
@@ -14,8 +14,9 @@ from click.testing import CliRunner
 from dateutil import tz
 from pathlib import Path
 
+import datacube
 import datacube.scripts.search_tool
-from datacube.model import Range
+from datacube.model import Range, GeoPolygon, CRS
 
 _EXAMPLE_LS7_NBAR_DATASET_FILE = Path(__file__).parent.joinpath('ls7-nbar-example.yaml')
 
@@ -182,6 +183,51 @@ def test_search_dataset_ranges(index, pseudo_telemetry_dataset):
     assert datasets[0].id == pseudo_telemetry_dataset.id
 
 
+def test_search_dataset_footprint(index, pseudo_telemetry_dataset):
+    """
+    :type index: datacube.index._api.Index
+    :type pseudo_telemetry_dataset: datacube.model.Dataset
+    """
+    wgs84 = CRS('EPSG:4326')
+
+    # Inside the footprint.
+    datasets = index.datasets.search_eager(
+        geopolygon=GeoPolygon([(150, -29.5), (151, -29.5), (151, -30), (150, -30)], wgs84)
+    )
+    assert len(datasets) == 1
+    assert datasets[0].id == pseudo_telemetry_dataset.id
+
+    # Overlaps the bounding box of the footprint, but not the footprint itself.
+    datasets = index.datasets.search_eager(
+        geopolygon=GeoPolygon([(148, -28), (150, -28), (148, -30)], wgs84)
+    )
+    assert len(datasets) == 0
+
+    # Combined with other fields.
+    assert index.datasets.count(
+        platform='LANDSAT_8',
+        geopolygon=GeoPolygon([(150, -29.5), (151, -29.5), (151, -30), (150, -30)], wgs84)
+    ) == 1
+
+
+def test_search_for_load(index, pseudo_telemetry_dataset):
+    """
+    :type index: datacube.index._api.Index
+    :type pseudo_telemetry_dataset: datacube.model.Dataset
+    """
+    datasets = list(index.datasets.search_for_load(platform='LANDSAT_8'))
+    assert len(datasets) == 1
+    dataset = datasets[0]
+    assert dataset.id == pseudo_telemetry_dataset.id
+    assert dataset.type == pseudo_telemetry_dataset.type
+    assert dataset.format == pseudo_telemetry_dataset.format
+    assert dataset.center_time == pseudo_telemetry_dataset.center_time
+
+    # Only the parts needed for loading were fetched.
+    assert 'ga_label' not in dataset.metadata_doc
+    assert dataset.sources == {}
+
+
 def test_search_globally(index, pseudo_telemetry_dataset):
     """
     :type index: datacube.index._api.Index
@@ -283,6 +329,42 @@ def test_search_special_fields(index, pseudo_telemetry_type, pseudo_telemetry_da
     assert len(datasets) == 0
 
 
+def test_search_streaming(index, db, pseudo_telemetry_type, pseudo_telemetry_dataset):
+    """
+    :type index: datacube.index._api.Index
+    :type db: datacube.index.postgres._api.PostgresDb
+    """
+    ids = {pseudo_telemetry_dataset.id}
+    for _ in range(4):
+        id_ = str(uuid.uuid4())
+        assert db.insert_dataset(
+            {'id': id_, 'product_type': 'pseudo_telemetry_data', 'platform': {'code': 'LANDSAT_8'},
+             'instrument': {'name': 'OLI_TIRS'}, 'format': {'name': 'PSEUDOMD'}},
+            id_,
+            pseudo_telemetry_type.id
+        )
+        ids.add(id_)
+
+    with datacube.set_options(search_fetch_size=0):
+        assert {d.id for d in index.datasets.search(platform='LANDSAT_8')} == ids
+
+    # Fetched from a server-side cursor, in several round trips.
+    with datacube.set_options(search_fetch_size=2):
+        assert {d.id for d in index.datasets.search(platform='LANDSAT_8')} == ids
+
+        # Abandoning a search part-way releases its connection and cursor.
+        results = index.datasets.search(platform='LANDSAT_8')
+        next(results)
+        results.close()
+        assert index.datasets.count(platform='LANDSAT_8') == len(ids)
+
+        # Within a transaction, uncommitted datasets are streamed too.
+        with db.begin() as transaction:
+            id_ = str(uuid.uuid4())
+            transaction.insert_dataset({'id': id_, 'platform': {'code': 'LANDSAT_8'}}, id_, pseudo_telemetry_type.id)
+            assert len(list(transaction.search_datasets([]))) == len(ids) + 1
+
+
 def test_search_conflicting_types(index, pseudo_telemetry_dataset, pseudo_telemetry_type):
     # Should return no results.
     datasets = index.datasets.search_eager(
@@ -0,0 +1,88 @@
+from __future__ import absolute_import, division, print_function
+
+from collections import namedtuple
+
+import numpy
+import xarray
+from affine import Affine
+from rasterio.coords import BoundingBox
+
+from datacube.api.core import _calculate_chunk_sizes, _make_dask_array, _nodata_block, _fuse_lazy_block
+from datacube.model import GeoBox, GridSpec, GeoPolygon, CRS
+
+FakeDataset = namedtuple('FakeDataset', ['type'])
+FootprintDataset = namedtuple('FootprintDataset', ['id', 'type', 'extent'])
+
+
+class FakeDatasetType(object):
+    def __init__(self, name, definition, grid_spec):
+        self.name = name
+        self.definition = definition
+        self.grid_spec = grid_spec
+
+
+def _sources(dataset_type, count):
+    data = numpy.empty(count, dtype=object)
+    for index in range(count):
+        data[index] = (FakeDataset(dataset_type),)
+    return xarray.DataArray(data, dims=['time'], coords=[numpy.arange(count)])
+
+
+def test_auto_chunks_follow_storage_chunking():
+    grid_spec = GridSpec(crs=CRS('EPSG:3577'), tile_size=(100000., 100000.), resolution=(-25., 25.))
+    dataset_type = FakeDatasetType('ls8_nbar_albers',
+                                   {'storage': {'chunking': {'time': 5, 'x': 200, 'y': 200}}},
+                                   grid_spec)
+    sources = _sources(dataset_type, 12)
+
+    # 50 pixels right of and 30 pixels below a chunk boundary
+    geobox = GeoBox(500, 400, Affine(25., 0., 1500000. + 50 * 25, 0., -25., -3900000. - 30 * 25), CRS('EPSG:3577'))
+
+    irr_chunks, grid_chunks = _calculate_chunk_sizes(sources, geobox, 'auto')
+    assert irr_chunks == ((5, 5, 2),)
+    assert grid_chunks == ((170, 200, 30), (150, 200, 150))
+
+    # Explicit chunks are not aligned
+    irr_chunks, grid_chunks = _calculate_chunk_sizes(sources, geobox, {'x': 200, 'y': 200})
+    assert irr_chunks == ((12,),)
+    assert grid_chunks == ((200, 200), (200, 200, 100))
+
+
+def test_auto_chunks_without_storage_chunking():
+    sources = _sources(FakeDatasetType('ls8_level1', {}, None), 3)
+    geobox = GeoBox(500, 400, Affine(25., 0., 1500000., 0., -25., -3900000.), CRS('EPSG:3577'))
+
+    irr_chunks, grid_chunks = _calculate_chunk_sizes(sources, geobox, 'auto')
+    assert irr_chunks == ((3,),)
+    assert grid_chunks == ((400,), (500,))
+
+
+def test_dask_chunks_without_overlapping_datasets_do_no_io():
+    crs = CRS('EPSG:3577')
+    dataset_type = FakeDatasetType('ls8_nbar_albers', {}, None)
+    # Two scenes covering the top-left and bottom-right quarters of the geobox
+    top_left = FootprintDataset(1, dataset_type, GeoPolygon.from_boundingbox(
+        BoundingBox(1500000., -3902500., 1502500., -3900000.), crs))
+    bottom_right = FootprintDataset(2, dataset_type, GeoPolygon.from_boundingbox(
+        BoundingBox(1502500., -3905000., 1505000., -3902500.), crs))
+
+    data = numpy.empty(2, dtype=object)
+    data[0] = (top_left,)
+    data[1] = (top_left, bottom_right)
+    sources = xarray.DataArray(data, dims=['time'], coords=[numpy.arange(2)])
+
+    geobox = GeoBox(200, 200, Affine(25., 0., 1500000., 0., -25., -3900000.), crs)
+    measurement = {'name': 'red', 'dtype': 'int16', 'nodata': -999}
+    array = _make_dask_array(sources, geobox, measurement, dask_chunks={'time': 1, 'x': 100, 'y': 100})
+
+    name = array.name
+    tasks = {key: task for key, task in array.dask.items() if key[0] == name}
+    assert len(tasks) == 8
+
+    assert tasks[(name, 0, 0, 0)][0] is _fuse_lazy_block
+    assert tasks[(name, 0, 1, 1)][0] is _nodata_block
+    assert tasks[(name, 1, 1, 1)][0] is _fuse_lazy_block
+    assert tasks[(name, 1, 0, 1)][0] is _nodata_block
+    assert tasks[(name, 1, 1, 1)][1][0] == (bottom_right,)
+
+    assert (array[:, 100:, 100:][0].compute() == -999).all()
@@ -0,0 +1,122 @@
+# coding=utf-8
+"""
+Module
+"""
+from __future__ import absolute_import
+
+from collections import namedtuple
+
+from datacube.index._datasets import _Catalogue, _ProductMatcher
+from datacube.model import DatasetType, MetadataType
+from datacube.options import set_options
+
+_Record = namedtuple('_Record', ['id', 'name'])
+
+
+class _Table(object):
+    def __init__(self, *records):
+        self.records = list(records)
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+        return list(self.records)
+
+
+def test_catalogue_is_cached_until_invalidated():
+    table = _Table(_Record(1, 'ls5_nbar'), _Record(2, 'ls7_nbar'))
+    catalogue = _Catalogue(table.load)
+
+    with set_options(catalogue_cache_ttl=None):
+        assert [record.name for record in catalogue.all()] == ['ls5_nbar', 'ls7_nbar']
+        assert catalogue.get(2).name == 'ls7_nbar'
+        assert catalogue.get_by_name('ls5_nbar').id == 1
+        assert table.loads == 1
+
+        table.records.append(_Record(3, 'ls8_nbar'))
+        assert len(catalogue.all()) == 2
+        catalogue.invalidate()
+        assert len(catalogue.all()) == 3
+        assert table.loads == 2
+
+
+def test_catalogue_reloads_on_unknown_keys():
+    table = _Table(_Record(1, 'ls5_nbar'))
+    catalogue = _Catalogue(table.load)
+
+    with set_options(catalogue_cache_ttl=None):
+        assert catalogue.get_by_name('ls5_nbar').id == 1
+        # Added by another process
+        table.records.append(_Record(2, 'ls7_nbar'))
+        assert catalogue.get_by_name('ls7_nbar').id == 2
+        assert catalogue.get(3) is None
+        assert table.loads == 3
+
+
+def test_catalogue_expires():
+    table = _Table(_Record(1, 'ls5_nbar'))
+    catalogue = _Catalogue(table.load)
+
+    with set_options(catalogue_cache_ttl=0):
+        catalogue.all()
+        catalogue.all()
+        assert table.loads == 2
+
+
+class _EqualsExpression(object):
+    evaluations = 0
+
+    def __init__(self, offset, value):
+        self.offset = offset
+        self.value = value
+
+    def evaluate(self, doc):
+        _EqualsExpression.evaluations += 1
+        for key in self.offset:
+            doc = doc[key]
+        return doc == self.value
+
+
+class _DocField(object):
+    def __init__(self, *offset):
+        self.offset = offset
+
+    def __eq__(self, value):
+        return _EqualsExpression(self.offset, value)
+
+
+_EO = MetadataType('eo', {}, {'platform': _DocField('platform', 'code'),
+                              'product_type': _DocField('product_type'),
+                              'cloud_cover': _DocField('cloud_cover')})
+_TELEMETRY = MetadataType('telemetry', {}, {'platform': _DocField('platform', 'code')})
+
+
+def _product(id_, name, metadata_type, metadata):
+    return DatasetType(metadata_type, {'name': name, 'metadata': metadata}, id_=id_)
+
+
+def test_product_matcher():
+    ls5 = _product(1, 'ls5_nbar', _EO, {'platform': {'code': 'LANDSAT_5'}, 'product_type': 'nbar'})
+    ls7 = _product(2, 'ls7_nbar', _EO, {'platform': {'code': 'LANDSAT_7'}, 'product_type': 'nbar'})
+    ls7_pq = _product(3, 'ls7_pq', _EO, {'platform': {'code': 'LANDSAT_7'}, 'product_type': 'pqa'})
+    raw = _product(4, 'ls7_raw', _TELEMETRY, {'platform': {'code': 'LANDSAT_7'}})
+    matcher = _ProductMatcher([ls5, ls7, ls7_pq, raw])
+
+    def search(**query):
+        return [(type_.name, remaining) for type_, remaining in matcher.search(query)]
+
+    assert search(platform='LANDSAT_7') == [('ls7_nbar', {}), ('ls7_pq', {}), ('ls7_raw', {})]
+    assert search(platform='LANDSAT_7', product_type='nbar') == [('ls7_nbar', {})]
+    assert search(platform=['LANDSAT_5', 'LANDSAT_7'], product_type='nbar') == [('ls5_nbar', {}), ('ls7_nbar', {})]
+    assert search(product='ls7_pq', platform='LANDSAT_7') == [('ls7_pq', {})]
+    assert search(metadata_type='telemetry') == [('ls7_raw', {})]
+    assert search(product='ls7_pq', metadata_type='telemetry') == []
+    # Dataset-level fields are left for the dataset search, and rule out products without them.
+    assert search(platform='LANDSAT_7', cloud_cover=10) == [('ls7_nbar', {'cloud_cover': 10}),
+                                                           ('ls7_pq', {'cloud_cover': 10})]
+    assert search(instrument='TM') == []
+
+    # Repeated terms aren't evaluated again
+    evaluations = _EqualsExpression.evaluations
+    assert search(platform='LANDSAT_7', product_type='nbar') == [('ls7_nbar', {})]
+    assert _EqualsExpression.evaluations == evaluations
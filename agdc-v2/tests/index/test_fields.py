@@ -4,8 +4,12 @@ Module
 """
 from __future__ import absolute_import
 
-from datacube.index.postgres._fields import SimpleDocField, NumericRangeDocField, parse_fields
+from rasterio.coords import BoundingBox
+
+from datacube.index.postgres._fields import SimpleDocField, NumericRangeDocField, FootprintField, parse_fields
 from datacube.index.postgres.tables import DATASET
+from datacube.model import GeoPolygon, CRS
+from datacube.utils import densify_points, _points_to_ogr
 
 
 def _assert_same(obj1, obj2):
@@ -51,3 +55,15 @@ def test_get_field():
             min_offset=[['extents', 'geospatial_lat_min']],
         )
     )
+
+
+def test_footprint_search_covers_projected_polygon():
+    albers = CRS('EPSG:3577')
+    cell = GeoPolygon.from_boundingbox(BoundingBox(1500000, -4000000, 1600000, -3900000), albers)
+
+    field = FootprintField('footprint', 'Dataset footprint', None, DATASET.c.footprint)
+    searched = _points_to_ogr(field.intersects(cell).points)
+
+    # The cell's edges are curves in lat/lon: none of them may fall outside the searched polygon.
+    exact = GeoPolygon(densify_points(cell.points, segments=100), albers).to_crs(CRS('EPSG:4326'))
+    assert searched.Contains(_points_to_ogr(exact.points))
@@ -0,0 +1,61 @@
+# coding=utf-8
+"""
+Module
+"""
+from __future__ import absolute_import
+
+import pickle
+
+import yaml
+
+from datacube.model import DatasetType, MetadataType
+from datacube.scripts.dataset import _init_match_worker, _match_path, _worker_rules, _dataset_from_tree, \
+    _match_datasets, IndexProgress
+
+_METADATA_TYPE = MetadataType('test', {'id': ['id'], 'sources': ['lineage', 'source_datasets']}, {})
+_LEVEL1 = DatasetType(_METADATA_TYPE, {'name': 'level1', 'metadata': {'product_type': 'level1'}})
+_NBAR = DatasetType(_METADATA_TYPE, {'name': 'nbar', 'metadata': {'product_type': 'nbar'}})
+
+
+def test_match_datasets_in_worker(tmpdir):
+    level1_doc = {'id': '4ec8fe97-e8b9-11e4-87ff-1040f381a756', 'product_type': 'level1',
+                  'lineage': {'source_datasets': {}}}
+    nbar_doc = {'id': '4ec8fe97-e8b9-11e4-87ff-1040f381a757', 'product_type': 'nbar',
+                'lineage': {'source_datasets': {'level1': level1_doc}}}
+    dataset_file = tmpdir.join('agdc-metadata.yaml')
+    dataset_file.write(yaml.safe_dump(nbar_doc))
+
+    rules = [{'type': type_, 'metadata': type_.metadata_doc} for type_ in (_LEVEL1, _NBAR)]
+    _init_match_worker(pickle.loads(pickle.dumps(_worker_rules(rules))))
+
+    path, trees, error = _match_path(str(tmpdir))
+    assert path == str(tmpdir)
+    assert error is None
+    assert len(trees) == 1
+
+    dataset = _dataset_from_tree(pickle.loads(pickle.dumps(trees[0])), {'level1': _LEVEL1, 'nbar': _NBAR})
+    assert dataset.type is _NBAR
+    assert dataset.id == nbar_doc['id']
+    assert dataset.local_uri == 'file://' + str(dataset_file)
+    assert dataset.sources['level1'].type is _LEVEL1
+    assert dataset.sources['level1'].id == level1_doc['id']
+
+
+def test_match_unreadable_path_in_worker(tmpdir):
+    _init_match_worker([])
+    path, trees, error = _match_path(str(tmpdir))
+    assert trees == []
+    assert 'No metadata found' in error
+
+
+def test_match_skips_unreadable_path(tmpdir):
+    level1_doc = {'id': '4ec8fe97-e8b9-11e4-87ff-1040f381a756', 'product_type': 'level1',
+                  'lineage': {'source_datasets': {}}}
+    empty, dataset_dir = tmpdir.mkdir('empty'), tmpdir.mkdir('level1')
+    dataset_dir.join('agdc-metadata.yaml').write(yaml.safe_dump(level1_doc))
+
+    progress = IndexProgress()
+    rules = [{'type': _LEVEL1, 'metadata': _LEVEL1.metadata_doc}]
+    datasets = list(_match_datasets([str(empty), str(dataset_dir)], rules, progress))
+    assert [dataset.id for dataset in datasets] == [level1_doc['id']]
+    assert progress.counts['failed'] == 1
@@ -0,0 +1,202 @@
+# coding=utf-8
+"""
+Module
+"""
+from __future__ import absolute_import
+
+import threading
+import uuid
+from collections import namedtuple
+
+import numpy
+import pytest
+import xarray
+from pathlib import Path
+
+import datacube
+from datacube.scripts import ingest
+from datacube.scripts.ingest import _TileWriter, TaskJournal, get_dask_chunks, _start_task
+
+_Data = namedtuple('_Data', ['nbytes'])
+_GeoBox = namedtuple('_GeoBox', ['dimensions', 'shape'])
+_Dataset = namedtuple('_Dataset', ['id'])
+
+
+class _Datasets(object):
+    def __init__(self, ids):
+        self.ids = ids
+        self.archived = []
+
+    def get_many(self, ids):
+        return [_Dataset(str(id_).upper()) for id_ in ids if str(id_) in self.ids]
+
+    def archive(self, ids):
+        self.archived.extend(ids)
+
+
+class _Ingestion(object):
+    def __init__(self):
+        self.recorded = []
+
+    def record(self, output_type, tiles):
+        self.recorded.extend(tiles)
+
+
+class _Index(object):
+    def __init__(self, dataset_ids):
+        self.datasets = _Datasets(dataset_ids)
+        self.ingestion = _Ingestion()
+
+
+def test_tile_writer_memory_ceiling():
+    written = []
+    release = threading.Event()
+
+    def write(data, path):
+        release.wait(5)
+        written.append(path)
+
+    writer = _TileWriter(write, queue_size=4, max_bytes=100)
+    # A tile is always let through, even if it doesn't fit
+    writer.put((0, 0), _Data(150), 'first.nc')
+
+    second = threading.Thread(target=writer.put, args=((1, 0), _Data(60), 'second.nc'))
+    second.start()
+    second.join(0.2)
+    assert second.is_alive()
+
+    release.set()
+    second.join(5)
+    assert not second.is_alive()
+    writer.close()
+    assert written == ['first.nc', 'second.nc']
+
+
+def test_tile_writer_errors():
+    timings = {}
+
+    def write(data, path):
+        if path == 'bad.nc':
+            raise IOError('disk full')
+
+    writer = _TileWriter(write, queue_size=1, timings=timings)
+    for key, path in [((0, 0), 'good.nc'), ((1, 0), 'bad.nc'), ((2, 0), 'good.nc')]:
+        writer.put(key, _Data(10), path)
+    writer.close()
+
+    assert list(writer.errors) == [(1, 0)]
+    assert isinstance(writer.errors[(1, 0)], IOError)
+    assert timings['write'] >= 0
+
+
+def test_task_journal_resume(tmpdir):
+    path = str(tmpdir.join('tasks.bin.journal'))
+    time = numpy.datetime64('2016-01-02T03:04:05', 'ns')
+    done, failed, started = (15, -40, time), (16, -40, time), (17, -40, time)
+
+    with TaskJournal(path) as journal:
+        for tile in (done, failed, started):
+            journal.started(tile, '/tmp/%d.nc' % tile[0])
+        journal.done(done)
+        journal.failed(failed, IOError('disk full'))
+        assert journal.status(done) == 'done'
+    # The run died while writing an entry
+    with open(path, 'a') as stream:
+        stream.write('{"tile": [17, ')
+
+    with TaskJournal(path, resume=True) as journal:
+        assert journal.status(done) == 'done'
+        assert journal.status(failed) == 'failed'
+        assert journal.status(started) == 'started'
+        assert journal.status((18, -40, time)) is None
+        journal.done(failed)
+
+    with TaskJournal(path, resume=True) as journal:
+        assert journal.status(failed) == 'done'
+
+    # Overwriting it starts again
+    with TaskJournal(path, overwrite=True) as journal:
+        assert journal.status(done) is None
+    with TaskJournal(path, resume=True) as journal:
+        assert journal.status(done) is None
+
+
+def test_task_journal_datasets(tmpdir):
+    path = str(tmpdir.join('tasks.bin.journal'))
+    tile = (15, -40, numpy.datetime64('2016-01-02T03:04:05', 'ns'))
+    dataset_id = uuid.UUID('4ec8fe97-e8b9-11e4-87ff-1040f381a756')
+
+    with TaskJournal(path) as journal:
+        journal.started(tile, '/tmp/15.nc')
+        assert journal.datasets(tile) == []
+        journal.indexing(tile, [dataset_id])
+        journal.failed(tile, ValueError('could not record tile'))
+
+    with TaskJournal(path, resume=True) as journal:
+        assert journal.status(tile) == 'failed'
+        assert journal.datasets(tile) == [str(dataset_id)]
+        # Starting the tile again forgets its datasets
+        journal.started(tile, '/tmp/15.nc')
+        assert journal.datasets(tile) == []
+
+    # Without a path, progress is only kept in memory
+    with TaskJournal(None) as journal:
+        journal.started(tile, '/tmp/15.nc')
+        journal.indexing(tile, [dataset_id])
+        journal.indexed(tile)
+        assert journal.status(tile) == 'indexed'
+        assert journal.datasets(tile) == [str(dataset_id)]
+
+
+def test_task_journal_keeps_earlier_run(tmpdir):
+    path = str(tmpdir.join('tasks.bin.journal'))
+    tile = (15, -40, numpy.datetime64('2016-01-02T03:04:05', 'ns'))
+    with TaskJournal(path) as journal:
+        journal.started(tile, '/tmp/15.nc')
+
+    with pytest.raises(ValueError):
+        TaskJournal(path)
+    with TaskJournal(path, overwrite=True) as journal:
+        assert journal.status(tile) is None
+
+
+def test_start_task_after_indexing(tmpdir, monkeypatch):
+    output = tmpdir.join('15.nc')
+    monkeypatch.setattr(ingest, 'get_filename', lambda config, tile_index, sources: Path(str(output)))
+    first, second = str(uuid.uuid4()), str(uuid.uuid4())
+    tile = (15, -40, numpy.datetime64('2016-01-02T03:04:05', 'ns'))
+    sources = xarray.DataArray(numpy.empty(1, dtype=object), dims=['time'])
+    sources.values[0] = (_Dataset('source'),)
+    task = {'index': tile, 'sources': sources}
+
+    # The run died after indexing all the tile's datasets: its output is kept
+    output.write('data')
+    journal = TaskJournal(None)
+    journal.started(tile, str(output))
+    journal.indexing(tile, [first, second])
+    journal.failed(tile, IOError('lost connection'))
+    index = _Index([first, second])
+    assert not _start_task(index, {}, None, journal, task)
+    assert journal.status(tile) == 'done'
+    assert index.ingestion.recorded == [(tile, ['source'])]
+    assert output.exists()
+
+    # Only some were indexed: they are archived, and the output is removed
+    journal.started(tile, str(output))
+    journal.indexing(tile, [first, second])
+    index = _Index([first])
+    assert _start_task(index, {}, None, journal, task)
+    assert index.datasets.archived == [first]
+    assert not output.exists()
+    assert journal.status(tile) == 'started'
+
+
+def test_dask_chunks_match_write_blocks():
+    config = {'storage': {'chunking': {'time': 1, 'y': 200, 'x': 200}}}
+    sources = xarray.DataArray(numpy.empty(10, dtype=object), dims=['time'])
+    geobox = _GeoBox(dimensions=('y', 'x'), shape=(4000, 4000))
+
+    # Blocks are sized for the largest dtype
+    with datacube.set_options(write_block_size=8 * 1024 * 1024):
+        chunks = get_dask_chunks(config, [{'dtype': 'uint8'}, {'dtype': 'int16'}], sources, geobox)
+    assert chunks == {'time': 1, 'y': 1000, 'x': 4000}
@@ -15,14 +15,26 @@
 
 from __future__ import absolute_import, division, print_function
 
+import timeit
+from contextlib import contextmanager
+from datetime import datetime
+
 import numpy
+import pytest
 import netCDF4
+import rasterio
 from pathlib import Path
 from affine import Affine
 import xarray
+import dask.array
 
+import datacube
 from datacube.model import GeoBox, CRS
-from datacube.storage.storage import write_dataset_to_netcdf
+from datacube.storage.file_cache import FileHandleCache, file_token
+from datacube.storage.storage import write_dataset_to_netcdf, fuse_sources, DatasetSource
+from datacube.storage.storage import BandTimeIndex, GDAL_NETCDF_TIME
+from datacube.storage.netcdf_reader import NetCDFVariableReader
+from datacube.utils import datetime_to_seconds_since_1970
 
 
 GEO_PROJ = 'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,AUTHORITY["EPSG","7030"]],' \
@@ -54,3 +66,187 @@ def test_write_dataset_to_netcdf(tmpnetcdf_filename):
 
         assert 'abc' in var.ncattrs()
         assert var.getncattr('abc') == 'xyz'
+
+
+def test_write_dask_dataset_to_netcdf_in_blocks(tmpnetcdf_filename):
+    affine = Affine.scale(0.1, 0.1)*Affine.translation(20, 30)
+    geobox = GeoBox(100, 80, affine, CRS(GEO_PROJ))
+    dataset = xarray.Dataset(attrs={'extent': geobox.extent, 'crs': geobox.crs})
+    dataset['time'] = ('time', numpy.arange(4, dtype='float64'), {'units': 'seconds since 1970-01-01 00:00:00'})
+    for name, coord in geobox.coordinates.items():
+        dataset[name] = (name, coord.values, {'units': coord.units, 'crs': geobox.crs})
+
+    data = numpy.arange(4 * 80 * 100, dtype='int16').reshape((4, 80, 100))
+    lazy = dask.array.from_array(data, chunks=(2, 50, 50))
+    dataset['B10'] = (('time',) + geobox.dimensions, lazy, {'nodata': -999, 'units': '1', 'crs': geobox.crs})
+
+    # Room for two (1, 32, 32) chunks at a time, so blocks overlap several dask chunks and end at the edges
+    with datacube.set_options(write_block_size=2 * 32 * 32 * 2):
+        write_dataset_to_netcdf(dataset, {}, {'B10': {'zlib': True, 'chunksizes': (1, 32, 32)}},
+                                Path(tmpnetcdf_filename))
+
+    with netCDF4.Dataset(tmpnetcdf_filename) as nco:
+        nco.set_auto_mask(False)
+        assert (nco.variables['B10'][:] == data).all()
+
+
+class GeoTiffSource(object):
+    def __init__(self, filename, transform, crs, nodata):
+        self.filename = filename
+        self.transform = transform
+        self.crs = crs
+        self.nodata = nodata
+
+    @contextmanager
+    def open(self):
+        with rasterio.open(self.filename) as src:
+            yield rasterio.band(src, 1)
+
+
+def _write_geotiff_stack(tmpdir, count, shape=(100, 100), nodata=-999):
+    affine = Affine.translation(20, 30) * Affine.scale(0.1, -0.1)
+    sources = []
+    for index in range(count):
+        data = numpy.full(shape, nodata, dtype='int16')
+        # each source only partially covers the destination, overlapping its neighbours
+        data[index * 10:index * 10 + 40, :] = index + 1
+        filename = str(tmpdir.join('source_%d.tif' % index))
+        with rasterio.open(filename, 'w', driver='GTiff', width=shape[1], height=shape[0], count=1,
+                           dtype=data.dtype.name, crs=GEO_PROJ, transform=affine, nodata=nodata) as dst:
+            dst.write(data, 1)
+        sources.append(GeoTiffSource(filename, affine, CRS(GEO_PROJ), nodata))
+    return sources, affine
+
+
+def test_fuse_sources_threaded_matches_serial(tmpdir):
+    sources, affine = _write_geotiff_stack(tmpdir, 6)
+
+    serial = numpy.empty((100, 100), dtype='int16')
+    fuse_sources(sources, serial, affine, CRS(GEO_PROJ), -999)
+
+    with datacube.set_options(fuse_threads=4):
+        threaded = numpy.empty((100, 100), dtype='int16')
+        fuse_sources(sources, threaded, affine, CRS(GEO_PROJ), -999)
+
+    assert (serial == threaded).all()
+    # sources are fused in order, so the last source to cover a pixel wins
+    assert serial[0, 0] == 1
+    assert serial[55, 0] == 6
+    assert serial[95, 0] == -999
+
+
+def test_file_handle_cache_reuses_handles(tmpdir):
+    sources, _ = _write_geotiff_stack(tmpdir, 3)
+    cache = FileHandleCache(maxsize=2)
+
+    for _ in range(3):
+        for source in sources[:2]:
+            with cache.open(source.filename, file_token(source.filename)) as src:
+                assert src.count == 1
+    info = cache.info()
+    assert (info.hits, info.misses, info.currsize) == (4, 2, 2)
+
+    # Opening a third file evicts the least recently used handle
+    with cache.open(sources[2].filename, file_token(sources[2].filename)):
+        pass
+    with cache.open(sources[0].filename, file_token(sources[0].filename)):
+        pass
+    info = cache.info()
+    assert (info.hits, info.misses, info.currsize) == (4, 4, 2)
+
+    # Nested opens of the same file never share a handle
+    with cache.open(sources[1].filename) as first:
+        with cache.open(sources[1].filename) as second:
+            assert first is not second
+
+    cache.clear()
+    assert cache.info() == (0, 0, 2, 0)
+
+
+class FakeNetCDFBands(object):
+    def __init__(self, times, with_time_values=True):
+        self.name = 'NetCDF:fake.nc:band'
+        self.count = len(times)
+        self.times = times
+        self.with_time_values = with_time_values
+        self.tag_reads = 0
+
+    def tags(self, bidx=0):
+        self.tag_reads += 1
+        if bidx == 0:
+            if not self.with_time_values:
+                return {}
+            return {GDAL_NETCDF_TIME + '_VALUES': '{%s}' % ','.join(str(t) for t in self.times)}
+        return {GDAL_NETCDF_TIME: str(self.times[bidx - 1])}
+
+
+@pytest.mark.parametrize('with_time_values', [True, False])
+def test_wheres_my_band(with_time_values):
+    src = FakeNetCDFBands([0.0, 100.0, 200.0, 200.0, 300.0], with_time_values)
+
+    assert DatasetSource.wheres_my_band(src, datetime.utcfromtimestamp(100), token='v1') == 2
+    tag_reads = src.tag_reads
+    assert tag_reads == (1 if with_time_values else 6)
+    # duplicate times resolve to the first band
+    assert DatasetSource.wheres_my_band(src, datetime.utcfromtimestamp(200), token='v1') == 3
+    # inexact times resolve to the nearest band
+    assert DatasetSource.wheres_my_band(src, datetime.utcfromtimestamp(260), token='v1') == 5
+    assert DatasetSource.wheres_my_band(src, datetime.utcfromtimestamp(-50), token='v1') == 1
+    assert src.tag_reads == tag_reads
+
+
+def _linear_nearest_band(times, time):
+    idx = 0
+    dist = float('+inf')
+    for i, v in enumerate(times, 1):
+        if abs(time - v) < dist:
+            idx = i
+            dist = abs(time - v)
+    return idx
+
+
+def test_band_time_index_benchmark():
+    # Two years of 16-day revisits from two overlapping paths
+    rng = numpy.random.RandomState(0)
+    times = numpy.sort(rng.uniform(1.4e9, 1.4e9 + 2 * 365 * 86400, size=730)).round()
+    queries = numpy.concatenate([times[::7], rng.uniform(times[0] - 86400, times[-1] + 86400, size=100)])
+
+    index = BandTimeIndex(times)
+    assert [index.nearest_band(t) for t in queries] == [_linear_nearest_band(times, t) for t in queries]
+
+    linear = min(timeit.repeat(lambda: [_linear_nearest_band(times, t) for t in queries], number=3, repeat=3))
+    indexed = min(timeit.repeat(lambda: [index.nearest_band(t) for t in queries], number=3, repeat=3))
+    print('\nnearest band of %d: linear %.4fs, BandTimeIndex %.4fs' % (len(times), linear, indexed))
+
+
+def test_native_netcdf_reader(tmpnetcdf_filename):
+    affine = Affine.translation(20, 30) * Affine.scale(0.1, -0.1)
+    geobox = GeoBox(100, 80, affine, CRS(GEO_PROJ))
+    times = numpy.array(['2016-01-01', '2016-01-17', '2016-02-02'], dtype='datetime64[ns]')
+
+    dataset = xarray.Dataset(attrs={'extent': geobox.extent, 'crs': geobox.crs})
+    dataset['time'] = ('time', times, {'units': 'seconds since 1970-01-01 00:00:00'})
+    for name, coord in geobox.coordinates.items():
+        dataset[name] = (name, coord.values, {'units': coord.units, 'crs': geobox.crs})
+    data = numpy.arange(3 * 80 * 100, dtype='int16').reshape((3, 80, 100))
+    dataset['B10'] = (('time',) + geobox.dimensions, data, {'nodata': -999, 'units': '1', 'crs': geobox.crs})
+
+    write_dataset_to_netcdf(dataset, {}, {'B10': {'zlib': True, 'chunksizes': (1, 32, 32)}},
+                            Path(tmpnetcdf_filename))
+
+    with NetCDFVariableReader(tmpnetcdf_filename, 'B10') as reader:
+        assert reader.shape == (80, 100)
+        assert reader.count == 3
+        assert reader.nodata == -999
+        assert reader.transform.almost_equals(affine)
+        assert CRS(reader.crs_wkt) == CRS(GEO_PROJ)
+
+        index = BandTimeIndex(reader.read_times())
+        assert index.nearest_band(datetime_to_seconds_since_1970(datetime(2016, 1, 17, 1))) == 2
+
+        window = ((10, 50), (35, 100))
+        assert (reader.read(2, window=window) == data[1, 10:50, 35:100]).all()
+        assert (reader.read(3) == data[2]).all()
+
+    with pytest.raises(ValueError):
+        NetCDFVariableReader(tmpnetcdf_filename, 'not_a_variable')
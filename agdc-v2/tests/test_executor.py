@@ -0,0 +1,75 @@
+# coding=utf-8
+"""
+Module
+"""
+from __future__ import absolute_import
+
+from datacube.executor import SerialExecutor, as_completed_bounded
+
+
+class _RecordingExecutor(object):
+    """
+    Completes tasks in submission order, recording how many were in flight at each submission.
+    """
+
+    def __init__(self):
+        self.in_flight = []
+        self.events = []
+
+    def submit(self, func, *args):
+        future = (func, args)
+        self.in_flight.append(future)
+        self.events.append(('submit', args[0], len(self.in_flight)))
+        return future
+
+    def next_completed(self, futures, default):
+        future = next(future for future in self.in_flight if any(future is f for f in futures))
+        self.in_flight.remove(future)
+        self.events.append(('done', future[1][0]))
+        return future, [f for f in futures if f is not future]
+
+    @staticmethod
+    def result(future):
+        func, args = future
+        return func(*args)
+
+
+def test_bounded_task_count():
+    executor = _RecordingExecutor()
+    submit = lambda item: executor.submit(lambda x: x * 2, item)
+
+    results = [executor.result(future)
+               for future in as_completed_bounded(executor, submit, iter(range(5)), max_tasks=2)]
+    assert sorted(results) == [0, 2, 4, 6, 8]
+    assert max(event[2] for event in executor.events if event[0] == 'submit') == 2
+
+
+def test_bounded_memory():
+    executor = _RecordingExecutor()
+    submit = lambda item: executor.submit(lambda x: x, item)
+    items = ['a', 'b', 'c', 'huge']
+    costs = {'a': 6, 'b': 3, 'c': 6, 'huge': 100}
+
+    completed = [executor.result(future)
+                 for future in as_completed_bounded(executor, submit, items, max_memory=10, estimate=costs.get)]
+    assert sorted(completed) == sorted(items)
+    assert executor.events == [
+        ('submit', 'a', 1),
+        ('submit', 'b', 2),
+        # 'c' would take it to 15
+        ('done', 'a'),
+        ('submit', 'c', 2),
+        # 'huge' is over budget on its own: it waits until nothing else is running
+        ('done', 'b'),
+        ('done', 'c'),
+        ('submit', 'huge', 1),
+        ('done', 'huge'),
+    ]
+
+
+def test_bounded_serial_executor():
+    executor = SerialExecutor()
+    submit = lambda item: executor.submit(lambda x: x + 1, item)
+    results = [executor.result(future)
+               for future in as_completed_bounded(executor, submit, range(3), max_tasks=1)]
+    assert results == [1, 2, 3]
@@ -1,9 +1,10 @@
 # coding=utf-8
 import os
+import pickle
 
 import pytest
 
-from datacube.model import _uri_to_local_path, GeoPolygon, GeoBox, CRS
+from datacube.model import _uri_to_local_path, GeoPolygon, GeoBox, CRS, Dataset, DatasetType, MetadataType
 
 
 def test_uri_to_local_path():
@@ -35,3 +36,53 @@ def test_geobox():
         assert abs(resolution[0]) > abs(geobox.extent.boundingbox.right - polygon.boundingbox.right)
         assert abs(resolution[1]) > abs(geobox.extent.boundingbox.top - polygon.boundingbox.top)
         assert abs(resolution[1]) > abs(geobox.extent.boundingbox.bottom - polygon.boundingbox.bottom)
+
+
+def test_geopolygon_caches_reprojections():
+    polygon = GeoPolygon([(148.2697, -35.20111), (149.31254, -35.20111), (149.31254, -36.331431)], CRS('EPSG:4326'))
+    assert polygon.to_crs(CRS('EPSG:4326')) is polygon
+
+    albers = polygon.to_crs(CRS('EPSG:3577'))
+    assert polygon.to_crs(CRS('EPSG:3577')) is albers
+    assert albers.crs == CRS('EPSG:3577')
+    assert albers.boundingbox.left < albers.boundingbox.right
+
+    # Replacing the points drops the cached results
+    polygon.points = [(148, -35), (149, -35), (149, -36)]
+    assert polygon.boundingbox.left == 148
+    assert polygon.to_crs(CRS('EPSG:3577')) is not albers
+
+    copy = pickle.loads(pickle.dumps(polygon))
+    assert copy.points == polygon.points
+    assert copy.crs == polygon.crs
+
+
+def test_dataset_caches_derived_properties():
+    metadata_type = MetadataType('test', {'id': ['id'],
+                                          'grid_spatial': ['grid_spatial', 'projection'],
+                                          'sources': ['lineage', 'source_datasets']}, {})
+    dataset_type = DatasetType(metadata_type, {'name': 'test', 'metadata': {}})
+    doc = {
+        'id': '4ec8fe97-e8b9-11e4-87ff-1040f381a756',
+        'grid_spatial': {'projection': {
+            'spatial_reference': 'EPSG:3577',
+            'geo_ref_points': {'ul': {'x': 0, 'y': 100}, 'ur': {'x': 100, 'y': 100},
+                               'lr': {'x': 100, 'y': 0}, 'll': {'x': 0, 'y': 0}}
+        }},
+        'lineage': {'source_datasets': {}}
+    }
+    dataset = Dataset(dataset_type, doc, 'file:///tmp/test.yaml')
+
+    assert dataset.extent is dataset.extent
+    assert dataset.crs == CRS('EPSG:3577')
+    assert tuple(dataset.bounds) == (0, 0, 100, 100)
+
+    # Replacing the document drops the cached properties
+    projection = dict(doc['grid_spatial']['projection'], spatial_reference='EPSG:28355')
+    dataset.metadata_doc = dict(doc, grid_spatial={'projection': projection})
+    assert dataset.crs == CRS('EPSG:28355')
+
+    copy = pickle.loads(pickle.dumps(dataset))
+    assert copy.id == dataset.id
+    assert copy.crs == CRS('EPSG:28355')
+    assert copy.local_uri == dataset.local_uri
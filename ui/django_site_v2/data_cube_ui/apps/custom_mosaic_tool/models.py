@@ -188,6 +188,8 @@ class Result(models.Model):
 
     scenes_processed = models.IntegerField(default=0)
     total_scenes = models.IntegerField(default=0)
+    # how the query was split into chunks, from describe_task_split.
+    chunk_plan = models.CharField(max_length=250, default="")
 
     #geospatial bounds.
     latitude_max = models.FloatField(default=0)
@@ -20,8 +20,11 @@
 # under the License.
 
 # Django specific
+from celery import chord
 from celery.decorators import task
 from celery.signals import worker_process_init, worker_process_shutdown
+from django.db import transaction
+from django.db.models import F
 from .models import Query, Result, ResultType, Metadata
 
 import numpy as np
@@ -39,7 +42,9 @@ from dateutil.tz import tzutc
 
 from utils.data_access_api import DataAccessApi
 from utils.dc_mosaic import create_mosaic_iterative, create_median_mosaic, create_max_ndvi_mosaic, create_min_ndvi_mosaic
-from utils.dc_utilities import get_spatial_ref, save_to_geotiff, create_rgb_png_from_tiff, create_cfmask_clean_mask, split_task
+from utils.dc_utilities import get_spatial_ref, save_to_geotiff, create_rgb_png_from_tiff, create_cfmask_clean_mask, split_task, describe_task_split
+from utils.chunk_transport import ChunkResult, combine_chunks, reduce_in_order
+from utils.result_cache import chunk_key, get_chunk, put_chunk
 
 from .utils import update_model_bounds_with_dataset
 
@@ -55,6 +60,8 @@ Class for handling loading celery workers to perform tasks asynchronously.
 # constants up top for easy access/modification
 base_result_path = '/datacube/ui_results/custom_mosaic/'
 base_temp_path = '/datacube/ui_results_temp/'
+# bump to stop reusing cached chunks when the chunk processing changes.
+cache_version = 1
 
 # Datacube instance to be initialized.
 # A seperate DC instance is created for each worker.
@@ -208,10 +215,14 @@ def create_cloudfree_mosaic(query_id, user_id):
 
         # Reversed time = True will make it so most recent = First, oldest = Last.
         #default is in order from oldest -> newwest.
+        # chunks are sized from the volume of data in the query's storage units.
         lat_ranges, lon_ranges, time_ranges = split_task(resolution=product_details.resolution.values[0][1], latitude=(query.latitude_min, query.latitude_max), longitude=(
-            query.longitude_min, query.longitude_max), acquisitions=acquisitions, geo_chunk_size=processing_options['geo_chunk_size'], time_chunks=processing_options['time_chunks'], reverse_time=processing_options['reverse_time'])
+            query.longitude_min, query.longitude_max), acquisitions=acquisitions, geo_chunk_size=processing_options['geo_chunk_size'], time_chunks=processing_options['time_chunks'], reverse_time=processing_options['reverse_time'],
+            storage_units=metadata['storage_units'], bytes_per_pixel=dc.get_bytes_per_pixel(query.product, measurements=measurements), slices_per_load=processing_options['time_slices_per_iteration'],
+            snap_to_grid=True)
 
         result.total_scenes = len(time_ranges) * len(lat_ranges)
+        result.chunk_plan = describe_task_split(lat_ranges, lon_ranges, time_ranges)
         # Iterates through the acquisition dates with the step in acquisitions_per_iteration.
         # Uses a time range computed with the index and index+acquisitions_per_iteration.
         # ensures that the start and end are both valid.
@@ -222,51 +233,92 @@ def create_cloudfree_mosaic(query_id, user_id):
             os.mkdir(base_temp_path + query.query_id)
             os.chmod(base_temp_path + query.query_id, 0o777)
 
-        time_chunk_tasks = []
-        # iterate over the time chunks.
+        result.save()
+
+        # the chunks of each time range are dispatched as a chord, and combine_mosaic_chunks is called with
+        # their results when the last one finishes. Nothing waits on the chunks, so this task's worker is free
+        # straight away, and each time range is added to the mosaic as soon as those before it are done.
         print("Time chunks: " + str(len(time_ranges)))
         print("Geo chunks: " + str(len(lat_ranges)))
+        # iterate over the time chunks.
         for time_range_index in range(len(time_ranges)):
             # iterate over the geographic chunks.
-            geo_chunk_tasks = []
-            for geographic_chunk_index in range(len(lat_ranges)):
-                geo_chunk_tasks.append(generate_mosaic_chunk.delay(time_range_index, geographic_chunk_index, processing_options=processing_options, query=query, acquisition_list=time_ranges[
-                                       time_range_index], lat_range=lat_ranges[geographic_chunk_index], lon_range=lon_ranges[geographic_chunk_index], measurements=measurements))
-            time_chunk_tasks.append(geo_chunk_tasks)
-
-        # holds some acquisition based metadata. dict of objs keyed by date
-        dataset_out = None
-        acquisition_metadata = {}
-        for geographic_group in time_chunk_tasks:
-            full_dataset = None
-            tiles = []
-            for t in geographic_group:
-                tile = t.get()
-                # tile is [path, metadata]. Append tiles to list of tiles for concat, compile metadata.
-                if tile == "CANCEL":
-                    print("Cancelled task.")
-                    shutil.rmtree(base_temp_path + query.query_id)
-                    query.delete()
-                    meta.delete()
-                    result.delete()
-                    return
-                if tile[0] is not None:
-                    tiles.append(tile)
-                result.scenes_processed += 1
-                result.save()
-            print("Got results for a time slice, computing intermediate product..")
-            xr_tiles = []
-            for tile in tiles:
-                tile_metadata = tile[1]
-                for acquisition_date in tile_metadata:
-                    if acquisition_date in acquisition_metadata:
-                        acquisition_metadata[acquisition_date]['clean_pixels'] += tile_metadata[acquisition_date]['clean_pixels']
-                    else:
-                        acquisition_metadata[acquisition_date] = {'clean_pixels': tile_metadata[acquisition_date]['clean_pixels']}
-                xr_tiles.append(xr.open_dataset(tile[0]))
-            full_dataset = xr.concat(reversed(xr_tiles), dim='latitude')
-            dataset = full_dataset.load()
+            chunk_tasks = [generate_mosaic_chunk.s(time_range_index, geographic_chunk_index, processing_options=processing_options, query=query, acquisition_list=time_ranges[
+                           time_range_index], lat_range=lat_ranges[geographic_chunk_index], lon_range=lon_ranges[geographic_chunk_index], measurements=measurements) for geographic_chunk_index in range(len(lat_ranges))]
+            combine_task = combine_mosaic_chunks.s(query_id, user_id, time_range_index=time_range_index, time_range_count=len(time_ranges), acquisition_count=len(acquisitions))
+            combine_task.link_error(mosaic_chunks_failed.si(query_id))
+            chord(chunk_tasks)(combine_task)
+    except:
+        error_with_message(
+            result, "There was an exception when handling this query.")
+        raise
+    # end error wrapping.
+    return
+
+@task(name="combine_mosaic_chunks")
+def combine_mosaic_chunks(chunk_results, query_id, user_id, time_range_index=None, time_range_count=None, acquisition_count=None):
+    """
+    Called with the results of the chunks of one time range once they have all completed. Combines them
+    into an intermediate product and adds it to the mosaic with every other time range that is ready, in
+    order. The call that adds the last time range uses the mosaic to create png/tifs to populate a result
+    model.
+
+    Args:
+        chunk_results (list): [ChunkResult, metadata] for each geographic chunk of the time range.
+        query_id (string): The ID of the query that the chunks were generated for.
+        user_id (string): The ID of the user that requested the query be made.
+        time_range_index (int): The index of the time range the chunks cover.
+        time_range_count (int): The number of time ranges in the query.
+        acquisition_count (int): The number of acquisitions in the query.
+
+    Returns:
+        Returns nothing
+    """
+
+    queries = Query.objects.filter(query_id=query_id, user_id=user_id)
+    results = Result.objects.filter(query_id=query_id)
+    # a chunk returns CANCEL if the query was cancelled while it ran, or nothing if the result was deleted.
+    if results.count() == 0 or "CANCEL" in chunk_results or None in chunk_results:
+        print("Cancelled task.")
+        shutil.rmtree(base_temp_path + query_id, ignore_errors=True)
+        queries.delete()
+        Metadata.objects.filter(query_id=query_id).delete()
+        results.delete()
+        return
+    query = queries[0]
+    result = results[0]
+    meta = Metadata.objects.get(query_id=query_id)
+    result_type = ResultType.objects.get(satellite_id=query.platform, result_id=query.query_type)
+    product_details = dc.dc.list_products()[dc.dc.list_products().name == query.product]
+    processing_options = processing_algorithms[query.compositor]
+
+    def fold(index, product, reduction):
+        # adds the product of a time range to the mosaic. reduction is [mosaic, acquisition metadata].
+        dataset, tile_metadata = product
+        dataset_out, acquisition_metadata = reduction if reduction is not None else (None, {})
+        add_acquisition_metadata(acquisition_metadata, tile_metadata)
+        if dataset is not None:
             dataset_out = processing_options['chunk_combination_method'](dataset, dataset_out)
+        return [dataset_out, acquisition_metadata]
+
+    try:
+        # tile is [ChunkResult, metadata]. Append tiles to list of tiles to combine, compile metadata.
+        tiles = [tile for tile in chunk_results if tile[0] is not None]
+        print("Got results for a time slice, computing intermediate product..")
+        tile_metadata = {}
+        for tile in tiles:
+            add_acquisition_metadata(tile_metadata, tile[1])
+        dataset = combine_chunks([tile[0] for tile in tiles]) if tiles else None
+
+        # time ranges are added to the mosaic one at a time, while holding a lock on the query.
+        with transaction.atomic():
+            list(Query.objects.select_for_update().filter(query_id=query_id, user_id=user_id))
+            if Result.objects.get(query_id=query_id).status == "ERROR":
+                return
+            reduction = reduce_in_order(base_temp_path + query_id, time_range_index, time_range_count, [dataset, tile_metadata], fold)
+        if reduction is None:
+            return
+        dataset_out, acquisition_metadata = reduction
 
         latitude = dataset_out.latitude
         longitude = dataset_out.longitude
@@ -320,7 +372,7 @@ def create_cloudfree_mosaic(query_id, user_id):
         result.data_netcdf_path = netcdf_path
         result.result_filled_path = png_filled_path
         result.status = "OK"
-        result.total_scenes = len(acquisitions)
+        result.total_scenes = acquisition_count
         result.save()
         print("Finished processing results")
         # all data has been processed, create results and finish up.
@@ -339,12 +391,20 @@ def generate_mosaic_chunk(time_num, chunk_num, processing_options=None, query=No
     """
     responsible for generating a piece of a custom mosaic product. This grabs the x/y area specified in the lat/lon ranges, gets all data
     from acquisition_list, which is a list of acquisition dates, and creates the custom mosaic using the function named in processing_options.
-    saves the result to disk using time/chunk num, and returns the path and the acquisition date keyed metadata.
+    packs the result with a ChunkResult (spilled to disk using time/chunk num), and returns it with the
+    acquisition date keyed metadata.
     """
     time_index = 0
     iteration_data = None
     acquisition_metadata = {}
     print("Starting chunk: " + str(time_num) + " " + str(chunk_num))
+    # chunks are cached and shared between queries.
+    cache_key = chunk_key('custom_mosaic', cache_version, query.platform, query.product, acquisition_list, lat_range, lon_range, measurements, processing_options)
+    cached = get_chunk(cache_key, base_temp_path + query.query_id + "/geo_chunk_" + str(time_num) + "_" + str(chunk_num), max_bytes=0)
+    if cached is not None:
+        Result.objects.filter(query_id=query.query_id).update(scenes_processed=F('scenes_processed') + 1)
+        print("Got chunk from the cache: " + str(time_num) + " " + str(chunk_num))
+        return cached
     # holds some acquisition based metadata.
     while time_index < len(acquisition_list):
         # check if the task has been cancelled. if the result obj doesn't exist anymore then return.
@@ -393,15 +453,51 @@ def generate_mosaic_chunk(time_num, chunk_num, processing_options=None, query=No
             raw_data, clean_mask=clear_mask, intermediate_product=iteration_data)
         time_index = time_index + (processing_options['time_slices_per_iteration'] if processing_options['time_slices_per_iteration'] is not None else 10000)
 
-    # Save this geographic chunk to disk.
+    # count the chunk as processed with a single update, as many chunks finish at once.
+    Result.objects.filter(query_id=query.query_id).update(scenes_processed=F('scenes_processed') + 1)
+
+    # Pack this geographic chunk, spilling it to disk so that only its path goes through the result backend.
     geo_path = base_temp_path + query.query_id + "/geo_chunk_" + \
-        str(time_num) + "_" + str(chunk_num) + ".nc"
+        str(time_num) + "_" + str(chunk_num) + ".npz"
     # if this is an empty chunk, just return an empty dataset.
     if iteration_data is None:
         return [None, None]
-    iteration_data.to_netcdf(geo_path)
+    chunk = ChunkResult(iteration_data, geo_path, max_bytes=0)
     print("Done with chunk: " + str(time_num) + " " + str(chunk_num))
-    return [geo_path, acquisition_metadata]
+    put_chunk(cache_key, [chunk, acquisition_metadata])
+    return [chunk, acquisition_metadata]
+
+@task(name="mosaic_chunks_failed")
+def mosaic_chunks_failed(query_id):
+    """
+    Called in place of combine_mosaic_chunks if any chunk of the query raised an exception.
+
+    Args:
+        query_id (string): The ID of the query that the chunks were generated for.
+
+    Returns:
+        Returns nothing
+    """
+    results = Result.objects.filter(query_id=query_id)
+    if results.count() > 0:
+        error_with_message(results[0], "There was an exception when handling this query.")
+
+def add_acquisition_metadata(acquisition_metadata, tile_metadata):
+    """
+    Adds the acquisition date keyed metadata of a chunk to that of the chunks before it.
+
+    Args:
+        acquisition_metadata (dict): The metadata compiled so far, updated in place.
+        tile_metadata (dict): The metadata of the chunk.
+
+    Returns:
+        Returns nothing
+    """
+    for acquisition_date in tile_metadata:
+        if acquisition_date in acquisition_metadata:
+            acquisition_metadata[acquisition_date]['clean_pixels'] += tile_metadata[acquisition_date]['clean_pixels']
+        else:
+            acquisition_metadata[acquisition_date] = {'clean_pixels': tile_metadata[acquisition_date]['clean_pixels']}
 
 def error_with_message(result, message):
     """
@@ -39,8 +39,10 @@ from dateutil.tz import tzutc
 
 from utils.data_access_api import DataAccessApi
 from utils.dc_mosaic import create_mosaic_iterative, create_median_mosaic, create_max_ndvi_mosaic, create_min_ndvi_mosaic
-from utils.dc_utilities import get_spatial_ref, save_to_geotiff, create_rgb_png_from_tiff, create_cfmask_clean_mask, split_task
+from utils.dc_utilities import get_spatial_ref, save_to_geotiff, create_rgb_png_from_tiff, create_cfmask_clean_mask, split_task, describe_task_split
 from utils.dc_fractional_coverage_classifier import frac_coverage_classify
+from utils.chunk_transport import ChunkResult, combine_chunks
+from utils.result_cache import chunk_key, get_chunk, put_chunk
 
 from .utils import update_model_bounds_with_dataset, map_ranges
 
@@ -56,6 +58,8 @@ Class for handling loading celery workers to perform tasks asynchronously.
 # constants up top for easy access/modification
 base_result_path = '/datacube/ui_results/fractional_cover/'
 base_temp_path = '/datacube/ui_results_temp/'
+# bump to stop reusing cached chunks when the chunk processing changes.
+cache_version = 1
 
 # Datacube instance to be initialized.
 # A seperate DC instance is created for each worker.
@@ -200,10 +204,14 @@ def create_fractional_cover(query_id, user_id):
 
         # Reversed time = True will make it so most recent = First, oldest = Last.
         #default is in order from oldest -> newwest.
+        # chunks are sized from the volume of data in the query's storage units.
         lat_ranges, lon_ranges, time_ranges = split_task(resolution=product_details.resolution.values[0][1], latitude=(query.latitude_min, query.latitude_max), longitude=(
-            query.longitude_min, query.longitude_max), acquisitions=acquisitions, geo_chunk_size=processing_options['geo_chunk_size'], time_chunks=processing_options['time_chunks'], reverse_time=processing_options['reverse_time'])
+            query.longitude_min, query.longitude_max), acquisitions=acquisitions, geo_chunk_size=processing_options['geo_chunk_size'], time_chunks=processing_options['time_chunks'], reverse_time=processing_options['reverse_time'],
+            storage_units=metadata['storage_units'], bytes_per_pixel=dc.get_bytes_per_pixel(query.product, measurements=measurements), slices_per_load=processing_options['time_slices_per_iteration'],
+            snap_to_grid=True)
 
         result.total_scenes = len(time_ranges) * len(lat_ranges)
+        result.chunk_plan = describe_task_split(lat_ranges, lon_ranges, time_ranges)
         # Iterates through the acquisition dates with the step in acquisitions_per_iteration.
         # Uses a time range computed with the index and index+acquisitions_per_iteration.
         # ensures that the start and end are both valid.
@@ -235,7 +243,7 @@ def create_fractional_cover(query_id, user_id):
             tiles = []
             for t in geographic_group:
                 tile = t.get()
-                # tile is [path, metadata]. Append tiles to list of tiles for concat, compile metadata.
+                # tile is [ChunkResult, ChunkResult, metadata]. Append tiles to list of tiles to combine, compile metadata.
                 if tile == "CANCEL":
                     print("Cancelled task.")
                     shutil.rmtree(base_temp_path + query.query_id)
@@ -257,15 +265,13 @@ def create_fractional_cover(query_id, user_id):
                         acquisition_metadata[acquisition_date]['clean_pixels'] += tile_metadata[acquisition_date]['clean_pixels']
                     else:
                         acquisition_metadata[acquisition_date] = {'clean_pixels': tile_metadata[acquisition_date]['clean_pixels']}
-                xr_tiles_mosaic.append(xr.open_dataset(tile[0]))
-                xr_tiles_fractional_cover.append(xr.open_dataset(tile[1]))
+                xr_tiles_mosaic.append(tile[0])
+                xr_tiles_fractional_cover.append(tile[1])
             #create cf mosaic
-            full_dataset_mosaic = xr.concat(reversed(xr_tiles_mosaic), dim='latitude')
-            dataset_mosaic = full_dataset_mosaic.load()
+            dataset_mosaic = combine_chunks(xr_tiles_mosaic)
             dataset_out_mosaic = processing_options['chunk_combination_method'](dataset_mosaic, dataset_out_mosaic)
             #now frac.
-            full_dataset_fractional_cover = xr.concat(reversed(xr_tiles_fractional_cover), dim='latitude')
-            dataset_fractional_cover = full_dataset_fractional_cover.load()
+            dataset_fractional_cover = combine_chunks(xr_tiles_fractional_cover)
             dataset_out_fractional_cover = processing_options['chunk_combination_method'](dataset_fractional_cover, dataset_out_fractional_cover)
 
         latitude = dataset_out_mosaic.latitude
@@ -351,6 +357,12 @@ def generate_fractional_cover_chunk(time_num, chunk_num, processing_options=None
     iteration_data = None
     acquisition_metadata = {}
     print("Starting chunk: " + str(time_num) + " " + str(chunk_num))
+    # chunks are cached and shared between queries.
+    cache_key = chunk_key('fractional_cover', cache_version, query.platform, query.product, acquisition_list, lat_range, lon_range, measurements, processing_options)
+    cached = get_chunk(cache_key, base_temp_path + query.query_id + "/geo_chunk_" + str(time_num) + "_" + str(chunk_num))
+    if cached is not None:
+        print("Got chunk from the cache: " + str(time_num) + " " + str(chunk_num))
+        return cached
     # holds some acquisition based metadata.
     while time_index < len(acquisition_list):
         # check if the task has been cancelled. if the result obj doesn't exist anymore then return.
@@ -399,15 +411,15 @@ def generate_fractional_cover_chunk(time_num, chunk_num, processing_options=None
             raw_data, clean_mask=clear_mask, intermediate_product=iteration_data)
         time_index = time_index + (processing_options['time_slices_per_iteration'] if processing_options['time_slices_per_iteration'] is not None else 10000)
 
-    # Save this geographic chunk to disk.
+    # Pack this geographic chunk, spilling it to disk if it is too large for the result backend.
     geo_path = base_temp_path + query.query_id + "/geo_chunk_" + \
-        str(time_num) + "_" + str(chunk_num) + ".nc"
+        str(time_num) + "_" + str(chunk_num) + ".npz"
     fractional_cover_path = base_temp_path + query.query_id + "/geo_chunk_fractional_" + \
-        str(time_num) + "_" + str(chunk_num) + ".nc"
+        str(time_num) + "_" + str(chunk_num) + ".npz"
     # if this is an empty chunk, just return an empty dataset.
     if iteration_data is None:
         return [None, None, None]
-    iteration_data.to_netcdf(geo_path)
+    mosaic_chunk = ChunkResult(iteration_data, geo_path)
     ##################################################################
     # Compute fractional cover here.
     clear_mask = create_cfmask_clean_mask(iteration_data.cf_mask)
@@ -415,9 +427,10 @@ def generate_fractional_cover_chunk(time_num, chunk_num, processing_options=None
     clear_mask[iteration_data.cf_mask.values==1] = False
     fractional_cover = frac_coverage_classify(iteration_data, clean_mask=clear_mask)
     ##################################################################
-    fractional_cover.to_netcdf(fractional_cover_path)
+    fractional_cover_chunk = ChunkResult(fractional_cover, fractional_cover_path)
     print("Done with chunk: " + str(time_num) + " " + str(chunk_num))
-    return [geo_path, fractional_cover_path, acquisition_metadata]
+    put_chunk(cache_key, [mosaic_chunk, fractional_cover_chunk, acquisition_metadata])
+    return [mosaic_chunk, fractional_cover_chunk, acquisition_metadata]
 
 def error_with_message(result, message):
     """
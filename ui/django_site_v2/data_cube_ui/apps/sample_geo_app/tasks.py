@@ -40,6 +40,7 @@ from dateutil.tz import tzutc
 from utils.data_access_api import DataAccessApi
 from utils.dc_mosaic import create_mosaic_iterative, create_median_mosaic, create_max_ndvi_mosaic, create_min_ndvi_mosaic
 from utils.dc_utilities import get_spatial_ref, save_to_geotiff, create_rgb_png_from_tiff, create_cfmask_clean_mask, split_task
+from utils.chunk_transport import ChunkResult, combine_chunks
 
 from .utils import update_model_bounds_with_dataset
 
@@ -242,7 +243,7 @@ def create_cloudfree_mosaic(query_id, user_id):
             tiles = []
             for t in geographic_group:
                 tile = t.get()
-                # tile is [path, metadata]. Append tiles to list of tiles for concat, compile metadata.
+                # tile is [ChunkResult, metadata]. Append tiles to list of tiles to combine, compile metadata.
                 if tile == "CANCEL":
                     print("Cancelled task.")
                     shutil.rmtree(base_temp_path + query.query_id)
@@ -263,9 +264,8 @@ def create_cloudfree_mosaic(query_id, user_id):
                         acquisition_metadata[acquisition_date]['clean_pixels'] += tile_metadata[acquisition_date]['clean_pixels']
                     else:
                         acquisition_metadata[acquisition_date] = {'clean_pixels': tile_metadata[acquisition_date]['clean_pixels']}
-                xr_tiles.append(xr.open_dataset(tile[0]))
-            full_dataset = xr.concat(reversed(xr_tiles), dim='latitude')
-            dataset = full_dataset.load()
+                xr_tiles.append(tile[0])
+            dataset = combine_chunks(xr_tiles)
             dataset_out = processing_options['chunk_combination_method'](dataset, dataset_out)
 
         latitude = dataset_out.latitude
@@ -394,15 +394,15 @@ def generate_TOOL_chunk(time_num, chunk_num, processing_options=None, query=None
             raw_data, clean_mask=clear_mask, intermediate_product=iteration_data)
         time_index = time_index + (processing_options['time_slices_per_iteration'] if processing_options['time_slices_per_iteration'] is not None else 10000)
 
-    # Save this geographic chunk to disk.
+    # Pack this geographic chunk, spilling it to disk if it is too large for the result backend.
     geo_path = base_temp_path + query.query_id + "/geo_chunk_" + \
-        str(time_num) + "_" + str(chunk_num) + ".nc"
+        str(time_num) + "_" + str(chunk_num) + ".npz"
     # if this is an empty chunk, just return an empty dataset.
     if iteration_data is None:
         return [None, None]
-    iteration_data.to_netcdf(geo_path)
+    chunk = ChunkResult(iteration_data, geo_path)
     print("Done with chunk: " + str(time_num) + " " + str(chunk_num))
-    return [geo_path, acquisition_metadata]
+    return [chunk, acquisition_metadata]
 
 def error_with_message(result, message):
     """
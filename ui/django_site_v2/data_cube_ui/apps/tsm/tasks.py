@@ -20,8 +20,11 @@
 # under the License.
 
 # Django specific
+from celery import chord
 from celery.decorators import task
 from celery.signals import worker_process_init, worker_process_shutdown
+from django.db import transaction
+from django.db.models import F
 from .models import Query, Result, ResultType, Metadata, AnimationType
 
 import numpy as np
@@ -38,9 +41,11 @@ from dateutil.tz import tzutc
 import imageio
 
 from utils.data_access_api import DataAccessApi
-from utils.dc_utilities import get_spatial_ref, save_to_geotiff, create_cfmask_clean_mask, perform_timeseries_analysis_iterative, split_task
+from utils.dc_utilities import get_spatial_ref, save_to_geotiff, create_cfmask_clean_mask, perform_timeseries_analysis_iterative, split_task, describe_task_split
 from utils.dc_water_classifier import wofs_classify
 from utils.dc_tsm import tsm, mask_tsm
+from utils.chunk_transport import ChunkResult, combine_chunks, reduce_in_order
+from utils.result_cache import chunk_key, get_chunk, put_chunk
 
 from .utils import update_model_bounds_with_dataset
 
@@ -55,6 +60,8 @@ color_path = ['~/Datacube/data_cube_ui/utils/color_scales/ramp', '~/Datacube/dat
 
 base_result_path = '/datacube/ui_results/tsm/'
 base_temp_path = '/datacube/ui_results_temp/'
+# bump to stop reusing cached chunks when the chunk processing changes.
+cache_version = 1
 
 
 def addition(dataset, dataset_intermediate):
@@ -146,10 +153,15 @@ def perform_tsm_analysis(query_id, user_id):
 
         processing_options = processing_algorithms['tsm']
 
+        # chunks are sized from the volume of data in the query's storage units.
+        # animation frames are combined by latitude only, so they can't be split by longitude.
         lat_ranges, lon_ranges, time_ranges = split_task(resolution=product_details.resolution.values[0][1], latitude=(query.latitude_min, query.latitude_max), longitude=(
-            query.longitude_min, query.longitude_max), acquisitions=acquisitions, geo_chunk_size=processing_options['geo_chunk_size'], time_chunks=processing_options['time_chunks'], reverse_time=processing_options['reverse_time'])
+            query.longitude_min, query.longitude_max), acquisitions=acquisitions, geo_chunk_size=processing_options['geo_chunk_size'], time_chunks=processing_options['time_chunks'], reverse_time=processing_options['reverse_time'],
+            storage_units=metadata['storage_units'], bytes_per_pixel=dc.get_bytes_per_pixel(query.product), slices_per_load=processing_options['time_slices_per_iteration'],
+            split_longitude=query.animated_product == "None", snap_to_grid=True)
 
         result.total_scenes = len(time_ranges) * len(lat_ranges)
+        result.chunk_plan = describe_task_split(lat_ranges, lon_ranges, time_ranges)
 
         # Iterates through the acquisition dates with the step in acquisitions_per_iteration.
         # Uses a time range computed with the index and index+acquisitions_per_iteration.
@@ -161,108 +173,142 @@ def perform_tsm_analysis(query_id, user_id):
             os.mkdir(base_temp_path + query.query_id)
             os.chmod(base_temp_path + query.query_id, 0o777)
 
-        time_chunk_tasks = []
+        result.save()
+
+        # the chunks of each time range are dispatched as a chord, and combine_tsm_chunks is called with
+        # their results when the last one finishes. Nothing waits on the chunks, so this task's worker is free
+        # straight away, and each time range is added to the analysis as soon as those before it are done.
         print("Time chunks: " + str(len(time_ranges)))
         print("Geo chunks: " + str(len(lat_ranges)))
         # iterate over the time chunks.
         for time_range_index in range(len(time_ranges)):
             # iterate over the geographic chunks.
-            geo_chunk_tasks = []
-            for geographic_chunk_index in range(len(lat_ranges)):
-                geo_chunk_tasks.append(generate_tsm_chunk.delay(time_range_index, geographic_chunk_index, processing_options=processing_options, query=query, acquisition_list=time_ranges[
-                                       time_range_index], lat_range=lat_ranges[geographic_chunk_index], lon_range=lon_ranges[geographic_chunk_index]))
-            time_chunk_tasks.append(geo_chunk_tasks)
-
-        dataset_out_water = None
-        dataset_out_tsm = None
-        acquisition_metadata = {}
-        animation_tile_count = 0
-        time_range_index = 0
-        for geographic_group in time_chunk_tasks:
-            full_dataset = None
-            tiles = []
-            for t in geographic_group:
-                tile = t.get()
-                # tile is [path, metadata]. Append tiles to list of tiles for
-                # concat, compile metadata.
-                if tile == "CANCEL":
-                    print("Cancelled task.")
-                    shutil.rmtree(base_temp_path + query.query_id)
-                    query.delete()
-                    meta.delete()
-                    result.delete()
-                    return
-                if tile[0] is not None:
-                    tiles.append(tile)
-                result.scenes_processed += 1
-                result.save()
-            print("Got results for a time slice, computing intermediate product..")
-            xr_tiles_water = []
-            xr_tiles_tsm = []
-            for tile in tiles:
-                tile_metadata = tile[2]
-                for acquisition_date in tile_metadata:
-                    if acquisition_date in acquisition_metadata:
-                        acquisition_metadata[acquisition_date][
-                            'clean_pixels'] += tile_metadata[acquisition_date]['clean_pixels']
-                    else:
-                        acquisition_metadata[acquisition_date] = {'clean_pixels': tile_metadata[acquisition_date][
-                            'clean_pixels']}
-                xr_tiles_water.append(xr.open_dataset(tile[0]))
-                xr_tiles_tsm.append(xr.open_dataset(tile[1]))
-
-            #combine tiles
-            full_dataset_water = xr.concat(reversed(xr_tiles_water), dim='latitude')
-            dataset_water = full_dataset_water.load()
-
-            full_dataset_tsm = xr.concat(reversed(xr_tiles_tsm), dim='latitude')
-            dataset_tsm = full_dataset_tsm.load()
-
-            # combine all the intermediate products for the animation creation.
-            if query.animated_product != "None":
-                print("Num of slices in this chunk: " +
-                    str(len(time_ranges[time_range_index])))
-                for timeslice in range(len(time_ranges[time_range_index])):
-                  result = Result.objects.get(query_id=query.query_id)
-                  if result.status == "CANCEL":
-                      print("Cancelled task.")
-                      shutil.rmtree(base_temp_path + query.query_id)
-                      query.delete()
-                      meta.delete()
-                      result.delete()
-                      return
-                  animation_tiles = []
-                  nc_paths = []
-                  for geoslice in range(len(lat_ranges)):
-                      nc_path = base_temp_path + query.query_id + '/' + \
-                          str(time_range_index) + '/' + \
-                          str(geoslice) + str(timeslice) + ".nc"
-                      nc_paths.append(nc_path)
-                      animation_tiles.append(xr.open_dataset(nc_path))
-                  animated_data = xr.concat(
-                      animation_tiles, dim='latitude').load()
-                  #combine the timeslice vals with the intermediate for the true value @ that timeslice
-                  if time_range_index > 0 and query.animated_product != "scene":
-                      animated_data = processing_options['chunk_combination_method'](animated_data, dataset_out_tsm)
-
-                  # save to .nc for later tiff + png conversion after masking with final wofs
-                  animated_data.to_netcdf(base_temp_path + query.query_id +
-                              '/' + str(animation_tile_count) + ".nc")
-                  # remove all the intermediates for this timeslice
-                  for path in nc_paths:
-                      os.remove(path)
-                  animated_data = None
-                  animation_tile_count += 1
-
-            #shutil.rmtree(base_temp_path + query.query_id +
-            #          '/' + str(time_range_index))
-
-            #add this intermediate product to the total.
-            dataset_out_water = processing_options[
-                'chunk_combination_method'](dataset_water, dataset_out_water)
-            dataset_out_tsm = processing_options[
-                'chunk_combination_method'](dataset_tsm, dataset_out_tsm)
-            time_range_index += 1
+            chunk_tasks = [generate_tsm_chunk.s(time_range_index, geographic_chunk_index, processing_options=processing_options, query=query, acquisition_list=time_ranges[
+                           time_range_index], lat_range=lat_ranges[geographic_chunk_index], lon_range=lon_ranges[geographic_chunk_index]) for geographic_chunk_index in range(len(lat_ranges))]
+            combine_task = combine_tsm_chunks.s(query_id, user_id, time_ranges=time_ranges, time_range_index=time_range_index, geo_chunk_count=len(lat_ranges), acquisition_count=len(acquisitions))
+            combine_task.link_error(tsm_chunks_failed.si(query_id))
+            chord(chunk_tasks)(combine_task)
+    except:
+        error_with_message(
+            result, "There was an exception when handling this query.")
+        raise
+    # end error wrapping.
+    return
+
+
+@task(name="combine_tsm_chunks")
+def combine_tsm_chunks(chunk_results, query_id, user_id, time_ranges=None, time_range_index=None, geo_chunk_count=None, acquisition_count=None):
+    """
+    Called with the results of the chunks of one time range once they have all completed. Combines them
+    into an intermediate product and adds it to the tsm analysis with every other time range that is ready,
+    in order, saving the animation frames for each. The call that adds the last time range uses the
+    analysis to create png/tifs to populate a result model.
+
+    Args:
+        chunk_results (list): [ChunkResult, ChunkResult, metadata] for each geographic chunk of the time range.
+        query_id (string): The ID of the query that the chunks were generated for.
+        user_id (string): The ID of the user that requested the query be made.
+        time_ranges (list): The acquisition dates of each time range.
+        time_range_index (int): The index of the time range the chunks cover.
+        geo_chunk_count (int): The number of geographic chunks in each time range.
+        acquisition_count (int): The number of acquisitions in the query.
+
+    Returns:
+        Returns nothing
+    """
+
+    queries = Query.objects.filter(query_id=query_id, user_id=user_id)
+    results = Result.objects.filter(query_id=query_id)
+    # a chunk returns CANCEL if the query was cancelled while it ran, or nothing if the result was deleted.
+    if results.count() == 0 or "CANCEL" in chunk_results or None in chunk_results:
+        print("Cancelled task.")
+        shutil.rmtree(base_temp_path + query_id, ignore_errors=True)
+        queries.delete()
+        Metadata.objects.filter(query_id=query_id).delete()
+        results.delete()
+        return
+    query = queries[0]
+    result = results[0]
+    meta = Metadata.objects.get(query_id=query_id)
+    result_type = ResultType.objects.get(
+        satellite_id=query.platform, result_id=query.query_type)
+    product_details = dc.dc.list_products(
+    )[dc.dc.list_products().name == query.product]
+    processing_options = processing_algorithms['tsm']
+
+    def fold(index, product, reduction):
+        # adds the product of a time range to the analysis, saving its animation frames.
+        # reduction is [water analysis, tsm analysis, acquisition metadata, animation frame count].
+        dataset_water, dataset_tsm, tile_metadata = product
+        dataset_out_water, dataset_out_tsm, acquisition_metadata, animation_tile_count = reduction if reduction is not None else (None, None, {}, 0)
+        add_acquisition_metadata(acquisition_metadata, tile_metadata)
+        if dataset_water is None:
+            return [dataset_out_water, dataset_out_tsm, acquisition_metadata, animation_tile_count]
+
+        # combine all the intermediate products for the animation creation.
+        if query.animated_product != "None":
+            print("Num of slices in this chunk: " +
+                  str(len(time_ranges[index])))
+            for timeslice in range(len(time_ranges[index])):
+                animation_tiles = []
+                nc_paths = []
+                for geoslice in range(geo_chunk_count):
+                    nc_path = base_temp_path + query.query_id + '/' + \
+                        str(index) + '/' + \
+                        str(geoslice) + str(timeslice) + ".nc"
+                    nc_paths.append(nc_path)
+                    animation_tiles.append(xr.open_dataset(nc_path))
+                animated_data = xr.concat(
+                    animation_tiles, dim='latitude').load()
+                #combine the timeslice vals with the intermediate for the true value @ that timeslice
+                if index > 0 and query.animated_product != "scene":
+                    animated_data = processing_options['chunk_combination_method'](animated_data, dataset_out_tsm)
+
+                # save to .nc for later tiff + png conversion after masking with final wofs
+                animated_data.to_netcdf(base_temp_path + query.query_id +
+                                        '/' + str(animation_tile_count) + ".nc")
+                # remove all the intermediates for this timeslice
+                for path in nc_paths:
+                    os.remove(path)
+                animated_data = None
+                animation_tile_count += 1
+
+        #add this intermediate product to the total.
+        dataset_out_water = processing_options[
+            'chunk_combination_method'](dataset_water, dataset_out_water)
+        dataset_out_tsm = processing_options[
+            'chunk_combination_method'](dataset_tsm, dataset_out_tsm)
+        return [dataset_out_water, dataset_out_tsm, acquisition_metadata, animation_tile_count]
+
+    try:
+        # tile is [ChunkResult, ChunkResult, metadata]. Append tiles to list of tiles to
+        # combine, compile metadata.
+        tiles = [tile for tile in chunk_results if tile[0] is not None]
+        print("Got results for a time slice, computing intermediate product..")
+        tile_metadata = {}
+        for tile in tiles:
+            add_acquisition_metadata(tile_metadata, tile[2])
+        #combine tiles
+        dataset_water = combine_chunks([tile[0] for tile in tiles]) if tiles else None
+        dataset_tsm = combine_chunks([tile[1] for tile in tiles]) if tiles else None
+
+        # time ranges are added to the analysis one at a time, while holding a lock on the query.
+        with transaction.atomic():
+            list(Query.objects.select_for_update().filter(query_id=query_id, user_id=user_id))
+            result = Result.objects.get(query_id=query_id)
+            if result.status == "ERROR":
+                return
+            if result.status == "CANCEL":
+                print("Cancelled task.")
+                shutil.rmtree(base_temp_path + query_id, ignore_errors=True)
+                queries.delete()
+                meta.delete()
+                result.delete()
+                return
+            reduction = reduce_in_order(base_temp_path + query_id, time_range_index, len(time_ranges), [dataset_water, dataset_tsm, tile_metadata], fold)
+        if reduction is None:
+            return
+        dataset_out_water, dataset_out_tsm, acquisition_metadata, animation_tile_count = reduction
 
         latitude = dataset_out_water.latitude
         longitude = dataset_out_water.longitude
@@ -296,7 +342,7 @@ def perform_tsm_analysis(query_id, user_id):
             # create images for the animation here. This is done after the main process as we need the wofs result to mask
             # the data.
             # dataset_out_tsm.variable.values[dataset_out_water.normalized_data.values < 0.8] = 0
-            for index in range(len(acquisitions)):
+            for index in range(acquisition_count):
                  nc_path = base_temp_path + query.query_id + \
                              '/' + str(index) + ".nc"
                  geotiff_path = base_temp_path + query.query_id + '/' + \
@@ -335,7 +381,7 @@ def perform_tsm_analysis(query_id, user_id):
                      os.system(cmd)
 
             with imageio.get_writer(file_path + '_animation.gif', mode='I', duration=0.10) as writer:
-                for index in range(len(acquisitions)):
+                for index in range(acquisition_count):
                     image = imageio.imread(
                         base_temp_path + query.query_id + '/' + str(index) + '.png')
                     writer.append_data(image)
@@ -369,7 +415,7 @@ def perform_tsm_analysis(query_id, user_id):
         result.average_tsm_path = result_paths[0]
         result.clear_observations_path = result_paths[1]
         result.status = "OK"
-        result.total_scenes = len(acquisitions)
+        result.total_scenes = acquisition_count
         result.save()
         print("Finished processing results")
         # all data has been processed, create results and finish up.
@@ -400,6 +446,13 @@ def generate_tsm_chunk(time_num, chunk_num, processing_options=None, query=None,
     tsm_analysis = None
     acquisition_metadata = {}
     print("Starting chunk: " + str(time_num) + " " + str(chunk_num))
+    # chunks are cached and shared between queries, except when they also write animation frames.
+    cache_key = chunk_key('tsm', cache_version, query.platform, query.product, acquisition_list, lat_range, lon_range, processing_options) if query.animated_product == "None" else None
+    cached = get_chunk(cache_key, base_temp_path + query.query_id + "/geo_chunk_" + str(time_num) + "_" + str(chunk_num), max_bytes=0)
+    if cached is not None:
+        Result.objects.filter(query_id=query.query_id).update(scenes_processed=F('scenes_processed') + 1)
+        print("Got chunk from the cache: " + str(time_num) + " " + str(chunk_num))
+        return cached
     # holds some acquisition based metadata.
     while time_index < len(acquisition_list):
         # check if the task has been cancelled. if the result obj doesn't exist anymore then return.
@@ -462,18 +515,48 @@ def generate_tsm_chunk(time_num, chunk_num, processing_options=None, query=None,
                     time_num) + '/' + str(chunk_num) + str(time_index + timeslice) + ".nc")
         time_index = time_index + processing_options['time_slices_per_iteration']
 
-    # Save this geographic chunk to disk.
+    # count the chunk as processed with a single update, as many chunks finish at once.
+    Result.objects.filter(query_id=query.query_id).update(scenes_processed=F('scenes_processed') + 1)
+
+    # Pack this geographic chunk, spilling it to disk so that only its path goes through the result backend.
     geo_path = base_temp_path + query.query_id + "/geo_chunk_" + \
         str(time_num) + "_" + str(chunk_num)
     if water_analysis is None:
         return [None, None, None]
-    water_analysis.to_netcdf(geo_path + "_water.nc")
-    tsm_analysis.to_netcdf(geo_path + "_tsm.nc")
+    water_chunk = ChunkResult(water_analysis, geo_path + "_water.npz", max_bytes=0)
+    tsm_chunk = ChunkResult(tsm_analysis, geo_path + "_tsm.npz", max_bytes=0)
     print("Done with chunk: " + str(time_num) + " " + str(chunk_num))
-    return [geo_path + "_water.nc", geo_path + "_tsm.nc", acquisition_metadata]
+    put_chunk(cache_key, [water_chunk, tsm_chunk, acquisition_metadata])
+    return [water_chunk, tsm_chunk, acquisition_metadata]
+
+# Called in place of combine_tsm_chunks if any chunk of the query raised an exception.
+@task(name="tsm_chunks_failed")
+def tsm_chunks_failed(query_id):
+    results = Result.objects.filter(query_id=query_id)
+    if results.count() > 0:
+        error_with_message(results[0], "There was an exception when handling this query.")
 
 # Errors out under specific circumstances, used to pass error msgs to user.
 # uses the result path as a message container: TODO? Change this.
+def add_acquisition_metadata(acquisition_metadata, tile_metadata):
+    """
+    Adds the acquisition date keyed metadata of a chunk to that of the chunks before it.
+
+    Args:
+        acquisition_metadata (dict): The metadata compiled so far, updated in place.
+        tile_metadata (dict): The metadata of the chunk.
+
+    Returns:
+        Returns nothing
+    """
+    for acquisition_date in tile_metadata:
+        if acquisition_date in acquisition_metadata:
+            acquisition_metadata[acquisition_date][
+                'clean_pixels'] += tile_metadata[acquisition_date]['clean_pixels']
+        else:
+            acquisition_metadata[acquisition_date] = {'clean_pixels': tile_metadata[acquisition_date][
+                'clean_pixels']}
+
 def error_with_message(result, message):
     if os.path.exists(base_temp_path + result.query_id):
         shutil.rmtree(base_temp_path + result.query_id)
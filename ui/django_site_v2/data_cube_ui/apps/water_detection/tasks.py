@@ -20,8 +20,11 @@
 # under the License.
 
 # Django specific
+from celery import chord
 from celery.decorators import task
 from celery.signals import worker_process_init, worker_process_shutdown
+from django.db import transaction
+from django.db.models import F
 from .models import Query, Result, ResultType, Metadata, AnimationType
 
 import numpy as np
@@ -37,8 +40,10 @@ from collections import OrderedDict
 from dateutil.tz import tzutc
 
 from utils.data_access_api import DataAccessApi
-from utils.dc_utilities import get_spatial_ref, save_to_geotiff, create_cfmask_clean_mask, perform_timeseries_analysis_iterative, split_task
+from utils.dc_utilities import get_spatial_ref, save_to_geotiff, create_cfmask_clean_mask, perform_timeseries_analysis_iterative, split_task, describe_task_split
 from utils.dc_water_classifier import wofs_classify
+from utils.chunk_transport import ChunkResult, combine_chunks, reduce_in_order
+from utils.result_cache import chunk_key, get_chunk, put_chunk
 
 from .utils import update_model_bounds_with_dataset
 
@@ -58,6 +63,8 @@ color_path_anim = ['~/Datacube/data_cube_ui/utils/color_scales/au_water_percenta
 
 base_result_path = '/datacube/ui_results/water_detection/'
 base_temp_path = '/datacube/ui_results_temp/'
+# bump to stop reusing cached chunks when the chunk processing changes.
+cache_version = 1
 
 def addition(dataset, dataset_intermediate):
     """
@@ -147,10 +154,15 @@ def perform_water_analysis(query_id, user_id):
 
         processing_options = processing_algorithms['wofs']
 
+        # chunks are sized from the volume of data in the query's storage units.
+        # animation frames are combined by latitude only, so they can't be split by longitude.
         lat_ranges, lon_ranges, time_ranges = split_task(resolution=product_details.resolution.values[0][1], latitude=(query.latitude_min, query.latitude_max), longitude=(
-            query.longitude_min, query.longitude_max), acquisitions=acquisitions, geo_chunk_size=processing_options['geo_chunk_size'], time_chunks=processing_options['time_chunks'], reverse_time=processing_options['reverse_time'])
+            query.longitude_min, query.longitude_max), acquisitions=acquisitions, geo_chunk_size=processing_options['geo_chunk_size'], time_chunks=processing_options['time_chunks'], reverse_time=processing_options['reverse_time'],
+            storage_units=metadata['storage_units'], bytes_per_pixel=dc.get_bytes_per_pixel(query.product), slices_per_load=processing_options['time_slices_per_iteration'],
+            split_longitude=query.animated_product == "None", snap_to_grid=True)
 
         result.total_scenes = len(time_ranges) * len(lat_ranges)
+        result.chunk_plan = describe_task_split(lat_ranges, lon_ranges, time_ranges)
 
         # Iterates through the acquisition dates with the step in acquisitions_per_iteration.
         # Uses a time range computed with the index and index+acquisitions_per_iteration.
@@ -162,133 +174,175 @@ def perform_water_analysis(query_id, user_id):
             os.mkdir(base_temp_path + query.query_id)
             os.chmod(base_temp_path + query.query_id, 0o777)
 
-        time_chunk_tasks = []
+        result.save()
+
+        # the chunks of each time range are dispatched as a chord, and combine_water_chunks is called with
+        # their results when the last one finishes. Nothing waits on the chunks, so this task's worker is free
+        # straight away, and each time range is added to the analysis as soon as those before it are done.
         print("Time chunks: " + str(len(time_ranges)))
         print("Geo chunks: " + str(len(lat_ranges)))
         # iterate over the time chunks.
         for time_range_index in range(len(time_ranges)):
             # iterate over the geographic chunks.
-            geo_chunk_tasks = []
-            for geographic_chunk_index in range(len(lat_ranges)):
-                geo_chunk_tasks.append(generate_water_chunk.delay(time_range_index, geographic_chunk_index, processing_options=processing_options, query=query, acquisition_list=time_ranges[
-                                       time_range_index], lat_range=lat_ranges[geographic_chunk_index], lon_range=lon_ranges[geographic_chunk_index]))
-            time_chunk_tasks.append(geo_chunk_tasks)
-
-        dataset_out = None
-        acquisition_metadata = {}
-        animation_tile_count = 0
-        time_range_index = 0
-        for geographic_group in time_chunk_tasks:
-            full_dataset = None
-            tiles = []
-            for t in geographic_group:
-                tile = t.get()
-                # tile is [path, metadata]. Append tiles to list of tiles for
-                # concat, compile metadata.
-                if tile == "CANCEL":
-                    print("Cancelled task.")
-                    shutil.rmtree(base_temp_path + query.query_id)
-                    query.delete()
-                    meta.delete()
-                    result.delete()
-                    return
-                if tile[0] is not None:
-                    tiles.append(tile)
-                result.scenes_processed += 1
-                result.save()
-            print("Got results for a time slice, computing intermediate product..")
-            xr_tiles = []
-            for tile in tiles:
-                tile_metadata = tile[1]
-                for acquisition_date in tile_metadata:
-                    if acquisition_date in acquisition_metadata:
-                        acquisition_metadata[acquisition_date][
-                            'clean_pixels'] += tile_metadata[acquisition_date]['clean_pixels']
-                        acquisition_metadata[acquisition_date][
-                            'water_pixels'] += tile_metadata[acquisition_date]['water_pixels']
-                    else:
-                        acquisition_metadata[acquisition_date] = {'clean_pixels': tile_metadata[acquisition_date][
-                            'clean_pixels'], 'water_pixels': tile_metadata[acquisition_date]['water_pixels']}
-                xr_tiles.append(xr.open_dataset(tile[0]))
-            #combine tiles
-            full_dataset = xr.concat(reversed(xr_tiles), dim='latitude')
-            dataset = full_dataset.load()
-
-            # combine all the intermediate products for the animation creation.
-            if query.animated_product != "None":
-                  print("Num of slices in this chunk: " +
-                        str(len(time_ranges[time_range_index])))
-                  for timeslice in range(len(time_ranges[time_range_index])):
-                      result = Result.objects.get(query_id=query.query_id)
-                      if result.status == "CANCEL":
-                          print("Cancelled task.")
-                          shutil.rmtree(base_temp_path + query.query_id)
-                          query.delete()
-                          meta.delete()
-                          result.delete()
-                          return
-                      animation_tiles = []
-                      nc_paths = []
-                      for geoslice in range(len(lat_ranges)):
-                          nc_path = base_temp_path + query.query_id + '/' + \
-                              str(time_range_index) + '/' + \
-                              str(geoslice) + str(timeslice) + ".nc"
-                          nc_paths.append(nc_path)
-                          animation_tiles.append(xr.open_dataset(nc_path))
-
-                      animated_data = xr.concat(
-                          animation_tiles, dim='latitude').load()
-                      #combine the timeslice vals with the intermediate for the true value @ that timeslice
-                      if time_range_index > 0 and query.animated_product != "scene_water":
-                          animated_data = processing_options[
-                              'chunk_combination_method'](animated_data, dataset_out)
-
-
-                      tif_path = base_temp_path + query.query_id + '/' + \
-                          str(time_range_index) + '/' + \
-                          str(animation_tile_count) + '.tif'
-                      png_path = base_temp_path + query.query_id + \
-                          '/' + str(animation_tile_count) + '.png'
-                      animation_tile_count += 1
-
-                      # get metadata needed for tif creation.
-                      geotransform = [dataset.longitude.values[0], product_details.resolution.values[0][1],
-                                      0.0, dataset.latitude.values[0], 0.0, product_details.resolution.values[0][0]]
-                      crs = str("EPSG:4326")
-
-                      save_to_geotiff(tif_path, gdal.GDT_Float64, animated_data, geotransform, crs,
-                                      x_pixels=animated_data.dims['longitude'], y_pixels=animated_data.dims['latitude'], band_order=["normalized_data", "total_data", "total_clean"] if query.animated_product != "scene_water" else None)
-                      animated_data = None
-
-                      animated_product = AnimationType.objects.get(
-                          type_id=query.animated_product)
-                      # create pngs.
-                      cmd = "gdaldem color-relief -of PNG -b " + animated_product.band_number + " " + \
-                          tif_path + " " + \
-                              color_path[
-                                  int(animated_product.band_number) - 1] + " " + png_path
-                      os.system(cmd)
-
-                      cmd = "convert -transparent \"#FFFFFF\" " + png_path + " " + png_path
-                      os.system(cmd)
-
-                      if result_type.fill is not "transparent":
-                          cmd = "convert " + png_path + " -background " + \
-                              result_type.fill + " -alpha remove " + png_path
-                          os.system(cmd)
-                      # remove all the intermediates for this timeslice
-                      for path in nc_paths:
-                          os.remove(path)
-                      os.remove(tif_path)
-                  # remove the tiff.. some of these can be >1gb, so having one
-                  # per scene is too much.
-                  shutil.rmtree(base_temp_path + query.query_id +
-                                '/' + str(time_range_index))
-
-            #add this intermediate product to the total.
-            dataset_out = processing_options[
-                'chunk_combination_method'](dataset, dataset_out)
-            time_range_index += 1
+            chunk_tasks = [generate_water_chunk.s(time_range_index, geographic_chunk_index, processing_options=processing_options, query=query, acquisition_list=time_ranges[
+                           time_range_index], lat_range=lat_ranges[geographic_chunk_index], lon_range=lon_ranges[geographic_chunk_index]) for geographic_chunk_index in range(len(lat_ranges))]
+            combine_task = combine_water_chunks.s(query_id, user_id, time_ranges=time_ranges, time_range_index=time_range_index, geo_chunk_count=len(lat_ranges), acquisition_count=len(acquisitions))
+            combine_task.link_error(water_chunks_failed.si(query_id))
+            chord(chunk_tasks)(combine_task)
+    except:
+        error_with_message(
+            result, "There was an exception when handling this query.")
+        raise
+    # end error wrapping.
+    return
+
+
+@task(name="combine_water_chunks")
+def combine_water_chunks(chunk_results, query_id, user_id, time_ranges=None, time_range_index=None, geo_chunk_count=None, acquisition_count=None):
+    """
+    Called with the results of the chunks of one time range once they have all completed. Combines them
+    into an intermediate product and adds it to the water analysis with every other time range that is
+    ready, in order, creating the animation frames for each. The call that adds the last time range uses
+    the analysis to create png/tifs to populate a result model.
+
+    Args:
+        chunk_results (list): [ChunkResult, metadata] for each geographic chunk of the time range.
+        query_id (string): The ID of the query that the chunks were generated for.
+        user_id (string): The ID of the user that requested the query be made.
+        time_ranges (list): The acquisition dates of each time range.
+        time_range_index (int): The index of the time range the chunks cover.
+        geo_chunk_count (int): The number of geographic chunks in each time range.
+        acquisition_count (int): The number of acquisitions in the query.
+
+    Returns:
+        Returns nothing
+    """
+
+    queries = Query.objects.filter(query_id=query_id, user_id=user_id)
+    results = Result.objects.filter(query_id=query_id)
+    # a chunk returns CANCEL if the query was cancelled while it ran, or nothing if the result was deleted.
+    if results.count() == 0 or "CANCEL" in chunk_results or None in chunk_results:
+        print("Cancelled task.")
+        shutil.rmtree(base_temp_path + query_id, ignore_errors=True)
+        queries.delete()
+        Metadata.objects.filter(query_id=query_id).delete()
+        results.delete()
+        return
+    query = queries[0]
+    result = results[0]
+    meta = Metadata.objects.get(query_id=query_id)
+    result_type = ResultType.objects.get(
+        satellite_id=query.platform, result_id=query.query_type)
+    product_details = dc.dc.list_products(
+    )[dc.dc.list_products().name == query.product]
+    processing_options = processing_algorithms['wofs']
+
+    def fold(index, product, reduction):
+        # adds the product of a time range to the analysis, creating its animation frames.
+        # reduction is [analysis, acquisition metadata, animation frame count].
+        dataset, tile_metadata = product
+        dataset_out, acquisition_metadata, animation_tile_count = reduction if reduction is not None else (None, {}, 0)
+        add_acquisition_metadata(acquisition_metadata, tile_metadata)
+        if dataset is None:
+            return [dataset_out, acquisition_metadata, animation_tile_count]
+
+        # combine all the intermediate products for the animation creation.
+        if query.animated_product != "None":
+            print("Num of slices in this chunk: " +
+                  str(len(time_ranges[index])))
+            for timeslice in range(len(time_ranges[index])):
+                animation_tiles = []
+                nc_paths = []
+                for geoslice in range(geo_chunk_count):
+                    nc_path = base_temp_path + query.query_id + '/' + \
+                        str(index) + '/' + \
+                        str(geoslice) + str(timeslice) + ".nc"
+                    nc_paths.append(nc_path)
+                    animation_tiles.append(xr.open_dataset(nc_path))
+
+                animated_data = xr.concat(
+                    animation_tiles, dim='latitude').load()
+                #combine the timeslice vals with the intermediate for the true value @ that timeslice
+                if index > 0 and query.animated_product != "scene_water":
+                    animated_data = processing_options[
+                        'chunk_combination_method'](animated_data, dataset_out)
+
+
+                tif_path = base_temp_path + query.query_id + '/' + \
+                    str(index) + '/' + \
+                    str(animation_tile_count) + '.tif'
+                png_path = base_temp_path + query.query_id + \
+                    '/' + str(animation_tile_count) + '.png'
+                animation_tile_count += 1
+
+                # get metadata needed for tif creation.
+                geotransform = [dataset.longitude.values[0], product_details.resolution.values[0][1],
+                                0.0, dataset.latitude.values[0], 0.0, product_details.resolution.values[0][0]]
+                crs = str("EPSG:4326")
+
+                save_to_geotiff(tif_path, gdal.GDT_Float64, animated_data, geotransform, crs,
+                                x_pixels=animated_data.dims['longitude'], y_pixels=animated_data.dims['latitude'], band_order=["normalized_data", "total_data", "total_clean"] if query.animated_product != "scene_water" else None)
+                animated_data = None
+
+                animated_product = AnimationType.objects.get(
+                    type_id=query.animated_product)
+                # create pngs.
+                cmd = "gdaldem color-relief -of PNG -b " + animated_product.band_number + " " + \
+                    tif_path + " " + \
+                        color_path[
+                            int(animated_product.band_number) - 1] + " " + png_path
+                os.system(cmd)
+
+                cmd = "convert -transparent \"#FFFFFF\" " + png_path + " " + png_path
+                os.system(cmd)
+
+                if result_type.fill is not "transparent":
+                    cmd = "convert " + png_path + " -background " + \
+                        result_type.fill + " -alpha remove " + png_path
+                    os.system(cmd)
+                # remove all the intermediates for this timeslice
+                for path in nc_paths:
+                    os.remove(path)
+                os.remove(tif_path)
+            # remove the tiff.. some of these can be >1gb, so having one
+            # per scene is too much.
+            shutil.rmtree(base_temp_path + query.query_id +
+                          '/' + str(index))
+
+
+        #add this intermediate product to the total.
+        dataset_out = processing_options[
+            'chunk_combination_method'](dataset, dataset_out)
+        return [dataset_out, acquisition_metadata, animation_tile_count]
+
+    try:
+        # tile is [ChunkResult, metadata]. Append tiles to list of tiles to
+        # combine, compile metadata.
+        tiles = [tile for tile in chunk_results if tile[0] is not None]
+        print("Got results for a time slice, computing intermediate product..")
+        tile_metadata = {}
+        for tile in tiles:
+            add_acquisition_metadata(tile_metadata, tile[1])
+        #combine tiles
+        dataset = combine_chunks([tile[0] for tile in tiles]) if tiles else None
+
+        # time ranges are added to the analysis one at a time, while holding a lock on the query.
+        with transaction.atomic():
+            list(Query.objects.select_for_update().filter(query_id=query_id, user_id=user_id))
+            result = Result.objects.get(query_id=query_id)
+            if result.status == "ERROR":
+                return
+            if result.status == "CANCEL":
+                print("Cancelled task.")
+                shutil.rmtree(base_temp_path + query_id, ignore_errors=True)
+                queries.delete()
+                meta.delete()
+                result.delete()
+                return
+            reduction = reduce_in_order(base_temp_path + query_id, time_range_index, len(time_ranges), [dataset, tile_metadata], fold)
+        if reduction is None:
+            return
+        dataset_out, acquisition_metadata, animation_tile_count = reduction
 
         latitude = dataset_out.latitude
         longitude = dataset_out.longitude
@@ -322,7 +376,7 @@ def perform_water_analysis(query_id, user_id):
         if query.animated_product != "None":
             import imageio
             with imageio.get_writer(file_path + '_water_animation.gif', mode='I', duration=1.0) as writer:
-                for index in range(len(acquisitions)):
+                for index in range(acquisition_count):
                     image = imageio.imread(
                         base_temp_path + query.query_id + '/' + str(index) + '.png')
                     writer.append_data(image)
@@ -358,7 +412,7 @@ def perform_water_analysis(query_id, user_id):
         result.water_observations_path = result_paths[1]
         result.clear_observations_path = result_paths[2]
         result.status = "OK"
-        result.total_scenes = len(acquisitions)
+        result.total_scenes = acquisition_count
         result.save()
         print("Finished processing results")
         # all data has been processed, create results and finish up.
@@ -387,6 +441,13 @@ def generate_water_chunk(time_num, chunk_num, processing_options=None, query=Non
     water_analysis = None
     acquisition_metadata = {}
     print("Starting chunk: " + str(time_num) + " " + str(chunk_num))
+    # chunks are cached and shared between queries, except when they also write animation frames.
+    cache_key = chunk_key('water_detection', cache_version, query.platform, query.product, acquisition_list, lat_range, lon_range, processing_options) if query.animated_product == "None" else None
+    cached = get_chunk(cache_key, base_temp_path + query.query_id + "/geo_chunk_" + str(time_num) + "_" + str(chunk_num), max_bytes=0)
+    if cached is not None:
+        Result.objects.filter(query_id=query.query_id).update(scenes_processed=F('scenes_processed') + 1)
+        print("Got chunk from the cache: " + str(time_num) + " " + str(chunk_num))
+        return cached
     # holds some acquisition based metadata.
     while time_index < len(acquisition_list):
         # check if the task has been cancelled. if the result obj doesn't exist anymore then return.
@@ -446,17 +507,49 @@ def generate_water_chunk(time_num, chunk_num, processing_options=None, query=Non
                     time_num) + '/' + str(chunk_num) + str(time_index + timeslice) + ".nc")
         time_index = time_index + processing_options['time_slices_per_iteration']
 
-    # Save this geographic chunk to disk.
+    # count the chunk as processed with a single update, as many chunks finish at once.
+    Result.objects.filter(query_id=query.query_id).update(scenes_processed=F('scenes_processed') + 1)
+
+    # Pack this geographic chunk, spilling it to disk so that only its path goes through the result backend.
     geo_path = base_temp_path + query.query_id + "/geo_chunk_" + \
-        str(time_num) + "_" + str(chunk_num) + ".nc"
+        str(time_num) + "_" + str(chunk_num) + ".npz"
     if water_analysis is None:
         return [None, None]
-    water_analysis.to_netcdf(geo_path)
+    chunk = ChunkResult(water_analysis, geo_path, max_bytes=0)
     print("Done with chunk: " + str(time_num) + " " + str(chunk_num))
-    return [geo_path, acquisition_metadata]
+    put_chunk(cache_key, [chunk, acquisition_metadata])
+    return [chunk, acquisition_metadata]
+
+# Called in place of combine_water_chunks if any chunk of the query raised an exception.
+@task(name="water_chunks_failed")
+def water_chunks_failed(query_id):
+    results = Result.objects.filter(query_id=query_id)
+    if results.count() > 0:
+        error_with_message(results[0], "There was an exception when handling this query.")
 
 # Errors out under specific circumstances, used to pass error msgs to user.
 # uses the result path as a message container: TODO? Change this.
+def add_acquisition_metadata(acquisition_metadata, tile_metadata):
+    """
+    Adds the acquisition date keyed metadata of a chunk to that of the chunks before it.
+
+    Args:
+        acquisition_metadata (dict): The metadata compiled so far, updated in place.
+        tile_metadata (dict): The metadata of the chunk.
+
+    Returns:
+        Returns nothing
+    """
+    for acquisition_date in tile_metadata:
+        if acquisition_date in acquisition_metadata:
+            acquisition_metadata[acquisition_date][
+                'clean_pixels'] += tile_metadata[acquisition_date]['clean_pixels']
+            acquisition_metadata[acquisition_date][
+                'water_pixels'] += tile_metadata[acquisition_date]['water_pixels']
+        else:
+            acquisition_metadata[acquisition_date] = {'clean_pixels': tile_metadata[acquisition_date][
+                'clean_pixels'], 'water_pixels': tile_metadata[acquisition_date]['water_pixels']}
+
 def error_with_message(result, message):
     if os.path.exists(base_temp_path + result.query_id):
         shutil.rmtree(base_temp_path + result.query_id)
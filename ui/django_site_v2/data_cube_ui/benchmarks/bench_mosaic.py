@@ -0,0 +1,136 @@
+# Copyright 2016 United States Government as represented by the Administrator
+# of the National Aeronautics and Space Administration. All Rights Reserved.
+#
+# Portion of this code is Copyright Geoscience Australia, Licensed under the
+# Apache License, Version 2.0 (the "License"); you may not use this file
+# except in compliance with the License. You may obtain a copy of the License
+# at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# The CEOS 2 platform is licensed under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Time the mosaic compositors in utils/dc_mosaic.py against the per-time-slice loops they replaced.
+
+Builds a synthetic stack of Landsat-like int16 bands with a random clean mask, runs each compositor and its
+loop version on copies of it, checks that they produce identical datasets and prints the times. Run it from
+the data_cube_ui directory:
+
+    PYTHONPATH=. python benchmarks/bench_mosaic.py --slices 50 --size 2000
+"""
+
+import argparse
+import timeit
+from collections import OrderedDict
+
+import numpy as np
+import xarray as xr
+
+from utils.dc_mosaic import create_mosaic_iterative, create_max_ndvi_mosaic, create_min_ndvi_mosaic
+
+BANDS = ['blue', 'green', 'red', 'nir', 'swir1', 'swir2']
+
+
+def loop_mosaic(dataset_in, clean_mask=None, no_data=-9999, intermediate_product=None):
+    for key in list(dataset_in.data_vars):
+        dataset_in[key].values[np.invert(clean_mask)] = no_data
+    if intermediate_product is not None:
+        dataset_out = intermediate_product.copy(deep=True)
+    else:
+        dataset_out = None
+    for index in reversed(range(len(clean_mask))):
+        dataset_slice = dataset_in.isel(time=index).astype("int16").drop('time')
+        if dataset_out is None:
+            dataset_out = dataset_slice.copy(deep=True)
+            dataset_out.attrs = OrderedDict()
+        else:
+            for key in list(dataset_in.data_vars):
+                dataset_out[key].values[dataset_out[key].values==-9999] = dataset_slice[key].values[dataset_out[key].values==-9999]
+    return dataset_out
+
+
+def loop_ndvi_mosaic(dataset_in, clean_mask=None, no_data=-9999, intermediate_product=None, highest=True):
+    for key in list(dataset_in.data_vars):
+        dataset_in[key].values[np.invert(clean_mask)] = no_data
+    if intermediate_product is not None:
+        dataset_out = intermediate_product.copy(deep=True)
+    else:
+        dataset_out = None
+    for timeslice in range(clean_mask.shape[0]):
+        dataset_slice = dataset_in.isel(time=timeslice).astype("float64").drop('time')
+        ndvi = (dataset_slice.nir - dataset_slice.red) / (dataset_slice.nir + dataset_slice.red)
+        ndvi.values[np.invert(clean_mask)[timeslice,::]] = -1000000000 if highest else 1000000000
+        dataset_slice['ndvi'] = ndvi
+        if dataset_out is None:
+            dataset_out = dataset_slice.copy(deep=True)
+            dataset_out.attrs = OrderedDict()
+        else:
+            better = dataset_slice.ndvi.values > dataset_out.ndvi.values if highest else dataset_slice.ndvi.values < dataset_out.ndvi.values
+            for key in list(dataset_slice.data_vars):
+                dataset_out[key].values[better] = dataset_slice[key].values[better]
+    return dataset_out
+
+
+def make_stack(slices, size):
+    rng = np.random.RandomState(0)
+    data_vars = {}
+    for band in BANDS:
+        values = rng.randint(0, 4000, size=(slices, size, size)).astype('int16')
+        values[rng.rand(slices, size, size) < 0.02] = -9999
+        data_vars[band] = (('time', 'latitude', 'longitude'), values)
+    coords = {'time': np.arange(slices), 'latitude': np.linspace(1, 0, size), 'longitude': np.linspace(0, 1, size)}
+    clean_mask = rng.rand(slices, size, size) > 0.5
+    return xr.Dataset(data_vars, coords=coords), clean_mask
+
+
+def assert_identical(expected, actual):
+    assert list(expected.data_vars) == list(actual.data_vars)
+    for key in expected.data_vars:
+        assert expected[key].dtype == actual[key].dtype
+        np.testing.assert_array_equal(expected[key].values, actual[key].values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--slices', type=int, default=50)
+    parser.add_argument('--size', type=int, default=2000, help='width/height in pixels')
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    dataset, clean_mask = make_stack(args.slices, args.size)
+    print('%d slices of %d %dx%d int16 bands' % (args.slices, len(BANDS), args.size, args.size))
+    compositors = [
+        ('most recent', loop_mosaic, create_mosaic_iterative),
+        ('max ndvi', lambda *a, **k: loop_ndvi_mosaic(*a, highest=True, **k), create_max_ndvi_mosaic),
+        ('min ndvi', lambda *a, **k: loop_ndvi_mosaic(*a, highest=False, **k), create_min_ndvi_mosaic),
+    ]
+    print('%-12s %9s %11s %8s' % ('compositor', 'loop', 'vectorised', 'speedup'))
+    for name, loop_version, compositor in compositors:
+        times = {}
+        results = {}
+        for label, function in (('loop', loop_version), ('vectorised', compositor)):
+            best = None
+            for _ in range(args.repeat):
+                # the compositors mask their input in place, so each run gets a fresh copy.
+                dataset_in = dataset.copy(deep=True)
+                start = timeit.default_timer()
+                results[label] = function(dataset_in, clean_mask=clean_mask)
+                elapsed = timeit.default_timer() - start
+                best = elapsed if best is None else min(best, elapsed)
+            times[label] = best
+        assert_identical(results['loop'], results['vectorised'])
+        print('%-12s %8.2fs %10.2fs %7.1fx' % (name, times['loop'], times['vectorised'], times['loop'] / times['vectorised']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+# Copyright 2016 United States Government as represented by the Administrator
+# of the National Aeronautics and Space Administration. All Rights Reserved.
+#
+# Portion of this code is Copyright Geoscience Australia, Licensed under the
+# Apache License, Version 2.0 (the "License"); you may not use this file
+# except in compliance with the License. You may obtain a copy of the License
+# at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# The CEOS 2 platform is licensed under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import copy
+import io
+import os
+import pickle
+
+import numpy as np
+import xarray as xr
+
+"""
+Hands the results of geographic chunk tasks back to the task that combines them.
+
+Small chunks travel through the celery result backend as npz bytes; larger ones are spilled to an npz
+file in the query's temp folder. The combining task copies each chunk into a preallocated mosaic at the
+offset of its coordinates, so only the mosaic and one chunk are in memory at a time.
+
+Chunks that are the header of a chord are always spilled, so the chord's callback receives only paths.
+Each time range is then folded into the query's result by reduce_in_order as soon as it is combined.
+"""
+
+# chunks larger than this (uncompressed) are spilled to disk rather than sent through the result backend.
+max_in_memory_bytes = 32 * 1024 * 1024
+
+
+class ChunkResult(object):
+    """
+    Description:
+      The dataset of a geographic chunk, packed to be returned from a celery task.
+    -----
+    Input:
+      dataset (xarray.Dataset) - the chunk's data
+      spill_path (str) - npz file to write the data to if it is larger than max_bytes
+      max_bytes (int) - largest dataset kept in memory. Defaults to max_in_memory_bytes.
+    """
+
+    def __init__(self, dataset, spill_path, max_bytes=None):
+        max_bytes = max_in_memory_bytes if max_bytes is None else max_bytes
+        self.dims = dict(dataset.dims)
+        self.attrs = dict(dataset.attrs)
+        self.coords = {name: (coord.dims, coord.values, dict(coord.attrs)) for name, coord in dataset.coords.items()}
+        self.variables = [(name, variable.dims, variable.dtype, dict(variable.attrs))
+                          for name, variable in dataset.data_vars.items()]
+
+        arrays = {name: variable.values for name, variable in dataset.data_vars.items()}
+        if dataset.nbytes > max_bytes:
+            self.path = spill_path
+            self.payload = None
+            with open(spill_path, 'wb') as spill_file:
+                np.savez(spill_file, **arrays)
+        else:
+            self.path = None
+            stream = io.BytesIO()
+            np.savez(stream, **arrays)
+            self.payload = stream.getvalue()
+
+    def arrays(self):
+        """
+        Description:
+          The data variables of the chunk, by name.
+        -----
+        Output:
+          arrays (dict of numpy arrays)
+        """
+        source = io.BytesIO(self.payload) if self.path is None else self.path
+        with np.load(source) as npz:
+            return {name: npz[name] for name, _, _, _ in self.variables}
+
+    def load(self):
+        """
+        Description:
+          Rebuild the chunk's dataset.
+        -----
+        Output:
+          dataset (xarray.Dataset)
+        """
+        arrays = self.arrays()
+        return xr.Dataset({name: (dims, arrays[name], attrs) for name, dims, _, attrs in self.variables},
+                          coords=self.coords, attrs=self.attrs)
+
+    def inline(self):
+        """
+        Description:
+          A copy of the chunk that holds its data in memory, reading it back from the spill file if it has one.
+        -----
+        Output:
+          chunk (ChunkResult)
+        """
+        chunk = copy.copy(self)
+        if self.path is not None:
+            with open(self.path, 'rb') as spill_file:
+                chunk.payload = spill_file.read()
+            chunk.path = None
+        return chunk
+
+    def spill(self, spill_path, max_bytes=None):
+        """
+        Description:
+          Move the chunk's data to a spill file if it is too large to keep in memory.
+        -----
+        Input:
+          spill_path (str) - npz file to write the data to if it is larger than max_bytes
+          max_bytes (int) - largest payload kept in memory. Defaults to max_in_memory_bytes.
+        """
+        max_bytes = max_in_memory_bytes if max_bytes is None else max_bytes
+        if self.payload is not None and len(self.payload) > max_bytes:
+            with open(spill_path, 'wb') as spill_file:
+                spill_file.write(self.payload)
+            self.path = spill_path
+            self.payload = None
+
+    def discard(self):
+        """
+        Description:
+          Free the chunk's data, removing its spill file if it has one.
+        """
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+        self.payload = None
+
+
+def _combined_axis(chunks, dim):
+    """
+    Description:
+      The coordinates of the combined dataset along a dimension, and where each chunk starts on it.
+    -----
+    Input:
+      chunks (list of ChunkResult) - the chunks, in any order
+      dim (str) - dimension to combine along
+    Output:
+      values (numpy array) - the combined coordinates, in the same direction as the chunks'
+      offsets (list of int) - index of each chunk's first coordinate in values
+    """
+    values = [np.asarray(chunk.coords[dim][1]) for chunk in chunks]
+    steps = np.concatenate([np.abs(np.diff(chunk_values)) for chunk_values in values])
+    # chunks loaded separately can differ in the last few bits of a shared coordinate.
+    tolerance = steps.min() / 2 if steps.size else 1e-9
+    descending = any(len(chunk_values) > 1 and chunk_values[1] < chunk_values[0] for chunk_values in values)
+
+    combined = np.sort(np.concatenate(values))
+    combined = combined[np.concatenate([[True], np.diff(combined) > tolerance])]
+    if descending:
+        combined = combined[::-1]
+    offsets = [int(np.abs(combined - chunk_values[0]).argmin()) for chunk_values in values]
+    return combined, offsets
+
+
+def combine_chunks(chunks, dims=('latitude', 'longitude'), fill_value=-9999):
+    """
+    Description:
+      Combine chunk results that may be split along several dimensions into a single dataset, copying each
+      chunk into a preallocated array at the offset of its coordinates. Chunks are discarded once copied.
+    -----
+    Input:
+      chunks (list of ChunkResult) - the chunks, in any order. All must have the same variables.
+      dims (tuple of str) - dimensions the chunks are split along
+      fill_value - value of any part of the combined area that no chunk covers
+    Output:
+      dataset_out (xarray.Dataset) - the combined dataset
+    """
+    first = chunks[0]
+    dims = [dim for dim in dims if dim in first.dims]
+    axes = {dim: _combined_axis(chunks, dim) for dim in dims}
+
+    coords = {}
+    for name, (coord_dims, values, attrs) in first.coords.items():
+        if name in axes:
+            coords[name] = (coord_dims, axes[name][0], attrs)
+        elif not any(dim in coord_dims for dim in dims):
+            coords[name] = (coord_dims, values, attrs)
+
+    # only fill the output if the chunks don't cover all of it, e.g. when an empty chunk was left out.
+    covered = sum(np.prod([chunk.dims[dim] for dim in dims]) for chunk in chunks)
+    complete = covered == np.prod([len(axes[dim][0]) for dim in dims])
+    data_vars = {}
+    for name, var_dims, dtype, attrs in first.variables:
+        shape = tuple(len(axes[var_dim][0]) if var_dim in axes else first.dims[var_dim] for var_dim in var_dims)
+        data_vars[name] = (var_dims, np.empty(shape, dtype=dtype) if complete else np.full(shape, fill_value, dtype=dtype), attrs)
+
+    for index, chunk in enumerate(chunks):
+        arrays = chunk.arrays()
+        for name, (var_dims, out, _) in data_vars.items():
+            region = tuple(slice(axes[var_dim][1][index], axes[var_dim][1][index] + chunk.dims[var_dim])
+                           if var_dim in axes else slice(None) for var_dim in var_dims)
+            out[region] = arrays[name]
+        del arrays
+        chunk.discard()
+
+    return xr.Dataset(data_vars, coords=coords, attrs=first.attrs)
+
+
+def _store(path, items):
+    """
+    Description:
+      Pickle a list to disk, spilling any xarray Datasets in it to npz files next to it.
+    """
+    stored = [ChunkResult(item, path + "_" + str(index) + ".npz", max_bytes=0)
+              if isinstance(item, xr.Dataset) else item for index, item in enumerate(items)]
+    with open(path + ".tmp", 'wb') as store_file:
+        pickle.dump(stored, store_file, protocol=pickle.HIGHEST_PROTOCOL)
+    # rename once written, so a partial list is never read back.
+    os.replace(path + ".tmp", path)
+
+
+def _restore(path):
+    """
+    Description:
+      Read back and remove a list written by _store, loading its Datasets.
+    """
+    with open(path, 'rb') as store_file:
+        stored = pickle.load(store_file)
+    os.remove(path)
+    items = []
+    for item in stored:
+        if isinstance(item, ChunkResult):
+            dataset = item.load()
+            item.discard()
+            item = dataset
+        items.append(item)
+    return items
+
+
+def reduce_in_order(folder, index, count, product, fold):
+    """
+    Description:
+      Add the product of one of a query's time ranges to the reduction of them all. Products that arrive
+      before the ones preceding them wait on disk, and every product that is next in order is folded in, so
+      the reduction sees the time ranges in order and as soon as they are ready.
+      Calls for the same query must not overlap, e.g. by holding a lock on the query's row.
+    -----
+    Input:
+      folder (str) - the query's temp folder
+      index (int) - index of the time range
+      count (int) - number of time ranges in the query
+      product (list) - the time range's product. Datasets in it are kept on disk until it is folded.
+      fold (function) - fold(index, product, reduction) returns the reduction with the product of time range
+        index added to it. reduction is None for the first time range, and its Datasets are kept on disk
+        between calls.
+    Output:
+      reduction (list) - the reduction of every time range once the last has been folded in, otherwise None
+    """
+    if not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+    _store(os.path.join(folder, "time_range_" + str(index)), product)
+
+    position_path = os.path.join(folder, "reduction_position")
+    reduction_path = os.path.join(folder, "reduction")
+    position = 0
+    if os.path.exists(position_path):
+        with open(position_path) as position_file:
+            position = int(position_file.read())
+    if not os.path.exists(os.path.join(folder, "time_range_" + str(position))):
+        return None
+
+    reduction = _restore(reduction_path) if position > 0 else None
+    while position < count and os.path.exists(os.path.join(folder, "time_range_" + str(position))):
+        reduction = fold(position, _restore(os.path.join(folder, "time_range_" + str(position))), reduction)
+        position += 1
+
+    if position == count:
+        if os.path.exists(position_path):
+            os.remove(position_path)
+        return reduction
+    _store(reduction_path, reduction)
+    with open(position_path + ".tmp", 'w') as position_file:
+        position_file.write(str(position))
+    os.replace(position_path + ".tmp", position_path)
+    return None
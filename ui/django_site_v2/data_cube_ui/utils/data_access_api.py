@@ -252,6 +252,21 @@ class DataAccessApi:
         times = set([unit[0] for unit in metadata['storage_units'].keys()])
         return sorted(times)
 
+    def get_bytes_per_pixel(self, product, measurements=None):
+        """
+        Gets the memory taken by a single pixel of a single acquisition of a product.
+
+        Args:
+            product (string): Product for which data is requested
+            measurements (list): Measurements that will be loaded. Defaults to all of the product's measurements.
+
+        Returns:
+            bytes_per_pixel (int): Sum of the sizes of the measurements' dtypes.
+        """
+
+        return sum(np.dtype(measurement['dtype']).itemsize for measurement in self.dc.list_measurements(with_pandas=False)
+                   if measurement['product'] == product and (measurements is None or measurement['measurement'] in measurements))
+
     def get_datacube_metadata(self, platform, product):
         """
         Gets some details on the cube and its contents.
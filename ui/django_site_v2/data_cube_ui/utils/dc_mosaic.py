@@ -37,6 +37,44 @@ from . import dc_utilities as utilities
 # Modified by: AHDS
 # Last modified date:
 
+def _take_time(values, selected):
+    """
+    Description:
+      The value of each pixel at the time slice selected for it, with plain advanced indexing (NumPy 1.11 has
+      no take_along_axis).
+    -----
+    Input:
+      values (numpy array) - values shaped (time, ...)
+      selected (numpy array) - index into the time axis for each pixel, shaped as values without its time axis
+    Output:
+      taken (numpy array) - the selected values, shaped as selected
+    """
+    pixels = np.ogrid[tuple(slice(size) for size in selected.shape)]
+    return values[(selected,) + tuple(pixels)]
+
+def _mask_nodata(dataset_in, clean_mask, no_data):
+    """
+    Description:
+      Sets every value of dataset_in that isn't clean to no_data, in place.
+    -----
+    Inputs:
+      dataset_in (xarray.Dataset) - dataset with a time dimension
+      clean_mask (nd numpy array with dtype boolean) - true for clean values
+      no_data (int/float) - no data pixel value
+    """
+    unclean = np.invert(clean_mask)
+    fills = {}
+    for key in list(dataset_in.data_vars):
+        values = dataset_in[key].values
+        if np.issubdtype(values.dtype, np.integer):
+            # multiplying by the mask is exact for integers, and much faster than a masked assignment.
+            if values.dtype not in fills:
+                fills[values.dtype] = unclean.astype(values.dtype) * values.dtype.type(no_data)
+            values *= clean_mask
+            values += fills[values.dtype]
+        else:
+            np.copyto(values, no_data, where=unclean, casting='unsafe')
+
 def create_mosaic_iterative(dataset_in, clean_mask=None, no_data=-9999, intermediate_product=None):
     """
     Description:
@@ -67,21 +105,25 @@ def create_mosaic_iterative(dataset_in, clean_mask=None, no_data=-9999, intermed
         dataset_in = dataset_in.drop('cf_mask')
 
     #masks data with clean_mask. all values that are clean_mask==False are set to nodata.
-    for key in list(dataset_in.data_vars):
-        dataset_in[key].values[np.invert(clean_mask)] = no_data
+    _mask_nodata(dataset_in, clean_mask, no_data)
+    if len(clean_mask) == 0:
+        return intermediate_product.copy(deep=True) if intermediate_product is not None else None
+
     if intermediate_product is not None:
         dataset_out = intermediate_product.copy(deep=True)
     else:
-        dataset_out = None
-    for index in reversed(range(len(clean_mask))):
-        dataset_slice = dataset_in.isel(time=index).astype("int16").drop('time')
-        if dataset_out is None:
-            dataset_out = dataset_slice.copy(deep=True)
-            #clear out the params as they can't be written to nc.
-            dataset_out.attrs = OrderedDict()
-        else:
-            for key in list(dataset_in.data_vars):
-                dataset_out[key].values[dataset_out[key].values==-9999] = dataset_slice[key].values[dataset_out[key].values==-9999]
+        dataset_out = dataset_in.isel(time=-1).astype("int16").drop('time')
+        #clear out the params as they can't be written to nc.
+        dataset_out.attrs = OrderedDict()
+    for key in list(dataset_in.data_vars):
+        # the most recent value of each pixel that isn't nodata, found with one argmax over the reversed time axis.
+        values = dataset_in[key].values.astype("int16", copy=False)
+        valid = values != -9999
+        latest = len(values) - 1 - np.argmax(valid[::-1], axis=0)
+        mosaic = _take_time(values, latest)
+        out = dataset_out[key].values
+        missing = out == -9999
+        out[missing] = mosaic[missing]
     return dataset_out
 
 def create_median_mosaic(dataset_in, clean_mask=None, no_data=-9999, intermediate_product=None):
@@ -117,6 +159,26 @@ def create_median_mosaic(dataset_in, clean_mask=None, no_data=-9999, intermediat
     return dataset_out.astype('int16')
 
 
+def _ndvi(dataset_in, clean_mask, unclean_value):
+    """
+    Description:
+      Computes the ndvi of every time slice in float64, set to unclean_value where the pixel isn't clean.
+    -----
+    Inputs:
+      dataset_in (xarray.Dataset) - dataset with nir and red variables, with a time dimension
+      clean_mask (nd numpy array with dtype boolean) - true for clean values
+      unclean_value (float) - value of the ndvi for pixels that aren't clean
+    Output:
+      ndvi (nd numpy array) - ndvi with the same shape as clean_mask
+    """
+    nir = dataset_in.nir.values
+    red = dataset_in.red.values
+    ndvi = np.subtract(nir, red, dtype="float64")
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(ndvi, np.add(nir, red, dtype="float64"), out=ndvi)
+    np.copyto(ndvi, unclean_value, where=np.invert(clean_mask))
+    return ndvi
+
 def create_max_ndvi_mosaic(dataset_in, clean_mask=None, no_data=-9999, intermediate_product=None):
     """
 	Description:
@@ -133,26 +195,35 @@ def create_max_ndvi_mosaic(dataset_in, clean_mask=None, no_data=-9999, intermedi
         clean_mask = utilities.create_cfmask_clean_mask(cfmask)
         dataset_in = dataset_in.drop('cf_mask')
 
-    for key in list(dataset_in.data_vars):
-        dataset_in[key].values[np.invert(clean_mask)] = no_data
+    _mask_nodata(dataset_in, clean_mask, no_data)
+    if clean_mask.shape[0] == 0:
+        return intermediate_product.copy(deep=True) if intermediate_product is not None else None
 
-    if intermediate_product is not None:
-        dataset_out = intermediate_product.copy(deep=True)
+    ndvi = _ndvi(dataset_in, clean_mask, -1000000000)
+    # the first slice with the highest ndvi. Comparisons with nan are false, so a nan ndvi in the first slice
+    # is kept and later nans are skipped.
+    nan = np.isnan(ndvi)
+    np.copyto(ndvi, -np.inf, where=nan)
+    selected = np.argmax(ndvi, axis=0)
+    if intermediate_product is None:
+        selected[nan[0]] = 0
+    best_ndvi = _take_time(ndvi, selected)
+    best_ndvi[_take_time(nan, selected)] = np.nan
+    del ndvi, nan
+
+    if intermediate_product is None:
+        dataset_out = dataset_in.isel(time=0).drop('time').astype("float64")
+        #clear out the params as they can't be written to nc.
+        dataset_out.attrs = OrderedDict()
+        for key in list(dataset_in.data_vars):
+            dataset_out[key].values[...] = _take_time(dataset_in[key].values, selected)
+        dataset_out['ndvi'] = (dataset_out[list(dataset_in.data_vars)[0]].dims, best_ndvi)
     else:
-        dataset_out = None
-
-    for timeslice in range(clean_mask.shape[0]):
-        dataset_slice = dataset_in.isel(time=timeslice).astype("float64").drop('time')
-        ndvi = (dataset_slice.nir - dataset_slice.red) / (dataset_slice.nir + dataset_slice.red)
-        ndvi.values[np.invert(clean_mask)[timeslice,::]] = -1000000000
-        dataset_slice['ndvi'] = ndvi
-        if dataset_out is None:
-            dataset_out = dataset_slice.copy(deep=True)
-            #clear out the params as they can't be written to nc.
-            dataset_out.attrs = OrderedDict()
-        else:
-            for key in list(dataset_slice.data_vars):
-                dataset_out[key].values[dataset_slice.ndvi.values > dataset_out.ndvi.values] = dataset_slice[key].values[dataset_slice.ndvi.values > dataset_out.ndvi.values]
+        dataset_out = intermediate_product.copy(deep=True)
+        replace = best_ndvi > dataset_out.ndvi.values
+        for key in list(dataset_in.data_vars):
+            dataset_out[key].values[replace] = _take_time(dataset_in[key].values, selected)[replace]
+        dataset_out.ndvi.values[replace] = best_ndvi[replace]
     return dataset_out
 
 def create_min_ndvi_mosaic(dataset_in, clean_mask=None, no_data=-9999, intermediate_product=None):
@@ -171,24 +242,33 @@ def create_min_ndvi_mosaic(dataset_in, clean_mask=None, no_data=-9999, intermedi
         clean_mask = utilities.create_cfmask_clean_mask(cfmask)
         dataset_in = dataset_in.drop('cf_mask')
 
-    for key in list(dataset_in.data_vars):
-        dataset_in[key].values[np.invert(clean_mask)] = no_data
+    _mask_nodata(dataset_in, clean_mask, no_data)
+    if clean_mask.shape[0] == 0:
+        return intermediate_product.copy(deep=True) if intermediate_product is not None else None
 
-    if intermediate_product is not None:
-        dataset_out = intermediate_product.copy(deep=True)
+    ndvi = _ndvi(dataset_in, clean_mask, 1000000000)
+    # the first slice with the lowest ndvi. Comparisons with nan are false, so a nan ndvi in the first slice
+    # is kept and later nans are skipped.
+    nan = np.isnan(ndvi)
+    np.copyto(ndvi, np.inf, where=nan)
+    selected = np.argmin(ndvi, axis=0)
+    if intermediate_product is None:
+        selected[nan[0]] = 0
+    best_ndvi = _take_time(ndvi, selected)
+    best_ndvi[_take_time(nan, selected)] = np.nan
+    del ndvi, nan
+
+    if intermediate_product is None:
+        dataset_out = dataset_in.isel(time=0).drop('time').astype("float64")
+        #clear out the params as they can't be written to nc.
+        dataset_out.attrs = OrderedDict()
+        for key in list(dataset_in.data_vars):
+            dataset_out[key].values[...] = _take_time(dataset_in[key].values, selected)
+        dataset_out['ndvi'] = (dataset_out[list(dataset_in.data_vars)[0]].dims, best_ndvi)
     else:
-        dataset_out = None
-
-    for timeslice in range(clean_mask.shape[0]):
-        dataset_slice = dataset_in.isel(time=timeslice).astype("float64").drop('time')
-        ndvi = (dataset_slice.nir - dataset_slice.red) / (dataset_slice.nir + dataset_slice.red)
-        ndvi.values[np.invert(clean_mask)[timeslice,::]] = 1000000000
-        dataset_slice['ndvi'] = ndvi
-        if dataset_out is None:
-            dataset_out = dataset_slice.copy(deep=True)
-            #clear out the params as they can't be written to nc.
-            dataset_out.attrs = OrderedDict()
-        else:
-            for key in list(dataset_slice.data_vars):
-                dataset_out[key].values[dataset_slice.ndvi.values < dataset_out.ndvi.values] = dataset_slice[key].values[dataset_slice.ndvi.values < dataset_out.ndvi.values]
+        dataset_out = intermediate_product.copy(deep=True)
+        replace = best_ndvi < dataset_out.ndvi.values
+        for key in list(dataset_in.data_vars):
+            dataset_out[key].values[replace] = _take_time(dataset_in[key].values, selected)[replace]
+        dataset_out.ndvi.values[replace] = best_ndvi[replace]
     return dataset_out
@@ -63,12 +63,141 @@ def create_cfmask_clean_mask(cfmask):
                             cfmask.values.shape)
     return clean_mask
 
+# largest amount of data a chunk should load at once when split_task plans chunks from the storage units.
+max_chunk_bytes = 1024 * 1024 * 1024
+# planned chunks are never split below this many pixels a side.
+min_chunk_pixels = 256
+# chunks snapped to the grid are cells with edges at multiples of this many degrees, halved until they fit.
+grid_cell_degrees = 1.0
+# time ranges snapped to the grid are periods of this many days, doubled until there are few enough.
+min_time_bucket_days = 1
+
+def estimate_chunk_bytes(storage_units, lat_edges, lon_edges, resolution, bytes_per_pixel, time_chunks=None, slices_per_load=None):
+    """
+    Description:
+      Estimate the data each cell of a lat/lon grid loads at once, from the footprints and acquisition counts
+      of the storage units that cover it.
+    -----
+    Input:
+      storage_units (dict) - storage units of the query, as returned by DataAccessApi.get_scene_metadata
+      lat_edges, lon_edges (numpy arrays) - ascending edges of the grid cells
+      resolution (float) - pixel size in degrees
+      bytes_per_pixel (int) - bytes of every measurement loaded for one pixel of one acquisition
+      time_chunks (int) - number of time chunks the acquisitions are split into
+      slices_per_load (int) - most acquisitions a chunk loads at once
+    Output:
+      chunk_bytes (numpy array) - estimated bytes for each cell, shaped (len(lat_edges)-1, len(lon_edges)-1)
+    """
+    # storage units with the same footprint hold different acquisitions of the same area.
+    footprints = collections.defaultdict(int)
+    for unit in storage_units.values():
+        footprints[(unit['storage_min'][1], unit['storage_max'][1], unit['storage_min'][2], unit['storage_max'][2])] += unit['storage_shape'][0]
+    if not footprints:
+        return np.zeros((len(lat_edges) - 1, len(lon_edges) - 1))
+    bounds = np.array(list(footprints.keys()), dtype='float64')
+    acquisitions = np.array(list(footprints.values()), dtype='float64')
+    if time_chunks is not None:
+        acquisitions = np.ceil(acquisitions / time_chunks)
+    if slices_per_load is not None:
+        acquisitions = np.minimum(acquisitions, slices_per_load)
+
+    # pixels of each footprint that fall in each row/column of the grid.
+    lat_pixels = np.clip(np.minimum(lat_edges[1:, None], bounds[None, :, 1]) - np.maximum(lat_edges[:-1, None], bounds[None, :, 0]), 0, None) / resolution
+    lon_pixels = np.clip(np.minimum(lon_edges[1:, None], bounds[None, :, 3]) - np.maximum(lon_edges[:-1, None], bounds[None, :, 2]), 0, None) / resolution
+    return lat_pixels.dot((lon_pixels * acquisitions * bytes_per_pixel).T)
+
+def grid_edges(bounds, cell):
+    """
+    Description:
+      Edges that split a range at every multiple of cell, so the pieces of overlapping ranges match wherever
+      both cover a whole cell.
+    -----
+    Input:
+      bounds (tuple) - (lower, upper) bounds of the range
+      cell (float) - size of a grid cell
+    Output:
+      edges (numpy array) - ascending edges of the pieces, starting at lower and ending at upper
+    """
+    inner = [index * cell for index in range(int(math.floor(bounds[0] / cell)) + 1, int(math.ceil(bounds[1] / cell)))]
+    return np.array([bounds[0]] + inner + [bounds[1]], dtype='float64')
+
+def plan_geographic_chunks(latitude, longitude, resolution, storage_units, bytes_per_pixel, max_bytes=None, time_chunks=None, slices_per_load=None, split_longitude=True,
+                           snap_to_grid=False):
+    """
+    Description:
+      Split an area into a grid of chunks that each load no more than max_bytes at once. The side of the grid
+      with the most pixels per chunk is halved until the densest chunk fits, so small or sparse areas stay in
+      a single chunk. Snapped to the grid, the chunks are instead the cells of an absolute grid that are in the
+      area, halved from grid_cell_degrees until the densest fits, so overlapping queries share chunks.
+    -----
+    Input:
+      latitude, longitude (tuples) - (lower, upper) bounds of the area
+      resolution (float) - pixel size in degrees
+      storage_units (dict) - storage units of the query, as returned by DataAccessApi.get_scene_metadata
+      bytes_per_pixel (int) - bytes of every measurement loaded for one pixel of one acquisition
+      max_bytes (int) - target size of a chunk. Defaults to max_chunk_bytes.
+      time_chunks (int) - number of time chunks the acquisitions are split into
+      slices_per_load (int) - most acquisitions a chunk loads at once
+      split_longitude (bool) - split the area by longitude as well as latitude
+      snap_to_grid (bool) - split the area at the edges of an absolute grid
+    Output:
+      lat_ranges, lon_ranges (lists of tuples) - bounds of each chunk, by rows of latitude
+      chunk_bytes (float) - estimated size of the largest chunk
+    """
+    max_bytes = max_chunk_bytes if max_bytes is None else max_bytes
+    resolution = abs(resolution)
+    lat_count = 1
+    lon_count = 1
+    cell = grid_cell_degrees
+    while True:
+        if snap_to_grid:
+            lat_edges = grid_edges(latitude, cell)
+            lon_edges = grid_edges(longitude, cell) if split_longitude else np.array(longitude, dtype='float64')
+        else:
+            lat_edges = np.linspace(latitude[0], latitude[1], lat_count + 1)
+            lon_edges = np.linspace(longitude[0], longitude[1], lon_count + 1)
+        chunk_bytes = estimate_chunk_bytes(storage_units, lat_edges, lon_edges, resolution, bytes_per_pixel,
+                                           time_chunks=time_chunks, slices_per_load=slices_per_load).max()
+        if chunk_bytes <= max_bytes:
+            break
+        if snap_to_grid:
+            if cell / resolution < 2 * min_chunk_pixels:
+                break
+            cell /= 2
+            continue
+        lat_pixels = (latitude[1] - latitude[0]) / lat_count / resolution
+        lon_pixels = (longitude[1] - longitude[0]) / lon_count / resolution if split_longitude else 0
+        if max(lat_pixels, lon_pixels) < 2 * min_chunk_pixels:
+            break
+        if lat_pixels >= lon_pixels:
+            lat_count *= 2
+        else:
+            lon_count *= 2
+
+    lat_count = len(lat_edges) - 1
+    lon_count = len(lon_edges) - 1
+    lat_ranges = []
+    lon_ranges = []
+    for i in range(lat_count):
+        # adjacent chunks shouldn't both load the pixel on their shared edge.
+        upper_lat = lat_edges[i + 1] - (resolution if i != lat_count - 1 else 0)
+        for j in range(lon_count):
+            upper_lon = lon_edges[j + 1] - (resolution if j != lon_count - 1 else 0)
+            lat_ranges.append((float(lat_edges[i]), float(upper_lat)))
+            lon_ranges.append((float(lon_edges[j]), float(upper_lon)))
+    print("Planned " + str(lat_count) + "x" + str(lon_count) + " geographic chunks of up to " + str(int(chunk_bytes / 1024 / 1024)) + "MB")
+    return lat_ranges, lon_ranges, chunk_bytes
+
 # split a task (sq area, time) into geographical and time chunks based on params.
 # latitude and longitude are a tuple containing (lower, upper)
 # acquisitions are the list of all acquisitions
-# geo chunk size is the square area per chunk, time chunks is the number of time chunks.
+# given the query's storage units and the bytes per pixel, the area is split with plan_geographic_chunks to
+# load no more than max_bytes per chunk. Otherwise, geo chunk size is the square area per chunk.
+# time chunks is the number of time chunks.
+# snap_to_grid splits the area and the acquisitions at fixed edges, so overlapping queries share chunks.
 # returns list of ranges that make up the full lat/lon ranges, list of lists containing acquisition dates.
-def split_task(resolution=0.000269, latitude=None, longitude=None, acquisitions=None, geo_chunk_size=None, time_chunks=None, reverse_time=False):
+def split_task(resolution=0.000269, latitude=None, longitude=None, acquisitions=None, geo_chunk_size=None, time_chunks=None, reverse_time=False,
+               storage_units=None, bytes_per_pixel=None, max_bytes=None, slices_per_load=None, split_longitude=True, snap_to_grid=False):
     square_area = (longitude[1] - longitude[0]) * (latitude[1] - latitude[0])
     print("Square area: ", square_area)
     #split the task into n geo chunks based on sq area and chunk size.
@@ -76,7 +205,11 @@ def split_task(resolution=0.000269, latitude=None, longitude=None, acquisitions=
     lon_ranges = []
     lat_ranges = []
     if latitude is not None and longitude is not None:
-        if geo_chunk_size is not None and square_area > geo_chunk_size:
+        if storage_units is not None and bytes_per_pixel is not None:
+            lat_ranges, lon_ranges, _ = plan_geographic_chunks(latitude, longitude, resolution, storage_units, bytes_per_pixel, max_bytes=max_bytes,
+                                                               time_chunks=time_chunks, slices_per_load=slices_per_load, split_longitude=split_longitude,
+                                                               snap_to_grid=snap_to_grid)
+        elif geo_chunk_size is not None and square_area > geo_chunk_size:
             geographic_chunks = math.ceil(square_area / geo_chunk_size)
             lat_range_size = (latitude[1] - latitude[0]) / geographic_chunks
             # longitude/x
@@ -97,12 +230,51 @@ def split_task(resolution=0.000269, latitude=None, longitude=None, acquisitions=
     if reverse_time:
         acquisitions.reverse()
     time_ranges = [acquisitions]
-    if time_chunks is not None:
+    if time_chunks is not None and snap_to_grid:
+        time_ranges = bucket_acquisitions(acquisitions, time_chunks)
+    elif time_chunks is not None:
         time_chunk_size = math.ceil(len(acquisitions) / time_chunks)
         time_ranges = list(chunks(acquisitions, time_chunk_size))
 
     return lat_ranges, lon_ranges, time_ranges
 
+def bucket_acquisitions(acquisitions, time_chunks):
+    """
+    Description:
+      Split acquisitions into periods of a fixed number of days, counted from the start of the calendar, so
+      overlapping queries share the periods that both cover in full. The period is doubled from
+      min_time_bucket_days until the acquisitions fall in no more than time_chunks of them.
+    -----
+    Input:
+      acquisitions (list of datetimes) - the acquisitions, in the order they are processed
+      time_chunks (int) - most time ranges to split the acquisitions into
+    Output:
+      time_ranges (list of lists) - acquisitions of each period, in the same order
+    """
+    days = min_time_bucket_days
+    while True:
+        buckets = collections.OrderedDict()
+        for acquisition in acquisitions:
+            buckets.setdefault(acquisition.toordinal() // days, []).append(acquisition)
+        if len(buckets) <= time_chunks:
+            return list(buckets.values())
+        days *= 2
+
+def describe_task_split(lat_ranges, lon_ranges, time_ranges):
+    """
+    Description:
+      Summarise how split_task split a query, for reporting on its result.
+    -----
+    Input:
+      lat_ranges, lon_ranges, time_ranges - as returned by split_task
+    Output:
+      plan (str) - e.g. "8 geographic chunks (4 by latitude, 2 by longitude) x 5 time chunks"
+    """
+    lat_count = len(set(lat_ranges))
+    lon_count = len(set(lon_ranges))
+    return str(len(lat_ranges)) + " geographic chunks (" + str(lat_count) + " by latitude, " + str(lon_count) + \
+        " by longitude) x " + str(len(time_ranges)) + " time chunks"
+
 def get_spatial_ref(crs):
     """
     Description:
@@ -0,0 +1,158 @@
+# Copyright 2016 United States Government as represented by the Administrator
+# of the National Aeronautics and Space Administration. All Rights Reserved.
+#
+# Portion of this code is Copyright Geoscience Australia, Licensed under the
+# Apache License, Version 2.0 (the "License"); you may not use this file
+# except in compliance with the License. You may obtain a copy of the License
+# at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# The CEOS 2 platform is licensed under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+from utils.chunk_transport import ChunkResult
+
+"""
+A cache of geographic chunk results shared by every user and app.
+
+Chunks are stored under a hash of everything that determines their content - the app, its cache version,
+the platform/product, the acquisitions, the lat/lon ranges and the processing options - so any query that
+splits into a chunk that has been computed before reuses it rather than loading and processing the data
+again. split_task snaps chunks to a fixed grid and fixed time periods, so overlapping queries split into
+the same chunks wherever they overlap. The least recently used chunks are removed once the cache grows
+beyond max_cache_bytes.
+"""
+
+cache_path = '/datacube/ui_results/chunk_cache/'
+max_cache_bytes = 50 * 1024 * 1024 * 1024
+
+
+def _canonical(value):
+    """
+    Description:
+      Convert a chunk parameter to a json-serializable value that is the same for equal parameters.
+    """
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if callable(value):
+        return value.__module__ + '.' + value.__name__
+    if isinstance(value, float):
+        # bounds computed by split_task differ in the last few bits between runs.
+        return repr(round(value, 10))
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    return str(value)
+
+
+def chunk_key(*params):
+    """
+    Description:
+      The cache key of a chunk.
+    -----
+    Input:
+      params - everything that determines the chunk's content, e.g. the app name, its cache version, the
+        platform and product, the acquisition list, lat/lon ranges and processing options.
+    Output:
+      key (str) - hex digest identifying the chunk
+    """
+    return hashlib.sha256(json.dumps(_canonical(params), sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def get_chunk(key, spill_path, max_bytes=None):
+    """
+    Description:
+      Get a chunk task's result from the cache, marking it as recently used.
+    -----
+    Input:
+      key (str) - the chunk's key from chunk_key, or None to skip the cache
+      spill_path (str) - prefix of the npz files that large ChunkResults are spilled to
+      max_bytes (int) - largest ChunkResult kept in memory. Defaults to max_in_memory_bytes.
+    Output:
+      chunk (list) - the chunk task's result, or None if it isn't cached
+    """
+    if key is None:
+        return None
+    path = os.path.join(cache_path, key)
+    try:
+        with open(path, 'rb') as cache_file:
+            chunk = pickle.load(cache_file)
+        os.utime(path, None)
+        for index, item in enumerate(chunk):
+            if isinstance(item, ChunkResult):
+                item.spill(spill_path + "_" + str(index) + ".npz", max_bytes=max_bytes)
+    except (IOError, OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        # chunks pickled by an older version of the code may refer to classes that have moved or changed.
+        return None
+    return chunk
+
+
+def put_chunk(key, chunk):
+    """
+    Description:
+      Store a chunk task's result in the cache, then evict the least recently used chunks if the cache has
+      grown too large.
+    -----
+    Input:
+      key (str) - the chunk's key from chunk_key, or None to skip the cache
+      chunk (list) - the chunk task's result. ChunkResults are stored with their data, including any
+        that has been spilled to disk.
+    """
+    if key is None:
+        return
+    if not os.path.exists(cache_path):
+        os.makedirs(cache_path, exist_ok=True)
+    stored = [item.inline() if isinstance(item, ChunkResult) else item for item in chunk]
+    # write to a temp file and rename it, so that readers never see a partial chunk.
+    handle, temp_path = tempfile.mkstemp(dir=cache_path, suffix='.tmp')
+    with os.fdopen(handle, 'wb') as cache_file:
+        pickle.dump(stored, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, os.path.join(cache_path, key))
+    evict()
+
+
+def evict(max_bytes=None):
+    """
+    Description:
+      Remove the least recently used chunks until the cache is no larger than max_bytes.
+    -----
+    Input:
+      max_bytes (int) - size to reduce the cache to. Defaults to max_cache_bytes.
+    """
+    max_bytes = max_cache_bytes if max_bytes is None else max_bytes
+    entries = []
+    for name in os.listdir(cache_path):
+        if name.endswith('.tmp'):
+            continue
+        try:
+            stat = os.stat(os.path.join(cache_path, name))
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_path, name))
+        except OSError:
+            pass
+        total -= size